@@ -10,34 +10,10 @@ from tqdm import tqdm
 from urllib.parse import urlparse
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
-from common import open_xz_or_gzip_or_plain
-
-oparser = argparse.ArgumentParser(description="usage: %prog [options]\nTool that processes a .ridx (reverse index) "
-                                              "file (either from a file or from the standard input) and produces a "
-                                              "list of aligned documents. If two ridx files are provided, "
-                                              "a bidirectional alignment is performed between them.")
-oparser.add_argument('--lang1', dest='lang1', help='')
-oparser.add_argument('--lang2', dest='lang2', help='')
-oparser.add_argument('--text1', dest='text1', help='File produced by bitextor-warc2preprocess containing the text of '
-                     'all the records in the WARC file encoded as base 64 (each line '
-                     'corresponds to a record)', required=True)
-oparser.add_argument('--text2', dest='text2', help='File produced by bitextor-warc2preprocess containing the text of '
-                     'all the records in the WARC file encoded as base 64 (each line '
-                     'corresponds to a record)', required=True)
-oparser.add_argument('--url1', dest='url1', help='File produced by bitextor-warc2preprocess containing the url of each '
-                     'of the records in the WARC file encoded as base 64 (each line '
-                     'corresponds to a record)', required=True)
-oparser.add_argument('--url2', dest='url2', help='File produced by bitextor-warc2preprocess containing the url of each '
-                     'of the records in the WARC file encoded as base 64 (each line '
-                     'corresponds to a record)', required=True)
-oparser.add_argument("-n", "--num_candidates", help="Amount of alignment candidates taken into account for every file "
-                                                    "when performing bidirectional document alignment. This parameter "
-                                                    "is set by default to 1, which means that only documents being "
-                                                    "mutualy the best alignment option will be aligned. Note that "
-                                                    "this option is only used when two ridx files are provided",
-                     type=int, dest="candidate_num", default=1)
-
-options = oparser.parse_args()
+from common import open_xz_or_gzip_or_plain, IndexedDocumentReader, FramedWriter, document_bytes, encode_document
+
+re_sla2 = re.compile("/{2,}")
+re_del = re.compile("[-_~?]")
 
 
 def more_codes(lang):
@@ -48,6 +24,10 @@ def more_codes(lang):
     return (lang,)
 
 
+def lang_regex(lang):
+    return re.compile(r"(?<=[^a-z])({:s})(?=[^a-z])".format("|".join(more_codes(lang))), flags=re.IGNORECASE)
+
+
 def read(path):
     ret = []
     with open_xz_or_gzip_or_plain(path) as reader:
@@ -57,42 +37,121 @@ def read(path):
     return ret
 
 
-l1_urls = read(options.url1)
-l2_urls = read(options.url2)
-l1_texts = read(options.text1)
-l2_texts = read(options.text2)
+def path_query(url):
+    parsed = urlparse(url)
+    return parsed.path + parsed.query + "#"
 
 
-re_l1_lang = re.compile(r"(?<=[^a-z])({:s})(?=[^a-z])".format("|".join(more_codes(options.lang1))), flags=re.IGNORECASE)
-re_l2_lang = re.compile(r"(?<=[^a-z])({:s})(?=[^a-z])".format("|".join(more_codes(options.lang2))), flags=re.IGNORECASE)
-re_sla2 = re.compile("/{2,}")
-re_del = re.compile("[-_~?]")
-
+def canonical_key(url_path_query, re_lang):
+    # language-neutral form of the path and query of a URL
+    return re_del.sub("", re_sla2.sub("/", re_lang.sub("", url_path_query)))
 
-def match_url(l1_url, l2_url):
-    l1_parsed = urlparse(l1_url)
-    l1_path_query = l1_parsed.path + l1_parsed.query + "#"
 
-    l2_parsed = urlparse(l2_url)
-    l2_path_query = l2_parsed.path + l2_parsed.query + "#"
+def match_url(l1_url, l2_url, re_l1_lang, re_l2_lang):
+    l1_path_query = path_query(l1_url)
+    l2_path_query = path_query(l2_url)
 
     # Allow same URLs to be aligned
-    if l1_path_query == l2_path_query or re_del.sub("", re_sla2.sub("/", re_l1_lang.sub("", l1_path_query))) == re_del.sub("", re_sla2.sub("/", re_l2_lang.sub("", l2_path_query))):
+    if l1_path_query == l2_path_query or canonical_key(l1_path_query, re_l1_lang) == canonical_key(l2_path_query, re_l2_lang):
         return True
     else:
         return False
 
 
-matches = []
-for i in tqdm(range(len(l1_urls))):
-    url1 = l1_urls[i]
-    for j, url2 in enumerate(l2_urls):
-        if match_url(url1, url2):
-            # The index starts at 1 for use with the -n option of sed
-            matches.append((i+1, j+1))
-            break
+def align_scan(l1_urls, l2_urls, lang1, lang2):
+    re_l1_lang = lang_regex(lang1)
+    re_l2_lang = lang_regex(lang2)
+    matches = []
+    for i in tqdm(range(len(l1_urls))):
+        url1 = l1_urls[i]
+        for j, url2 in enumerate(l2_urls):
+            if match_url(url1, url2, re_l1_lang, re_l2_lang):
+                # The index starts at 1 for use with the -n option of sed
+                matches.append((i+1, j+1))
+                break
+    return matches
+
+
+def align_hash(l1_urls, l2_urls, lang1, lang2):
+    # Same result as align_scan: every lang1 URL is aligned to the first lang2 URL whose path and query are
+    # equal to its own, or whose canonical key is equal to its canonical key. Both keys are computed once per
+    # URL and looked up in dictionaries that keep the first (lowest) lang2 index of every key, so colliding
+    # keys resolve to the same document the scan would have found first.
+    re_l1_lang = lang_regex(lang1)
+    re_l2_lang = lang_regex(lang2)
+
+    l2_by_path_query = {}
+    l2_by_key = {}
+    for j, url2 in enumerate(l2_urls, 1):
+        l2_path_query = path_query(url2)
+        l2_by_path_query.setdefault(l2_path_query, j)
+        l2_by_key.setdefault(canonical_key(l2_path_query, re_l2_lang), j)
+
+    matches = []
+    for i, url1 in enumerate(tqdm(l1_urls), 1):
+        l1_path_query = path_query(url1)
+        candidates = [j for j in (l2_by_path_query.get(l1_path_query),
+                                  l2_by_key.get(canonical_key(l1_path_query, re_l1_lang))) if j is not None]
+        if candidates:
+            matches.append((i, min(candidates)))
+    return matches
+
+
+def main():
+    oparser = argparse.ArgumentParser(description="usage: %prog [options]\nTool that processes a .ridx (reverse index) "
+                                                  "file (either from a file or from the standard input) and produces a "
+                                                  "list of aligned documents. If two ridx files are provided, "
+                                                  "a bidirectional alignment is performed between them.")
+    oparser.add_argument('--lang1', dest='lang1', help='')
+    oparser.add_argument('--lang2', dest='lang2', help='')
+    oparser.add_argument('--text1', dest='text1', help='File produced by bitextor-warc2preprocess containing the text of '
+                         'all the records in the WARC file encoded as base 64 (each line '
+                         'corresponds to a record)', required=True)
+    oparser.add_argument('--text2', dest='text2', help='File produced by bitextor-warc2preprocess containing the text of '
+                         'all the records in the WARC file encoded as base 64 (each line '
+                         'corresponds to a record)', required=True)
+    oparser.add_argument('--url1', dest='url1', help='File produced by bitextor-warc2preprocess containing the url of each '
+                         'of the records in the WARC file encoded as base 64 (each line '
+                         'corresponds to a record)', required=True)
+    oparser.add_argument('--url2', dest='url2', help='File produced by bitextor-warc2preprocess containing the url of each '
+                         'of the records in the WARC file encoded as base 64 (each line '
+                         'corresponds to a record)', required=True)
+    oparser.add_argument("-n", "--num_candidates", help="Amount of alignment candidates taken into account for every file "
+                                                        "when performing bidirectional document alignment. This parameter "
+                                                        "is set by default to 1, which means that only documents being "
+                                                        "mutualy the best alignment option will be aligned. Note that "
+                                                        "this option is only used when two ridx files are provided",
+                         type=int, dest="candidate_num", default=1)
+    oparser.add_argument("--mode", dest="mode", choices=["hash", "scan"], default="hash",
+                         help="'hash' joins both URL lists through their canonical keys, 'scan' compares every pair "
+                              "of URLs. Both produce the same alignments")
+    oparser.add_argument("--framed", dest="framed", action="store_true", default=False,
+                         help="Write the aligned documents as framed records (index1, index2, text1, text2) instead of "
+                              "tab-separated lines with base64 texts. The text files can be in either format")
+
+    options = oparser.parse_args()
+
+    l1_urls = read(options.url1)
+    l2_urls = read(options.url2)
+    # texts are only fetched for the aligned documents
+    l1_texts = IndexedDocumentReader(options.text1)
+    l2_texts = IndexedDocumentReader(options.text2)
+
+    if options.mode == "scan":
+        matches = align_scan(l1_urls, l2_urls, options.lang1, options.lang2)
+    else:
+        matches = align_hash(l1_urls, l2_urls, options.lang1, options.lang2)
+
+    if options.framed:
+        writer = FramedWriter(sys.stdout.buffer)
+        for i, j in matches:
+            writer.write((str(i), str(j), document_bytes(l1_texts[i-1]), document_bytes(l2_texts[j-1])))
+        writer.flush()
+    else:
+        for m in matches:
+            i, j = m
+            print("{0}\t{1}\t{2}\t{3}".format(i, j, encode_document(l1_texts[i-1]), encode_document(l2_texts[j-1])))
 
 
-for m in matches:
-    i, j = m
-    print("{0}\t{1}\t{2}\t{3}".format(i, j, l1_texts[i-1], l2_texts[j-1]))
+if __name__ == "__main__":
+    main()
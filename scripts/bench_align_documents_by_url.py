@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import time
+
+from align_documents_by_url import align_hash, align_scan
+
+
+def synthetic_urls(n, lang, codes, rnd):
+    # Mix of URL shapes seen in crawls: language directories, language query parameters, language suffixes and
+    # pages that only exist in one of the languages.
+    urls = []
+    for k in range(n):
+        code = rnd.choice(codes)
+        page = rnd.randrange(n)
+        shape = rnd.randrange(4)
+        if shape == 0:
+            urls.append("http://www.example.com/{0}/section{1}/page_{2}.html".format(code, page % 97, page))
+        elif shape == 1:
+            urls.append("http://www.example.com/section{0}/page-{1}.html?lang={2}".format(page % 97, page, code))
+        elif shape == 2:
+            urls.append("http://www.example.com/section{0}//page{1}_{2}.html".format(page % 97, page, code))
+        else:
+            urls.append("http://www.example.com/{0}/only/{1}/{2}.html".format(lang, page, k))
+    return urls
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Benchmark of the URL document aligner on a synthetic host. The hash join runs on the whole "
+                    "URL set; the pairwise scan is timed on a sample of lang1 URLs, extrapolated to the whole set "
+                    "and used to check that both modes align the same documents.")
+    oparser.add_argument("--size", type=int, default=100000, help="Number of URLs per language")
+    oparser.add_argument("--scan-sample", type=int, default=200, help="Number of lang1 URLs aligned with the scan")
+    oparser.add_argument("--seed", type=int, default=1)
+    options = oparser.parse_args()
+
+    rnd = random.Random(options.seed)
+    l1_urls = synthetic_urls(options.size, "en", ["en", "eng", "english", "EN"], rnd)
+    l2_urls = synthetic_urls(options.size, "ja", ["ja", "jp", "jpn", "japanese"], rnd)
+
+    start = time.time()
+    hash_matches = align_hash(l1_urls, l2_urls, "en", "ja")
+    hash_time = time.time() - start
+    print("hash: {0}x{1} URLs, {2} alignments in {3:.2f}s".format(len(l1_urls), len(l2_urls), len(hash_matches),
+                                                                  hash_time))
+
+    sample = sorted(rnd.sample(range(len(l1_urls)), min(options.scan_sample, len(l1_urls))))
+    sample_urls = [l1_urls[i] for i in sample]
+    start = time.time()
+    scan_matches = align_scan(sample_urls, l2_urls, "en", "ja")
+    scan_time = time.time() - start
+    print("scan: {0}x{1} URLs in {2:.2f}s, ~{3:.0f}s extrapolated to {4}x{1}".format(
+        len(sample_urls), len(l2_urls), scan_time, scan_time * len(l1_urls) / max(len(sample_urls), 1),
+        len(l1_urls)))
+
+    hash_sample = align_hash(sample_urls, l2_urls, "en", "ja")
+    print("same alignments on the sample: {0}".format(hash_sample == scan_matches))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import CODECS, open_compressed
+
+
+def drop_cache(path):
+    # the read back must come from the file system (e.g. NFS), not from the page cache of this host
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def bench(codec, input_path, out_dir):
+    output = os.path.join(out_dir, "bench_codecs" + (codec.suffix or ".none"))
+    start = time.time()
+    with open(input_path, "rb") as reader, open(output, "wb") as writer:
+        subprocess.run(codec.compress, shell=True, stdin=reader, stdout=writer, check=True)
+        writer.flush()
+        os.fsync(writer.fileno())
+    write_time = time.time() - start
+    size = os.path.getsize(output)
+
+    drop_cache(output)
+    start = time.time()
+    subprocess.run("{0} {1} > /dev/null".format(codec.decompress, output), shell=True, check=True)
+    read_time = time.time() - start
+
+    drop_cache(output)
+    start = time.time()
+    with open_compressed(output) as reader:
+        while reader.read(1 << 20):
+            pass
+    python_time = time.time() - start
+    os.remove(output)
+    return write_time, read_time, python_time, size
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Measures the codecs of the transient files (transientCodec in the Snakefile) on an "
+                    "uncompressed intermediate file: the time to compress it with the shell command of the codec "
+                    "into a directory (give one on the file system of TRANSIENT_DIR, e.g. NFS), to read it back "
+                    "with the shell command and with open_compressed(), and the bytes written.")
+    oparser.add_argument("input", help="Uncompressed file, e.g. xzcat bitext.xz > bitext")
+    oparser.add_argument("--dir", default=".", help="Directory the compressed files are written to")
+    oparser.add_argument("--codecs", default=",".join(CODECS), help="Comma-separated codecs")
+    options = oparser.parse_args()
+
+    input_size = os.path.getsize(options.input)
+    print("{0}: {1} bytes".format(options.input, input_size))
+    print("{0:<6} {1:>9} {2:>9} {3:>9} {4:>12} {5:>7}".format("codec", "write s", "read s", "python s", "bytes",
+                                                              "ratio"))
+    for name in options.codecs.split(","):
+        write_time, read_time, python_time, size = bench(CODECS[name], options.input, options.dir)
+        print("{0:<6} {1:9.2f} {2:9.2f} {3:9.2f} {4:12d} {5:7.2f}".format(
+            name, write_time, read_time, python_time, size, input_size / max(size, 1)))
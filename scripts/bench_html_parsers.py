@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+from warcio.archiveiterator import ArchiveIterator
+
+from html_text import SimpleParser, lxml_text
+from warc2htmlwarc import read_records, normalize_payload
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from textnorm import normalize_plaintext
+
+
+def bs4_text(document):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(document, "lxml")
+    for script in soup(["script", "style", "img"]):
+        script.extract()
+    return soup.get_text()
+
+
+def modest_text(document):
+    from selectolax.parser import HTMLParser
+    tree = HTMLParser(document)
+    for tag in tree.css('script'):
+        tag.decompose()
+    for tag in tree.css('style'):
+        tag.decompose()
+    for tag in tree.css('img'):
+        tag.decompose()
+    if tree.body is None:
+        return ""
+    return tree.body.text(separator='\n')
+
+
+def simple_text(document):
+    parser = SimpleParser()
+    parser.feed(document)
+    return parser.get_text()
+
+
+ENGINES = {"bs4": bs4_text, "modest": modest_text, "simple": simple_text, "lxml": lxml_text}
+
+
+def read_documents(paths, n):
+    docs = []
+    for path in paths:
+        with open(path, "rb") as reader:
+            for record in read_records(ArchiveIterator(reader)):
+                for payload in record.payloads:
+                    encoding, text = normalize_payload(record.url, payload)
+                    if encoding is not None:
+                        docs.append((record.url, text))
+                if len(docs) >= n:
+                    return docs[:n]
+    return docs
+
+
+def run(name, extract, docs):
+    texts = []
+    failed = 0
+    start = time.time()
+    for url, document in docs:
+        try:
+            texts.append(extract(document))
+        except Exception:
+            texts.append(None)
+            failed += 1
+    elapsed = max(time.time() - start, 1e-9)
+    size = sum(len(document) for _, document in docs)
+    print("  {0:<8} {1:9.1f} docs/s {2:8.2f} MB/s {3:6d} failed".format(name, len(docs) / elapsed,
+                                                                    size / elapsed / 1e6, failed))
+    return [normalize_plaintext(text) if text is not None else None for text in texts]
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Measures the speed of the text extraction engines of warc2preprocess.py --parser on the HTML "
+                    "documents of WARC files, and how often their text (after the normalization of "
+                    "warc2preprocess.py) is the same as the text of a reference engine: the same text, the same "
+                    "words in the same order, or the same characters once all whitespace is removed.")
+    oparser.add_argument("warcs", nargs="+", help="WARC files (original crawls, normalized like --normalize does)")
+    oparser.add_argument("--documents", type=int, default=1000, help="Maximum number of documents")
+    oparser.add_argument("--engines", nargs="+", default=["bs4", "modest", "simple", "lxml"], choices=list(ENGINES))
+    oparser.add_argument("--reference", default="bs4", choices=list(ENGINES))
+    oparser.add_argument("--show", type=int, default=0,
+                         help="Print the URLs of this many documents whose words differ from the reference")
+    options = oparser.parse_args()
+
+    docs = read_documents(options.warcs, options.documents)
+    print("{0} documents, {1:.1f} MB of HTML".format(len(docs), sum(len(d) for _, d in docs) / 1e6))
+    engines = [options.reference] + [e for e in options.engines if e != options.reference]
+    results = {}
+    for name in engines:
+        try:
+            ENGINES[name]("<p>x</p>")
+        except Exception as ex:
+            sys.stderr.write("{0} is not available: {1}\n".format(name, ex))
+            continue
+        results[name] = run(name, ENGINES[name], docs)
+
+    reference = results.get(options.reference)
+    if reference is None:
+        sys.exit(0)
+    print("parity with {0}:".format(options.reference))
+    for name in engines[1:]:
+        if name not in results:
+            continue
+        same = same_words = same_chars = 0
+        shown = 0
+        for (url, _), a, b in zip(docs, reference, results[name]):
+            if a is None or b is None:
+                continue
+            same += a == b
+            if a.split() == b.split():
+                same_words += 1
+            elif shown < options.show:
+                print("    {0} words differ: {1}".format(name, url))
+                shown += 1
+            same_chars += "".join(a.split()) == "".join(b.split())
+        n = max(len(docs), 1)
+        print("  {0:<8} same text {1:6.2f}%   same words {2:6.2f}%   same characters {3:6.2f}%".format(
+            name, 100.0 * same / n, 100.0 * same_words / n, 100.0 * same_chars / n))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+from lang_detect import LanguageDetector, printable
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_documents, decode_document
+
+
+def read_labelled(specs, n):
+    docs = []
+    for spec in specs:
+        lang, path = spec.split("=", 1)
+        with open_documents(path) as reader:
+            for k, document in enumerate(reader):
+                if k == n:
+                    break
+                docs.append((lang, decode_document(document)))
+    return docs
+
+
+def run(name, detect, docs):
+    start = time.time()
+    langs = [detect(data) for _, data in docs]
+    elapsed = max(time.time() - start, 1e-9)
+    correct = sum(1 for (label, _), lang in zip(docs, langs) if label == lang)
+    chars = sum(len(data) for _, data in docs)
+    print("  {0:<22} {1:9.1f} docs/s {2:8.2f} Mchars/s   accuracy {3:6.2f}%".format(
+        name, len(docs) / elapsed, chars / elapsed / 1e6, 100.0 * correct / max(len(docs), 1)))
+    return langs
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Measures the speed and the accuracy of the language identification of warc2preprocess.py on "
+                    "labelled documents: the former filter of non printable characters, the translate table, and "
+                    "the detection on head/middle/tail samples (--lid-sample).")
+    oparser.add_argument("labelled", nargs="+",
+                         help="LANG=FILE, documents of FILE (e.g. normalized_html.xz, base64 lines or framed) are "
+                              "in LANG")
+    oparser.add_argument("--documents", type=int, default=1000, help="Number of documents read from every file")
+    oparser.add_argument("--langid", default="cld2", help="cld2 or cld3")
+    oparser.add_argument("--sample", type=int, nargs="+", default=[1024, 4096],
+                         help="Window sizes of the sampled detection")
+    oparser.add_argument("--min-percent", dest="min_percent", type=int, default=80)
+    options = oparser.parse_args()
+
+    docs = read_labelled(options.labelled, options.documents)
+    long_docs = {n: sum(1 for _, data in docs if len(data) > 3 * n) for n in options.sample}
+    print("{0} documents, {1:.1f} Mchars".format(len(docs), sum(len(data) for _, data in docs) / 1e6))
+
+    full = LanguageDetector(options.langid)
+    if options.langid != "cld3":
+        same = sum(1 for _, data in docs if printable(data) == ''.join(x for x in data if x.isprintable()))
+        print("  translate table gives the same text as the generator on {0}/{1} documents".format(same, len(docs)))
+        run("generator, full", lambda data: full.model.detect(''.join(x for x in data if x.isprintable()),
+                                                              isPlainText=False)[2][0][1], docs)
+    reference = run("translate, full", full, docs)
+
+    for n in options.sample:
+        sampled = LanguageDetector(options.langid, n, options.min_percent)
+        fallbacks = [0]
+
+        def detect(data):
+            lang, on_sample = sampled.detect(data)
+            if not on_sample and len(data) > 3 * n:
+                fallbacks[0] += 1
+            return lang
+
+        langs = run("sample {0}".format(n), detect, docs)
+        print("  {0:<22} {1} documents sampled, {2} of them read again, {3} languages differ from the full "
+              "detection".format("", long_docs[n], fallbacks[0],
+                                 sum(1 for a, b in zip(reference, langs) if a != b)))
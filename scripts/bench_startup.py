@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGURATIONS = [
+    ("bs4", []),
+    ("modest", ["--parser", "modest"]),
+    ("alcazar", ["--parser", "alcazar"]),
+    ("html tokenizer", ["--parser", "simple"]),
+    ("bs4 + neologdn", ["--neologdn"]),
+    ("bs4 + cld3", ["--langid", "cld3"]),
+    ("bs4 + normalize", ["--normalize", "--ftfy", "--cleanhtml"]),
+    ("bs4 + boilerpipe", ["--boilerpipe"]),
+]
+
+
+def time_run(script, args, runs):
+    times = []
+    for _ in range(runs):
+        out_dir = tempfile.mkdtemp(prefix="bench_startup")
+        start = time.time()
+        # an empty input: everything measured is imports, JVM and the setup of the outputs
+        result = subprocess.run([sys.executable, script, "--input", "-", "--output-dir", out_dir] + args,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        times.append(time.time() - start)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        if result.returncode != 0:
+            return None, result.stderr.decode("utf-8", "replace").strip().split("\n")[-1]
+    return statistics.median(times), None
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Measures the startup time of warc2preprocess.py (imports and JVM) on an empty input for every "
+                    "combination of --parser, --boilerpipe, --langid and --neologdn, optionally next to another "
+                    "version of the script.")
+    oparser.add_argument("--script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          "warc2preprocess.py"))
+    oparser.add_argument("--compare", help="Another warc2preprocess.py, e.g. from an older checkout")
+    oparser.add_argument("--runs", type=int, default=5, help="Runs per configuration, the median is reported")
+    options = oparser.parse_args()
+
+    scripts = [options.script] + ([options.compare] if options.compare else [])
+    print("{0:<20}".format("configuration") + "".join("{0:>14}".format("script {0} s".format(i + 1))
+                                                     for i in range(len(scripts))))
+    for name, args in CONFIGURATIONS:
+        cells = []
+        for script in scripts:
+            median, error = time_run(script, args, options.runs)
+            cells.append("{0:14.3f}".format(median) if error is None else "{0:>14}".format("failed"))
+            if error:
+                sys.stderr.write("{0} ({1}): {2}\n".format(name, script, error))
+        print("{0:<20}".format(name) + "".join(cells))
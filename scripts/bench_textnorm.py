@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_documents, decode_document
+from textnorm import normalize_plaintext, text_chunks, drop_punctuation_lines
+
+re_tag = re.compile(r"^\[(START|END):([^\]]+)\]$")
+re_space = re.compile(r"[\s\u3000]+")
+
+
+def old_normalize_plaintext(plaintext):
+    return re.sub(r"\n+", "\n", re.sub(r" *\n *", "\n", re.sub(r"^\s+$", "\n", re.sub(
+        r" +", " ", re.sub(r"\r", "", plaintext.replace(u'\xa0', u' ')))))).strip()
+
+
+def old_text_chunks(text):
+    return [re_space.sub(" ", tc).strip() for tc in text.split("\n") if not re_tag.match(tc.strip())]
+
+
+def old_drop_punctuation_lines(text):
+    tokenized_filtered = ""
+    for sent in text.split("\n"):
+        if sum([1 for m in sent if m in string.punctuation + string.digits]) < len(sent) // 2:
+            tokenized_filtered += sent + "\n"
+    return tokenized_filtered
+
+
+FUNCTIONS = [
+    ("normalize_plaintext", old_normalize_plaintext, normalize_plaintext),
+    ("text_chunks", old_text_chunks, text_chunks),
+    ("drop_punctuation_lines", old_drop_punctuation_lines, drop_punctuation_lines),
+]
+
+
+def timed(function, docs):
+    start = time.time()
+    results = [function(doc) for doc in docs]
+    return max(time.time() - start, 1e-9), results
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Measures the functions of utils/textnorm.py against the code they replace in "
+                    "warc2preprocess.py, prepare_laser_mine.py, tokenizer.py and hunalign.py, and checks that they "
+                    "give the same results.")
+    oparser.add_argument("inputs", nargs="+",
+                         help="Document files (e.g. plain_text.xz or normalized_html.xz, base64 lines or framed)")
+    oparser.add_argument("--documents", type=int, default=1000, help="Number of documents read from every file")
+    options = oparser.parse_args()
+
+    docs = []
+    for path in options.inputs:
+        with open_documents(path) as reader:
+            for k, document in enumerate(reader):
+                if k == options.documents:
+                    break
+                docs.append(decode_document(document))
+    chars = sum(len(doc) for doc in docs)
+    print("{0} documents, {1:.1f} Mchars".format(len(docs), chars / 1e6))
+
+    for name, old, new in FUNCTIONS:
+        old_time, old_results = timed(old, docs)
+        new_time, new_results = timed(new, docs)
+        print("  {0:<24} before {1:8.2f} Mchars/s   after {2:8.2f} Mchars/s   x{3:5.1f}   {4}".format(
+            name, chars / old_time / 1e6, chars / new_time / 1e6, old_time / new_time,
+            "same results" if old_results == new_results else "DIFFERENT RESULTS"))
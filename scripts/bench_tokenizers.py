@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+from external_processor import ExternalTextProcessor, get_text_processor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_documents, decode_document
+
+
+def read_documents(path, n):
+    docs = []
+    with open_documents(path) as reader:
+        for document in reader:
+            docs.append(decode_document(document).replace("\t", " "))
+            if len(docs) == n:
+                break
+    return docs
+
+
+def run(name, processor, texts):
+    start = time.time()
+    outs = [processor.process(text) for text in texts]
+    elapsed = time.time() - start
+    print("  {0:<12} {1:8.1f} inputs/s".format(name, len(texts) / max(elapsed, 1e-9)))
+    return outs
+
+
+def compare(name, reference, outs, texts):
+    same = sum(1 for a, b in zip(reference, outs) if a == b)
+    print("  {0:<12} {1}/{2} outputs identical to the command".format(name, same, len(reference)))
+    for text, a, b in zip(texts, reference, outs):
+        if a != b:
+            print("    first difference on input {0!r}:\n      command: {1!r}\n      {2}: {3!r}".format(
+                text[:200], a[:200], name, b[:200]))
+            break
+
+
+def bench(title, cmd, backend, framing, texts):
+    print("{0}: {1}".format(title, cmd))
+    reference = run("per-call", ExternalTextProcessor(cmd.split()), texts)
+    outs = run("persistent", get_text_processor(cmd.split(), True, framing), texts)
+    compare("persistent", reference, outs, texts)
+    if backend:
+        outs = run(backend, get_text_processor(backend.split(), False, framing), texts)
+        compare(backend, reference, outs, texts)
+    return reference
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Checks that the persistent processes and the in-process backends of the sentence splitter and "
+                    "the word tokeniser give the same output as the commands, and measures their throughput on the "
+                    "documents of a plain_text file.")
+    oparser.add_argument("--text", required=True, help="plain_text file of warc2preprocess (base64 lines or "
+                                                       "framed)")
+    oparser.add_argument("--documents", type=int, default=1000, help="Number of documents to read")
+    oparser.add_argument("--sentence-splitter", dest="splitter", required=True, help="Sentence splitter command")
+    oparser.add_argument("--splitter-backend", dest="splitter_backend",
+                         help="In-process sentence splitter, e.g. python:moses-en")
+    oparser.add_argument("--word-tokenizer", dest="tokenizer", help="Word tokeniser command")
+    oparser.add_argument("--tokenizer-backend", dest="tokenizer_backend",
+                         help="In-process word tokeniser, e.g. python:mecab")
+    options = oparser.parse_args()
+
+    documents = read_documents(options.text, options.documents)
+    sentences = bench("sentence splitter", options.splitter, options.splitter_backend, "sentinel", documents)
+    if options.tokenizer:
+        # the tokenisers are timed sentence by sentence, like hunalign_strand.py calls them
+        sentences = [sent for doc in sentences for sent in doc.strip().split("\n") if sent.strip()]
+        bench("word tokenizer", options.tokenizer, options.tokenizer_backend, "lines", sentences)
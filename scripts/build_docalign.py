@@ -23,7 +23,7 @@ import lzma
 import gzip
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
-from common import open_xz_or_gzip_or_plain
+from common import open_documents, encode_document
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -58,10 +58,11 @@ if __name__ == "__main__":
 
     reader.seek(0)
 
-    with open_xz_or_gzip_or_plain(args.tokenized1) as tok_reader1, \
-            open_xz_or_gzip_or_plain(args.tokenized2) as tok_reader2, \
-            open_xz_or_gzip_or_plain(args.text1) as text_reader1, \
-            open_xz_or_gzip_or_plain(args.text2) as text_reader2:
+    # the documents can be base64 lines or framed records, and are written as base64 for hunalign.py
+    with open_documents(args.tokenized1) as tok_reader1, \
+            open_documents(args.tokenized2) as tok_reader2, \
+            open_documents(args.text1) as text_reader1, \
+            open_documents(args.text2) as text_reader2:
 
         doc1_current_line = 1
         doc2_current_line = 1
@@ -72,14 +73,14 @@ if __name__ == "__main__":
             doc1 = int(fields[args.column1])
             doc2 = int(fields[args.column2])
             while doc1_current_line <= doc1:
-                text1 = next(text_reader1, None).strip()
-                tok1 = next(tok_reader1, None).strip()
+                text1 = encode_document(next(text_reader1, None))
+                tok1 = encode_document(next(tok_reader1, None))
                 doc1_current_line = doc1_current_line + 1
 
             while doc2_last_written != doc2:
                 if doc2_current_line <= doc2:
-                    text2 = next(text_reader2, None).strip()
-                    tok2 = next(tok_reader2, None).strip()
+                    text2 = encode_document(next(text_reader2, None))
+                    tok2 = encode_document(next(tok_reader2, None))
 
                     if doc2_current_line == doc2:
                         print("{0}\t{1}\t{2}\t{3}\t{4}\t{5}".format(doc1, doc2, text1, text2, tok1, tok2))
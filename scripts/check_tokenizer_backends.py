@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from external_processor import ExternalTextProcessor, get_text_processor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_documents, decode_document
+
+# fixed input: abbreviations, numbers, quotes, several paragraphs, markup lines and Japanese text
+TEXTS = [
+    "Mr. Smith went to Washington D.C. on Jan. 5th. He arrived at 3 p.m. and met Dr. Jones!\n"
+    "\"Is this the U.S. embassy?\" he asked. It wasn't.\n",
+    "The price is $1,234.56 (about 1.000,00 EUR), i.e. cheap. See e.g. http://example.com/a-b?c=d&e=f.\n"
+    "\n"
+    "A second paragraph -- with dashes, hyphen-ated words and 'single quotes'. Another sentence...\n",
+    "<P>\n"
+    "Line after markup. Final sentence without a full stop\n",
+    "今日は良い天気です。明日は雨が降るでしょうか？「はい、そうです。」と彼は言った！\n"
+    "東京タワーは３３３メートルです．ＡＢＣ株式会社の本社は大阪にあります。\n",
+    "\n",
+    "x\n",
+]
+
+
+def read_texts(path, n):
+    texts = []
+    with open_documents(path) as reader:
+        for document in reader:
+            texts.append(decode_document(document).replace("\t", " "))
+            if len(texts) == n:
+                break
+    return texts
+
+
+def check(title, cmd, backend, framing, texts, threads):
+    """Number of the texts on which the backend, in this thread and in threads threads at once, does not give the
+    output of the command."""
+    print("{0}: {1} against {2}".format(title, backend, cmd))
+    command = ExternalTextProcessor(cmd.split())
+    expected = [command.process(text) for text in texts]
+    processor = get_text_processor(backend.split(), False, framing)
+    outputs = [processor.process(text) for text in texts]
+
+    def process(text):
+        return get_text_processor(backend.split(), False, framing).process(text)
+
+    with ThreadPoolExecutor(threads) as executor:
+        # every text several times, so that the threads run the backends at the same time
+        threaded = list(executor.map(process, texts * threads))
+
+    failed = 0
+    for k, (text, output) in enumerate(zip(texts, outputs)):
+        different = output != expected[k] or any(threaded[i] != expected[k] for i in range(k, len(threaded),
+                                                                                               len(texts)))
+        if different:
+            failed += 1
+            if failed <= 3:
+                print("  DIFFERENT on input {0!r}:\n    command: {1!r}\n    backend: {2!r}".format(
+                    text[:200], expected[k][:200], output[:200]))
+    print("  {0}/{1} outputs identical to the command".format(len(texts) - failed, len(texts)))
+    return failed
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Checks that the in-process sentence splitter and word tokeniser backends give the same output "
+                    "as the commands they replace, on a fixed text (and the documents of a plain_text file), also "
+                    "when several threads use them at once. Exits with 1 when an output is different.")
+    oparser.add_argument("--sentence-splitter", dest="splitter", help="Sentence splitter command")
+    oparser.add_argument("--splitter-backend", dest="splitter_backend",
+                         help="In-process sentence splitter, e.g. python:moses-en")
+    oparser.add_argument("--word-tokenizer", dest="tokenizer", help="Word tokeniser command")
+    oparser.add_argument("--tokenizer-backend", dest="tokenizer_backend",
+                         help="In-process word tokeniser, e.g. python:mecab")
+    oparser.add_argument("--text", help="plain_text file of warc2preprocess (base64 lines or framed) whose documents "
+                                        "are checked too")
+    oparser.add_argument("--documents", type=int, default=100, help="Number of documents read from --text")
+    oparser.add_argument("--threads", type=int, default=4, help="Threads using the backends at once")
+    options = oparser.parse_args()
+
+    if not (options.splitter and options.splitter_backend) and not (options.tokenizer and options.tokenizer_backend):
+        oparser.error("give a sentence splitter and its backend, or a word tokeniser and its backend")
+
+    texts = TEXTS + (read_texts(options.text, options.documents) if options.text else [])
+    failed = 0
+    if options.splitter and options.splitter_backend:
+        failed += check("sentence splitter", options.splitter, options.splitter_backend, "sentinel", texts,
+                        options.threads)
+    if options.tokenizer and options.tokenizer_backend:
+        # the tokenisers are checked sentence by sentence, like hunalign_strand.py calls them, and on whole texts
+        # with blank and markup lines, like tokenizer.py and hunalign_old.py call them
+        sentences = [line for text in texts for line in text.split("\n") if line.strip()]
+        failed += check("word tokenizer", options.tokenizer, options.tokenizer_backend, "lines", sentences + texts,
+                        options.threads)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Converts between the framed record format and the legacy line format (tab-separated columns, documents in
+# base64), e.g. to give plain_text.xz or bitext.url.xz written with --framed to tools that read base64 lines:
+#   convert_records.py lines plain_text.xz plain_text.b64.xz
+#   convert_records.py lines bitext.url.xz --base64-columns 2,3 | xz > bitext.url.b64.xz
+#   convert_records.py framed plain_text.b64.xz plain_text.xz
+# Outputs ending in .xz are written with an index, like the outputs of warc2preprocess.py, others are written
+# uncompressed ('-' is the standard output).
+
+import argparse
+import base64
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_binary, is_framed_stream, read_framed, BlockXzWriter, FramedBlockXzWriter, FramedWriter
+
+
+class LineWriter(object):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, line):
+        self.stream.write(line)
+
+
+def to_lines(fields, b64_columns):
+    return b"\t".join(base64.b64encode(field) if i in b64_columns else field
+                      for i, field in enumerate(fields)) + b"\n"
+
+
+def to_fields(line, b64_columns):
+    return tuple(base64.b64decode(column) if i in b64_columns else column
+                 for i, column in enumerate(line.rstrip(b"\n").split(b"\t")))
+
+
+def convert(input_path, output_path, target, b64_columns):
+    with open_binary(input_path) as reader:
+        framed = is_framed_stream(reader)
+        if framed == (target == "framed"):
+            sys.stderr.write("{0} is already in the {1} format, it is copied\n".format(input_path, target))
+        if framed:
+            records = read_framed(reader)
+        else:
+            records = (to_fields(line, b64_columns) for line in reader)
+
+        stdout = output_path == "-"
+        if output_path.endswith(".xz"):
+            writer = FramedBlockXzWriter(output_path) if target == "framed" else BlockXzWriter(output_path)
+        elif target == "framed":
+            writer = FramedWriter(sys.stdout.buffer if stdout else open(output_path, "wb"))
+        else:
+            writer = LineWriter(sys.stdout.buffer if stdout else open(output_path, "wb"))
+
+        n = 0
+        for fields in records:
+            writer.write(fields if target == "framed" else to_lines(fields, b64_columns))
+            n += 1
+
+        if isinstance(writer, BlockXzWriter):
+            writer.close()
+        elif stdout:
+            sys.stdout.buffer.flush()
+        else:
+            writer.stream.close()
+    return n
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Converts a file between the framed record format and the line format with base64 documents")
+    oparser.add_argument("target", choices=["framed", "lines"], help="Format of the output")
+    oparser.add_argument("input", help="Input file (.xz, .gz, plain or '-' for the standard input)")
+    oparser.add_argument("output", nargs="?", default="-", help="Output file, the standard output by default")
+    oparser.add_argument("--base64-columns", dest="columns", default="0",
+                         help="Comma-separated columns (0-based) that are base64 in the line format, e.g. 2,3 for "
+                              "the output of align_documents_by_url.py. The other columns are copied as they are")
+    options = oparser.parse_args()
+
+    columns = {int(column) for column in options.columns.split(",") if column}
+    convert(options.input, options.output, options.target, columns)
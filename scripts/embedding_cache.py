@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import argparse
+import fcntl
+import json
+import mmh3
+import numpy as np
+import os
+import sys
+
+from contextlib import contextmanager
+
+INDEX_DTYPE = np.dtype([("key", "<u8"), ("row", "<u8"), ("used", "<u8")])
+
+
+def sentence_key(lang, sentence):
+    return mmh3.hash64("{0}\t{1}".format(lang, sentence), signed=False)[0]
+
+
+class EmbeddingCache(object):
+    """On-disk cache of sentence embeddings, keyed by language plus a hash of the tokenized and BPE'd sentence.
+
+    Vectors are kept as float16 rows of an append-only file that is memory-mapped for reading, and the index
+    (key, row, last use) is a sorted array that is rewritten when the cache is saved. Several processes can
+    share a cache directory: a snapshot of the index is taken when the cache is opened, and new vectors are
+    merged with the ones added by other processes under a file lock when it is saved. When the
+    cache grows over max_size bytes, the least recently used vectors are dropped and the file is compacted.
+    """
+
+    def __init__(self, cache_dir, dim, max_size=8 << 30, encoder=None, low_water=0.9):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.max_rows = max(int(max_size // (dim * 2)), 1)
+        self.low_water = low_water
+        self.vectors_path = os.path.join(cache_dir, "vectors.f16")
+        self.index_path = os.path.join(cache_dir, "index")
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+        self.lock_path = os.path.join(cache_dir, "lock")
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self.locked(fcntl.LOCK_EX):
+            meta = {"dim": dim, "encoder": os.path.basename(encoder) if encoder else None}
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path) as reader:
+                    stored = json.load(reader)
+                if stored != meta:
+                    raise ValueError("Embedding cache {0} was built for {1}, not for {2}".format(cache_dir, stored, meta))
+            else:
+                with open(self.meta_path, "w") as writer:
+                    json.dump(meta, writer)
+                open(self.vectors_path, "ab").close()
+                self.write_index(np.zeros(0, dtype=INDEX_DTYPE))
+            self.index, self.vectors = self.load()
+
+        self.tick = int(self.index["used"].max()) + 1 if len(self.index) else 1
+        self.used = {}
+        self.new_keys = []
+        self.new_vectors = []
+
+    @contextmanager
+    def locked(self, operation):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        index = np.fromfile(self.index_path, dtype=INDEX_DTYPE)
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 2)
+        if rows == 0:
+            return index, np.zeros((0, self.dim), dtype=np.float16)
+        return index, np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+
+    def write_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        index.tofile(tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, keys):
+        """Returns the mask of the keys found in the cache and their vectors as float32."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        pos = np.searchsorted(self.index["key"], keys)
+        pos[pos == len(self.index)] = 0
+        found = (self.index["key"][pos] == keys) if len(self.index) else np.zeros(len(keys), dtype=bool)
+        for key in keys[found]:
+            self.used[int(key)] = self.tick
+        self.tick += 1
+        self.hits += int(found.sum())
+        self.misses += int(len(keys) - found.sum())
+        return found, np.asarray(self.vectors[self.index["row"][pos[found]]], dtype=np.float32)
+
+    def add(self, keys, vectors):
+        self.new_keys.extend(int(key) for key in keys)
+        self.new_vectors.append(np.asarray(vectors, dtype=np.float16))
+
+    def save(self):
+        with self.locked(fcntl.LOCK_EX):
+            # other processes may have saved since this cache was opened
+            index, _ = self.load()
+            rows = os.path.getsize(self.vectors_path) // (self.dim * 2)
+
+            used = index["used"].copy()
+            if self.used:
+                used_keys = np.fromiter(self.used.keys(), dtype=np.uint64, count=len(self.used))
+                used_ticks = np.fromiter(self.used.values(), dtype=np.uint64, count=len(self.used))
+                pos = np.searchsorted(index["key"], used_keys)
+                pos[pos == len(index)] = 0
+                hit = (index["key"][pos] == used_keys) if len(index) else np.zeros(len(used_keys), dtype=bool)
+                used[pos[hit]] = np.maximum(used[pos[hit]], used_ticks[hit])
+            index["used"] = used
+
+            if self.new_keys:
+                new_keys = np.array(self.new_keys, dtype=np.uint64)
+                new_vectors = np.concatenate(self.new_vectors)
+                new_keys, first = np.unique(new_keys, return_index=True)
+                keep = ~np.isin(new_keys, index["key"])
+                new_keys, new_vectors = new_keys[keep], new_vectors[first[keep]]
+                with open(self.vectors_path, "r+b") as writer:
+                    writer.seek(rows * self.dim * 2)
+                    writer.truncate()
+                    new_vectors.tofile(writer)
+                added = np.zeros(len(new_keys), dtype=INDEX_DTYPE)
+                added["key"] = new_keys
+                added["row"] = np.arange(rows, rows + len(new_keys), dtype=np.uint64)
+                added["used"] = self.tick
+                index = np.concatenate((index, added))
+                index = index[np.argsort(index["key"], kind="stable")]
+
+            if len(index) > self.max_rows:
+                index = self.evict(index)
+            self.write_index(index)
+            self.index, self.vectors = self.load()
+
+        self.used = {}
+        self.new_keys = []
+        self.new_vectors = []
+
+    def evict(self, index):
+        # keep the most recently used vectors up to the low water mark and compact the vectors file
+        keep = np.sort(np.argsort(-index["used"].astype(np.int64), kind="stable")[:int(self.max_rows * self.low_water)])
+        index = index[keep]
+        _, vectors = self.load()
+        order = np.argsort(index["row"], kind="stable")
+        tmp_path = self.vectors_path + ".tmp"
+        with open(tmp_path, "wb") as writer:
+            for start in range(0, len(order), 65536):
+                np.asarray(vectors[index["row"][order[start:start + 65536]]]).tofile(writer)
+        index["row"][order] = np.arange(len(index), dtype=np.uint64)
+        os.replace(tmp_path, self.vectors_path)
+        return index
+
+    def close(self):
+        self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(description="Prints the size of a sentence embedding cache and optionally "
+                                                  "shrinks it to a maximum size.")
+    oparser.add_argument("cache_dir", help="Cache directory")
+    oparser.add_argument("--dim", type=int, default=1024, help="Embedding dimensionality")
+    oparser.add_argument("--max_size", type=int, default=None, help="Shrink the cache to this many bytes")
+    options = oparser.parse_args()
+
+    with open(os.path.join(options.cache_dir, "meta.json")) as reader:
+        meta = json.load(reader)
+    cache = EmbeddingCache(options.cache_dir, options.dim, encoder=meta["encoder"],
+                           **({"max_size": options.max_size} if options.max_size else {}))
+    cache.close()
+    print("{0} sentences, {1} bytes".format(len(cache.index), len(cache.index) * options.dim * 2), file=sys.stderr)
@@ -13,7 +13,14 @@
 #  You should have received a copy of the GNU General Public License
 #  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
 
+import atexit
+import os
+import queue
 import subprocess
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from tokenizer_backends import is_backend, get_backend
 
 
 class ExternalTextProcessor(object):
@@ -26,3 +33,138 @@ class ExternalTextProcessor(object):
         outs, errs = proc.communicate(input=bytes(input_text, encoding='utf-8'))
 
         return outs.decode('utf-8', 'replace')
+
+
+class PersistentTextProcessor(object):
+    """Keeps the external command running and streams every input through it.
+
+    The command must process its input line by line and flush its output (e.g. the -b option of the Moses
+    scripts). Two framings are supported to find where the output of an input ends:
+      - "lines": the command writes exactly one line for every input line (word tokenisers, mecab -Owakati)
+      - "sentinel": a markup line is written after the input and the output is read until the command echoes
+        it back (split-sentences.perl, which prints markup lines as they are and flushes the pending
+        paragraph before them)
+    The output is the same as the one of ExternalTextProcessor for the same input. If the command dies, the
+    input is processed again with a new process for this call only.
+    """
+
+    SENTINEL = "<BITEXTOR_END_OF_INPUT>"
+
+    def __init__(self, cmd, framing="lines"):
+        if framing not in ("lines", "sentinel"):
+            raise ValueError("Unknown framing: {0}".format(framing))
+        self.cmd = cmd
+        self.framing = framing
+        self.proc = None
+
+    def start(self):
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL)
+
+    def write(self, data):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def process(self, input_text):
+        lines = input_text.split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        if self.framing == "lines" and not lines:
+            return ""
+        payload = "".join(line + "\n" for line in lines)
+        if self.framing == "sentinel":
+            payload += self.SENTINEL + "\n"
+
+        if self.proc is None or self.proc.poll() is not None:
+            self.start()
+        # the input is written from another thread so that a long input does not fill both pipes
+        writer = threading.Thread(target=self.write, args=(payload.encode("utf-8"),))
+        writer.start()
+        sentinel = (self.SENTINEL + "\n").encode("utf-8")
+        outs = []
+        complete = True
+        while self.framing == "sentinel" or len(outs) < len(lines):
+            line = self.proc.stdout.readline()
+            if not line:
+                complete = False
+                break
+            if self.framing == "sentinel" and line == sentinel:
+                break
+            outs.append(line)
+        writer.join()
+
+        if not complete:
+            self.close()
+            return ExternalTextProcessor(self.cmd).process(input_text)
+        return b"".join(outs).decode('utf-8', 'replace')
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+
+class TextProcessorPool(object):
+    """A few PersistentTextProcessor workers for the same command, so several inputs can be processed in parallel.
+
+    process() can be called from several threads at once, map() processes a list of inputs keeping their order.
+    """
+
+    def __init__(self, cmd, framing="lines", workers=1):
+        self.size = max(workers, 1)
+        self.idle = queue.Queue()
+        self.processors = [PersistentTextProcessor(cmd, framing) for _ in range(self.size)]
+        for processor in self.processors:
+            self.idle.put(processor)
+
+    def process(self, input_text):
+        processor = self.idle.get()
+        try:
+            return processor.process(input_text)
+        finally:
+            self.idle.put(processor)
+
+    def map(self, input_texts):
+        if self.size == 1:
+            return [self.process(text) for text in input_texts]
+        with ThreadPoolExecutor(self.size) as executor:
+            return list(executor.map(self.process, input_texts))
+
+    def close(self):
+        for processor in self.processors:
+            processor.close()
+
+
+_pools = {}
+
+
+def get_text_processor(cmd, persistent=False, framing="lines", workers=1):
+    """Returns an ExternalTextProcessor, or with persistent=True the pool of running processes for the command,
+    which is created once per process and reused by later calls.
+
+    Commands starting with "python:" are in-process backends from tokenizer_backends, a sentence splitter with
+    the "sentinel" framing and a word tokeniser with the "lines" one."""
+    if is_backend(cmd):
+        return get_backend(cmd, "splitter" if framing == "sentinel" else "tokenizer")
+    if not persistent:
+        return ExternalTextProcessor(cmd)
+    key = (os.getpid(), tuple(cmd), framing)
+    if key not in _pools:
+        _pools[key] = TextProcessorPool(cmd, framing, workers)
+    return _pools[key]
+
+
+@atexit.register
+def close_text_processors():
+    for key, pool in list(_pools.items()):
+        if key[0] == os.getpid():
+            pool.close()
+    _pools.clear()
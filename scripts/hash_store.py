@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compact store of the plain text hashes of a previous crawl (the --output_hash files of warc2preprocess.py, one
+# unsigned 32-bit hash per line), for warc2preprocess.py --input_hash:
+#   compile  sorts and deduplicates the hashes of hash files into a store file: a header, an optional Bloom filter
+#            and the hashes as a sorted array of little-endian uint32
+#   query    prints the hashes of a hash file that are (or, with --missing, are not) in a store
+# The store is memory-mapped, so that all the jobs of a run share one copy in the page cache at 4 bytes per hash
+# (plus the Bloom filter, which answers most lookups of hashes that are not in the store with one or two pages).
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_xz_or_gzip_or_plain
+
+MAGIC = b"BTXHASH1"
+# magic, number of hashes, bits of the Bloom filter (0 without filter), number of hash functions of the filter
+HEADER = struct.Struct("<8sQQI4x")
+GOLDEN = 0x9E3779B1
+
+
+def is_hash_store(path):
+    with open(path, "rb") as reader:
+        return reader.read(len(MAGIC)) == MAGIC
+
+
+def read_hash_files(paths):
+    import numpy as np
+    arrays = []
+    for path in paths:
+        with open_xz_or_gzip_or_plain(path) as reader:
+            arrays.append(np.fromiter((int(line) for line in reader if line.strip()), dtype=np.int64))
+    hashes = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+    valid = (hashes >= 0) & (hashes <= 0xFFFFFFFF)
+    if not valid.all():
+        sys.stderr.write("{0} hashes that are not unsigned 32-bit integers are ignored\n".format(
+            int((~valid).sum())))
+    return np.unique(hashes[valid]).astype(np.uint32)
+
+
+def bloom_positions(hashes, bits, k):
+    """Positions of the k bits of every hash (numpy array) in a filter of the given size, by double hashing."""
+    import numpy as np
+    h1 = hashes.astype(np.uint64)
+    h2 = ((h1 * GOLDEN) & 0xFFFFFFFF) | 1
+    return [(h1 + np.uint64(i) * h2) % np.uint64(bits) for i in range(k)]
+
+
+def compile_store(paths, output, bits_per_hash=10, k=7):
+    import numpy as np
+    hashes = read_hash_files(paths)
+    n = len(hashes)
+    bits = ((n * bits_per_hash + 63) // 64) * 64 if bits_per_hash and n else 0
+    with open(output, "wb") as writer:
+        writer.write(HEADER.pack(MAGIC, n, bits, k if bits else 0))
+        if bits:
+            bitmap = np.zeros(bits, dtype=bool)
+            for positions in bloom_positions(hashes, bits, k):
+                bitmap[positions] = True
+            writer.write(np.packbits(bitmap, bitorder="little").tobytes())
+        writer.write(hashes.astype("<u4").tobytes())
+    return n, bits
+
+
+class HashStore(object):
+    """Membership tests on a compiled store: 'h in store' for one hash, contains() for a numpy array of hashes."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("Hash stores are little-endian")
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n, self.bits, self.k = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("{0} is not a hash store, compile it with hash_store.py compile".format(path))
+        offset = HEADER.size + self.bits // 8
+        self.bloom = memoryview(self.map)[HEADER.size:offset]
+        self.hashes = memoryview(self.map)[offset:offset + 4 * self.n].cast("I")
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, h):
+        if self.bits:
+            h2 = ((h * GOLDEN) & 0xFFFFFFFF) | 1
+            for i in range(self.k):
+                position = (h + i * h2) % self.bits
+                if not self.bloom[position >> 3] & (1 << (position & 7)):
+                    return False
+        i = bisect.bisect_left(self.hashes, h)
+        return i < self.n and self.hashes[i] == h
+
+    def contains(self, hashes):
+        """Boolean numpy array: which of the hashes are in the store."""
+        import numpy as np
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        array = np.frombuffer(self.hashes, dtype=np.uint32)
+        if not self.n:
+            return np.zeros(len(hashes), dtype=bool)
+        if self.bits:
+            bloom = np.frombuffer(self.bloom, dtype=np.uint8)
+            candidates = np.ones(len(hashes), dtype=bool)
+            for positions in bloom_positions(hashes, self.bits, self.k):
+                bit = (positions & np.uint64(7)).astype(np.uint8)
+                candidates &= (bloom[positions >> np.uint64(3)] >> bit) & 1 == 1
+        else:
+            candidates = np.ones(len(hashes), dtype=bool)
+        found = np.zeros(len(hashes), dtype=bool)
+        indices = np.searchsorted(array, hashes[candidates])
+        found[candidates] = array[np.minimum(indices, self.n - 1)] == hashes[candidates]
+        return found
+
+    def close(self):
+        self.bloom.release()
+        self.hashes.release()
+        self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(description="Compiles plain text hash files into a memory-mapped hash store "
+                                                  "for warc2preprocess.py --input_hash, and queries it.")
+    subparsers = oparser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    compile_parser = subparsers.add_parser("compile", help="Compile hash files into a store")
+    compile_parser.add_argument("inputs", nargs="+", help="Hash files (xz, gz or plain, one hash per line)")
+    compile_parser.add_argument("-o", "--output", required=True, help="Store file")
+    compile_parser.add_argument("--bloom-bits", dest="bloomBits", type=int, default=10,
+                                help="Bits of the Bloom filter per hash, 0 for no filter (about 1%% of false "
+                                     "positives with 10)")
+
+    query_parser = subparsers.add_parser("query", help="Print the hashes of a hash file that are in a store")
+    query_parser.add_argument("store", help="Store file")
+    query_parser.add_argument("input", help="Hash file")
+    query_parser.add_argument("--missing", action="store_true", default=False,
+                              help="Print the hashes that are not in the store instead")
+
+    options = oparser.parse_args()
+    if options.command == "compile":
+        n, bits = compile_store(options.inputs, options.output, options.bloomBits)
+        sys.stderr.write("{0}: {1} hashes, {2} bytes\n".format(options.output, n, os.path.getsize(options.output)))
+    else:
+        store = HashStore(options.store)
+        hashes = read_hash_files([options.input])
+        found = store.contains(hashes)
+        for h in hashes[~found if options.missing else found]:
+            print(h)
+        store.close()
@@ -0,0 +1,107 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Text extraction from HTML by streaming parsers, for warc2preprocess.py --parser simple (html.parser tokenizer)
+# and --parser lxml (libxml2 events, no tree). Both keep the text as a list of chunks joined once at the end, and
+# put a newline at the start and/or the end of block tags so that the text of two blocks is not glued together.
+
+from html.parser import HTMLParser as HTMLTokenizer
+
+START_NL = {"ul", "ol", "dl", "tr"}
+END_NL = {"p", "div", "li", "dd", "dt", "th", "td", "h1", "h2", "h3", "h4", "h5", "h6"}
+SELF_NL = {"br"}
+
+
+class SimpleParser(HTMLTokenizer):
+    startNL = START_NL
+    endNL = END_NL
+    selfNL = SELF_NL
+    noText = {"script", "noscript", "style"}
+
+    def __init__(self):
+        super().__init__()
+        self.lastTok = ""
+        self.parsed = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.startNL:
+            self.parsed.append("\n")
+        self.lastTok = tag
+
+    def handle_endtag(self, tag):
+        if tag in self.endNL:
+            self.parsed.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.selfNL:
+            self.parsed.append("\n")
+
+    def handle_data(self, data):
+        if self.lastTok not in self.noText:
+            self.parsed.append(data.replace("\r\n", " ").replace("\n", " "))
+
+    def get_text(self):
+        return "".join(self.parsed).strip() + "\n"
+
+
+class TextTarget(object):
+    """lxml parser target: the text of the document without the content of script and style (and img, which has
+    none), like the bs4 parser of warc2preprocess.py, plus the newlines of the block tags. close() returns the
+    text and resets the target for the next document."""
+    skipped = {"script", "style", "img"}
+
+    def __init__(self):
+        self.chunks = []
+        self.skip = 0
+
+    def start(self, tag, attrib):
+        if tag in self.skipped:
+            self.skip += 1
+        elif tag in START_NL or tag in SELF_NL:
+            self.chunks.append("\n")
+
+    def end(self, tag):
+        if tag in self.skipped:
+            self.skip = max(self.skip - 1, 0)
+        elif tag in END_NL:
+            self.chunks.append("\n")
+
+    def data(self, data):
+        if not self.skip:
+            self.chunks.append(data)
+
+    def close(self):
+        text = "".join(self.chunks)
+        self.chunks = []
+        self.skip = 0
+        return text
+
+
+_lxml_parser = None
+
+
+def lxml_text(document):
+    """Text of an HTML document (str) with the lxml parser and a TextTarget, which is reused by the next calls."""
+    global _lxml_parser
+    if _lxml_parser is None:
+        from lxml import etree
+        _lxml_parser = etree.HTMLParser(target=TextTarget(), huge_tree=True)
+    try:
+        _lxml_parser.feed(document)
+        return _lxml_parser.close()
+    except BaseException:
+        # the state of the parser and of its target is unknown after an error
+        _lxml_parser = None
+        raise
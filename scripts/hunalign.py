@@ -37,9 +37,11 @@ import os
 import argparse
 import base64
 import subprocess
-import string
 from tempfile import NamedTemporaryFile
-from external_processor import ExternalTextProcessor
+from external_processor import get_text_processor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from textnorm import drop_punctuation_lines
 
 
 def run_aligner(filename_s, filename_t, dic, hunaligndir):
@@ -63,13 +65,10 @@ def run_aligner(filename_s, filename_t, dic, hunaligndir):
 
 
 def extract_encoded_text(encodedtext, encodedtokenized, tmp_file, tmp_file_origtext, sent_tokeniser):
-    proc_sent = ExternalTextProcessor(sent_tokeniser.split(' '))
+    proc_sent = get_text_processor(sent_tokeniser.split(' '), framing="sentinel")
     content = base64.b64decode(encodedtext).decode("utf-8").replace("\t", " ")
     tokenized_segs = proc_sent.process(content).strip()
-    tokenized_filtered = ""
-    for sent in tokenized_segs.split("\n"):
-        if sum([1 for m in sent if m in string.punctuation + string.digits]) < len(sent) // 2:
-            tokenized_filtered += sent + "\n"
+    tokenized_filtered = drop_punctuation_lines(tokenized_segs)
     tmp_file_origtext.write(tokenized_filtered.encode())
     content_tokenized = base64.b64decode(encodedtokenized)
     tmp_file.write(content_tokenized)
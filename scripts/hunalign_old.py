@@ -3,6 +3,7 @@
 
 # 1. Reading from STDIN a set of aligned documents. The input format is:
 #   filename1	filename2	clean_text1_in_base64	clean_text2_in_base64
+#   or the same fields as framed records (align_documents_by_url.py --framed), with the texts not encoded
 # 2. Text is cleaned and, for every aligned pair, both texts are dumped, in the same order in two temporary files.
 # Every text block is sepparated to the previous one by a block:
 #    <p>
@@ -19,12 +20,15 @@
 import sys
 import os
 import argparse
-import base64
 import subprocess
 import re
 import traceback
 from tempfile import NamedTemporaryFile
-from external_processor import ExternalTextProcessor
+from external_processor import get_text_processor
+from pair_executor import PairExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import read_records, decode_document
 
 
 def run_aligner(filename_s, filename_t, dic, hunaligndir):
@@ -60,13 +64,13 @@ def run_analyse(morph, text):
 
 
 def extract_encoded_text(encodedtext, tmp_file, tmp_file_origtext, morphanal, sent_tokeniser, word_tokeniser):
-    proc_sent = ExternalTextProcessor(sent_tokeniser.split(' '))
-    content = base64.b64decode(encodedtext).decode("utf-8").replace("\t", " ")
+    proc_sent = get_text_processor(sent_tokeniser.split(' '), options.persistent, "sentinel")
+    content = decode_document(encodedtext).replace("\t", " ")
     tokenized_segs = proc_sent.process(content).strip()
     tmp_file_origtext.write(tokenized_segs.encode())
 
     if word_tokeniser:
-        proc_word = ExternalTextProcessor(word_tokeniser.split(' '))
+        proc_word = get_text_processor(word_tokeniser.split(' '), options.persistent, "lines")
         tokenized_text = proc_word.process(tokenized_segs)
         if morphanal is not None:
             morphanalyser = ["/bin/bash", morphanal]
@@ -77,7 +81,7 @@ def extract_encoded_text(encodedtext, tmp_file, tmp_file_origtext, morphanal, se
     tmp_file.write(tokenized_text.lower().encode())
 
 
-def align(file1, file2, file1orig, file2orig, dic):
+def align(file1, file2, file1orig, file2orig, dic, filename1, filename2):
     filereader1 = open(file1orig, "r")
     filereader2 = open(file2orig, "r")
 
@@ -162,23 +166,22 @@ oparser.add_argument("--word-tokeniser_sl",
                      help="Path to the word tokeniser for SL", dest="wordtok1", default=None)
 oparser.add_argument("--word-tokeniser_tl",
                      help="Path to the word tokeniser for TL", dest="wordtok2", default=None)
+oparser.add_argument("--persistent", action="store_true", default=False,
+                     help="Keep the sentence splitters and word tokenisers running instead of starting them for every "
+                          "document (they must flush their output after every line, e.g. the -b option of Moses)")
+oparser.add_argument("-j", "--jobs", type=int, default=1,
+                     help="Number of worker processes aligning document pairs; the output is in the order of the input")
 
 options = oparser.parse_args()
 
-if options.aligned_docs is None:
-    reader_list = sys.stdin
-else:
-    reader_list = open(options.aligned_docs, "r")
 
-for line in reader_list:
+def align_pair(fields):
     tmp_file1 = NamedTemporaryFile(delete=False, dir=options.tmpdir)
     tmp_file2 = NamedTemporaryFile(delete=False, dir=options.tmpdir)
     tmp_file1_origtext = NamedTemporaryFile(delete=False, dir=options.tmpdir)
     tmp_file2_origtext = NamedTemporaryFile(delete=False, dir=options.tmpdir)
 
-    fields = line.split("\t")
-    filename1 = fields[0]
-    filename2 = fields[1]
+    filename1, filename2 = (field.decode() if isinstance(field, bytes) else field for field in fields[:2])
     encodedtext1 = fields[2]
     encodedtext2 = fields[3]
 
@@ -198,7 +201,8 @@ for line in reader_list:
         tmp_file2.close()
         tmp_file2_origtext.close()
 
-        align(tmp_file1_name, tmp_file2_name, tmp_file1_orig_name, tmp_file2_orig_name, options.dic)
+        align(tmp_file1_name, tmp_file2_name, tmp_file1_orig_name, tmp_file2_orig_name, options.dic, filename1,
+              filename2)
     except UnicodeDecodeError:
         traceback.print_exc()
     finally:
@@ -206,3 +210,11 @@ for line in reader_list:
         os.remove(tmp_file1_origtext.name)
         os.remove(tmp_file2.name)
         os.remove(tmp_file2_origtext.name)
+
+
+if options.aligned_docs is None:
+    reader_list = read_records(sys.stdin.buffer)
+else:
+    reader_list = read_records(open(options.aligned_docs, "rb"))
+
+PairExecutor(align_pair, options.jobs).run((fields,) for fields in reader_list)
@@ -5,9 +5,14 @@ import click
 import os
 import subprocess
 
+from functools import partial
 from tempfile import NamedTemporaryFile
 from tqdm import tqdm
-from external_processor import ExternalTextProcessor
+from external_processor import get_text_processor
+from pair_executor import PairExecutor
+
+# keep the tokenizers running between calls, set by --persistent
+PERSISTENT = False
 
 
 def align(doc,
@@ -216,7 +221,7 @@ def hunalign(file1, file2, file1orig, file2orig, filename1, filename2, hundir, h
 
 
 def sent_tokenize(text, senttok):
-    proc_sent = ExternalTextProcessor(senttok.split(' '))
+    proc_sent = get_text_processor(senttok.split(' '), PERSISTENT, "sentinel")
     # content = base64.b64decode(text).decode("utf-8").replace("\t", " ")
     content = text.replace("\t", " ")
     sents = proc_sent.process(content).strip()
@@ -225,7 +230,7 @@ def sent_tokenize(text, senttok):
 
 
 def word_tokenize(sents, wordtok):
-    proc_word = ExternalTextProcessor(wordtok.split(' '))
+    proc_word = get_text_processor(wordtok.split(' '), PERSISTENT, "lines")
     ret = []
     for sent in sents:
         words = proc_word.process(sent)
@@ -272,6 +277,10 @@ def run_hunaligner(filename_s, filename_t, dic, hunaligndir):
 @click.option("--cost_threshould", default=0.01, help="")
 @click.option("--loosy", is_flag=True, default=True, help="")
 @click.option("--batch_size", default=10, help="")
+@click.option("--persistent", is_flag=True, default=False,
+              help="Keep the sentence splitters and word tokenizers running instead of starting them for every call")
+@click.option("--jobs", "-j", default=1,
+              help="Number of worker processes aligning document pairs; the output is in the order of the input")
 def main(align_ann,
          align_data,
          hunalign_dir,
@@ -286,12 +295,16 @@ def main(align_ann,
          dp_threshould,
          cost_threshould,
          loosy,
-         batch_size):
+         batch_size,
+         persistent,
+         jobs):
+    global PERSISTENT
+    PERSISTENT = persistent
 
     with open(align_data) as datain:
         all_doc = [line.strip() for line in datain.readlines()]
 
-    with open(align_ann) as annin:
+    def read_pairs(annin):
         for ann in tqdm([ann for ann in annin]):
             ann = ann.strip().split("\t")
             url1 = ann[0]
@@ -307,16 +320,19 @@ def main(align_ann,
 
             doc = all_doc[offset:offset+n_lines]
 
-            align(doc,
-                  url1, url2,
-                  src_len, tgt_len,
-                  sent_tokenizer1, sent_tokenizer2,
-                  morph_analyzer1, morph_analyzer2,
-                  word_tokenizer1, word_tokenizer2,
-                  hunalign_dir, hunalign_dic,
-                  tmp_dir,
-                  cost_threshould,
-                  loosy, batch_size)
+            yield doc, url1, url2, src_len, tgt_len
+
+    align_pair = partial(align,
+                         src_senttok=sent_tokenizer1, tgt_senttok=sent_tokenizer2,
+                         src_morph=morph_analyzer1, tgt_morph=morph_analyzer2,
+                         src_wordtok=word_tokenizer1, tgt_wordtok=word_tokenizer2,
+                         hundir=hunalign_dir, hundic=hunalign_dic,
+                         tmp_dir=tmp_dir,
+                         cost_threshould=cost_threshould,
+                         loosy=loosy, batch_size=batch_size)
+
+    with open(align_ann) as annin:
+        PairExecutor(align_pair, jobs).run(read_pairs(annin))
 
 
 if __name__ == "__main__":
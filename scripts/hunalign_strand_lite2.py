@@ -7,7 +7,7 @@ import subprocess
 
 from tempfile import NamedTemporaryFile
 from tqdm import tqdm
-from external_processor import ExternalTextProcessor
+from external_processor import get_text_processor
 
 
 def align(doc,
@@ -206,7 +206,7 @@ def hunalign(file1, file2, file1orig, file2orig, filename1, filename2, hundir, h
 
 
 def sent_tokenize(text, senttok):
-    proc_sent = ExternalTextProcessor(senttok.split(' '))
+    proc_sent = get_text_processor(senttok.split(' '), framing="sentinel")
     # content = base64.b64decode(text).decode("utf-8").replace("\t", " ")
     content = text.replace("\t", " ")
     sents = proc_sent.process(content).strip()
@@ -215,7 +215,7 @@ def sent_tokenize(text, senttok):
 
 
 def word_tokenize(sents, wordtok):
-    proc_word = ExternalTextProcessor(wordtok.split(' '))
+    proc_word = get_text_processor(wordtok.split(' '), framing="lines")
     ret = []
     for sent in sents:
         words = proc_word.process(sent)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+
+from contextlib import ExitStack
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_records, open_documents, is_framed_file, pack_record, unpack_records, encode_document, \
+    IndexedDocumentReader
+
+
+def read_pairs(path):
+    pairs = []
+    # tab-separated or framed (align_documents_by_url.py --framed) document alignments
+    with open_records(path) as reader:
+        for fields in reader:
+            pairs.append((int(fields[0]), int(fields[1])))
+    return pairs
+
+
+def merge_join(indices, paths):
+    # Walk the line-aligned column files once, following a non-decreasing sequence of 1-based document
+    # indices. Documents past the end of the files get empty columns, like `sed -n "${n}p"` used to give.
+    with ExitStack() as stack:
+        readers = [stack.enter_context(open_documents(path)) for path in paths]
+        empty = tuple("" for _ in paths)
+        columns = empty
+        current = 0
+        for n in indices:
+            while current < n:
+                columns = tuple(next(reader, "") for reader in readers)
+                current += 1
+            yield n, columns if n > 0 else empty
+
+
+class DocumentSpool(object):
+    """Columns of the requested documents, read in one streaming pass and kept in a temporary file.
+
+    Only the offsets of the requested documents stay in memory, the documents themselves are read back
+    from disk when they are needed.
+    """
+
+    def __init__(self, indices, paths, tmp_dir=None):
+        # columns are kept as framed records, and the ones of line files are turned back into str when read
+        self.framed = [is_framed_file(path) for path in paths]
+        self.offsets = {}
+        self.spool = tempfile.TemporaryFile(dir=tmp_dir)
+        for n, columns in merge_join(sorted(set(indices)), paths):
+            data = pack_record(columns)
+            self.offsets[n] = (self.spool.tell(), len(data))
+            self.spool.write(data)
+
+    def __getitem__(self, n):
+        offset, length = self.offsets[n]
+        self.spool.seek(offset)
+        fields = unpack_records(self.spool.read(length))[0]
+        return tuple(field if framed else field.decode("utf-8") for field, framed in zip(fields, self.framed))
+
+    def close(self):
+        self.spool.close()
+
+
+def join(pairs, paths1, paths2, tmp_dir=None):
+    if all(IndexedDocumentReader.has_index(path) for path in paths1 + paths2):
+        # block-indexed outputs of warc2preprocess: fetch just the aligned documents
+        readers1 = [IndexedDocumentReader(path) for path in paths1]
+        readers2 = [IndexedDocumentReader(path) for path in paths2]
+        try:
+            for n1, n2 in pairs:
+                yield n1, tuple(r.get(n1) for r in readers1), n2, tuple(r.get(n2) for r in readers2)
+        finally:
+            for reader in readers1 + readers2:
+                reader.close()
+        return
+
+    spool2 = DocumentSpool([n2 for _, n2 in pairs], paths2, tmp_dir)
+    try:
+        indices1 = [n1 for n1, _ in pairs]
+        if all(a <= b for a, b in zip(indices1, indices1[1:])):
+            # document alignments are written in lang1 order, so lang1 is merge-joined without spooling
+            for (n1, columns1), (_, n2) in zip(merge_join(indices1, paths1), pairs):
+                yield n1, columns1, n2, spool2[n2]
+        else:
+            spool1 = DocumentSpool(indices1, paths1, tmp_dir)
+            try:
+                for n1, n2 in pairs:
+                    yield n1, spool1[n1], n2, spool2[n2]
+            finally:
+                spool1.close()
+    finally:
+        spool2.close()
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Tool that joins the document pairs produced by the document aligner with the URL and HTML of "
+                    "each document, reading every file only once. It writes the input expected by strand-align "
+                    "('strand' format) or by prepare_laser_mine.py ('laser' format) to the standard output.")
+    oparser.add_argument("--format", dest="format", choices=["strand", "laser"], required=True,
+                         help="Output format")
+    oparser.add_argument("--docalign", dest="docalign", required=True,
+                         help="Document alignment file, with the document indices in the first two columns")
+    oparser.add_argument("--lang1", dest="lang1", help="Language code of LANG1 (strand format)")
+    oparser.add_argument("--lang2", dest="lang2", help="Language code of LANG2 (strand format)")
+    oparser.add_argument("--url1", dest="url1", help="File with the URL of every document in LANG1 (strand format)")
+    oparser.add_argument("--url2", dest="url2", help="File with the URL of every document in LANG2 (strand format)")
+    oparser.add_argument("--html1", dest="html1", required=True,
+                         help="File with the HTML of every document in LANG1 (base64 lines or framed)")
+    oparser.add_argument("--html2", dest="html2", required=True,
+                         help="File with the HTML of every document in LANG2 (base64 lines or framed)")
+    oparser.add_argument("-t", "--tmp-dir", dest="tmpdir", default=None,
+                         help="Temporary directory for the documents that are read ahead")
+    options = oparser.parse_args()
+
+    if options.format == "strand":
+        if not (options.lang1 and options.lang2 and options.url1 and options.url2):
+            oparser.error("--lang1, --lang2, --url1 and --url2 are required by the strand format")
+        paths1 = [options.url1, options.html1]
+        paths2 = [options.url2, options.html2]
+    else:
+        paths1 = [options.html1]
+        paths2 = [options.html2]
+
+    for n1, columns1, n2, columns2 in join(read_pairs(options.docalign), paths1, paths2, options.tmpdir):
+        if options.format == "strand":
+            # strand-align -ib64 reads base64 documents, whatever the format of the HTML files
+            print("k\t{0}\t{1}\t{2}\t{3}\t{4}\t{5}".format(options.lang1, columns1[0], encode_document(columns1[1]),
+                                                            options.lang2, columns2[0], encode_document(columns2[1])))
+        else:
+            print("{0}\t{1}\t{2}\t{3}".format(n1, n2, encode_document(columns1[0]), encode_document(columns2[0])))
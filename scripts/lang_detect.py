@@ -0,0 +1,93 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Language identification of the HTML documents of warc2preprocess.py. With a sample size, the language of a long
+# document is first detected on its head, middle and tail windows only; the whole document is read when the
+# detector is not confident about the sample (not reliable, or less than min_percent of the sample in the
+# language found).
+
+
+class PrintableTable(dict):
+    """str.translate() table that deletes the characters that are not printable, filled the first time every
+    character is seen. It gives the same text as ''.join(x for x in data if x.isprintable()) without running
+    Python code for every character of the document."""
+
+    def __missing__(self, code):
+        value = code if chr(code).isprintable() else None
+        self[code] = value
+        return value
+
+
+PRINTABLE = PrintableTable()
+# the scripts up to CJK are filled now, so that they are shared by the forked workers of warc2preprocess.py
+for _code in range(0x3000):
+    PRINTABLE[_code]
+
+
+def printable(data):
+    return data.translate(PRINTABLE)
+
+
+def sample_windows(data, size):
+    """Head, middle and tail windows of size characters of data. The windows are cut after a tag end and before a
+    tag start when there is one near the cut, so that cld2 does not read half tags as text."""
+    n = len(data)
+    margin = size // 4
+    windows = []
+    for start in (0, (n - size) // 2, n - size):
+        stop = start + size
+        if start > 0:
+            cut = data.find(">", start, start + margin)
+            if cut != -1:
+                start = cut + 1
+        if stop < n:
+            cut = data.rfind("<", stop - margin, stop)
+            if cut != -1:
+                stop = cut
+        windows.append(data[start:stop])
+    return "\n".join(windows)
+
+
+class LanguageDetector(object):
+    def __init__(self, langid="cld2", sample_size=0, min_percent=80):
+        self.langid = langid
+        self.sample_size = sample_size
+        self.min_percent = min_percent
+        if langid == "cld3":
+            import cld3
+            self.model = cld3.LanguageIdentifier()
+        else:
+            import pycld2
+            self.model = pycld2
+
+    def detect_cld2(self, data):
+        reliable, text_bytes, detected_languages = self.model.detect(printable(data), isPlainText=False)
+        return detected_languages[0][1], reliable and detected_languages[0][2] >= self.min_percent
+
+    def detect_cld3(self, data):
+        language, probability, reliable, proportion = self.model.get_language(data)
+        return language, reliable and proportion * 100 >= self.min_percent
+
+    def detect(self, data):
+        """Language of data and whether it was detected on a sample only."""
+        detect = self.detect_cld3 if self.langid == "cld3" else self.detect_cld2
+        if self.sample_size and len(data) > 3 * self.sample_size:
+            lang, confident = detect(sample_windows(data, self.sample_size))
+            if confident:
+                return lang, True
+        return detect(data)[0], False
+
+    def __call__(self, data):
+        return self.detect(data)[0]
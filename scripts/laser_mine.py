@@ -2,7 +2,6 @@
 
 import click
 import faiss
-import lzma
 import numpy as np
 import os
 import re
@@ -22,10 +21,17 @@ LASER = os.environ['LASER']
 sys.path.append(LASER + '/source')
 sys.path.append(LASER + '/source/lib')
 sys.path.append(LASER + '/source/tools')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_compressed  # noqa
 from embed import SentenceEncoder, EncodeLoad, EncodeFile, EmbedLoad, buffered_read, buffered_arange, convert_padding_direction, Encoder, EncodeTime, EncodeFilep, EmbedMmap  # noqa
 from mine_bitexts import TextLoadUnify, knn, knnGPU, knnCPU, score, score_candidates
 from text_processing import Token, BPEfastApply  # noqa
 
+from embedding_cache import EmbeddingCache, sentence_key
+
+# number of consecutive document pairs that are grouped into batches by size
+BATCH_WINDOW = 4096
+
 
 ###############################################################################
 #
@@ -33,7 +39,7 @@ from text_processing import Token, BPEfastApply  # noqa
 #
 ###############################################################################
 
-def Embed(tmpdir, ifname, encoder, token_lang, bpe_codes, buffer_size, verbose):
+def Embed(tmpdir, ifname, encoder, token_lang, bpe_codes, buffer_size, verbose, cache=None, cache_lang=None):
     output = os.path.join(tmpdir, 'emb')
 
     if token_lang != '--':
@@ -54,21 +60,79 @@ def Embed(tmpdir, ifname, encoder, token_lang, bpe_codes, buffer_size, verbose):
                      verbose=verbose, over_write=False)
         ifname = bpe_fname
 
-    EncodeFile(encoder,
-               ifname,
-               output,
-               verbose=verbose, over_write=False,
-               buffer_size=buffer_size)
+    if cache is None:
+        EncodeFile(encoder,
+                   ifname,
+                   output,
+                   verbose=verbose, over_write=False,
+                   buffer_size=buffer_size)
+    else:
+        EncodeCached(encoder,
+                     ifname,
+                     output,
+                     cache,
+                     cache_lang,
+                     buffer_size=buffer_size,
+                     verbose=verbose)
 
     return output
 
 
+def EncodeCached(encoder, ifname, ofname, cache, lang, buffer_size=10000, verbose=False):
+    # same output as EncodeFile, but only the sentences missing from the cache are sent to the encoder
+    hits, n = cache.hits, 0
+    with open(ifname, encoding='utf-8', errors='surrogateescape') as fin, open(ofname, 'wb') as fout:
+        for sentences in buffered_read(fin, buffer_size):
+            keys = np.array([sentence_key(lang, sent) for sent in sentences], dtype=np.uint64)
+            found, cached = cache.lookup(keys)
+            missing = {}
+            for i in np.flatnonzero(~found):
+                missing.setdefault(sentences[i], []).append(i)
+            encoded = np.empty((len(sentences), cached.shape[1]), dtype=np.float32)
+            encoded[found] = cached
+            if missing:
+                new = encoder.encode_sentences(list(missing.keys()))
+                for vector, rows in zip(new, missing.values()):
+                    encoded[rows] = vector
+                cache.add([keys[rows[0]] for rows in missing.values()], new)
+            encoded.tofile(fout)
+            n += len(sentences)
+    if verbose:
+        print(' - Encoder: {:d} sentences, {:d} from the cache'.format(n, cache.hits - hits), file=sys.stderr)
+
+
 ###############################################################################
 #
 # Mine Main
 #
 ###############################################################################
 
+def unique_embeddings(emb, ind, verbose=False):
+    aux = {j: i for i, j in enumerate(ind)}
+    if verbose:
+        print(' - unify embeddings: {:d} -> {:d}'.format(len(emb), len(aux)), file=sys.stderr)
+    return emb[[aux[i] for i in range(len(aux))]]
+
+
+def TextUnify(sents, unify):
+    # in-memory version of TextLoadUnify for the sentences of a single document
+    inds = []
+    unique_sents = []
+    sent2ind = {}
+    for sent in sents:
+        new_ind = len(sent2ind)
+        inds.append(sent2ind.setdefault(sent, new_ind))
+        if not unify or inds[-1] == new_ind:
+            unique_sents.append(sent)
+    return inds, unique_sents
+
+
+def OpenOutput(output, encoding):
+    if output:
+        return open_compressed(output, mode='at', encoding=encoding, errors='surrogateescape')
+    return sys.stdout
+
+
 def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embeddings, output, unify, mode, retrieval, margin, neighborhood, gpu, dim, threshold, verbose):
     print('LASER: tool to search, score or mine bitexts', file=sys.stderr)
     if gpu:
@@ -80,12 +144,6 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
     src_inds, src_sents = TextLoadUnify(src, args)
     trg_inds, trg_sents = TextLoadUnify(trg, args)
 
-    def unique_embeddings(emb, ind, verbose=False):
-        aux = {j: i for i, j in enumerate(ind)}
-        if verbose:
-            print(' - unify embeddings: {:d} -> {:d}'.format(len(emb), len(aux)), file=sys.stderr)
-        return emb[[aux[i] for i in range(len(aux))]]
-
     # load the embeddings
     x = EmbedLoad(src_embeddings, dim, verbose=verbose)
     if unify:
@@ -96,6 +154,32 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
         y = unique_embeddings(y, trg_inds, verbose)
     faiss.normalize_L2(y)
 
+    fout = OpenOutput(output, encoding)
+    MineEmbeddings(src_doc_ind, trg_doc_ind, src_inds, src_sents, trg_inds, trg_sents, x, y, fout,
+                   output if output else "stdout", mode, retrieval, margin, neighborhood, gpu, threshold, verbose)
+    if fout != sys.stdout:
+        fout.close()
+
+
+def MineDocument(src_doc_ind, trg_doc_ind, src_sents, trg_sents, x, y, fout, output, unify, mode, retrieval, margin, neighborhood, gpu, threshold, verbose):
+    # x and y are the rows of the host embedding matrices that belong to this document pair
+    src_inds, src_sents = TextUnify(src_sents, unify)
+    trg_inds, trg_sents = TextUnify(trg_sents, unify)
+
+    x = np.array(x, dtype=np.float32)
+    if unify:
+        x = unique_embeddings(x, src_inds, verbose)
+    faiss.normalize_L2(x)
+    y = np.array(y, dtype=np.float32)
+    if unify:
+        y = unique_embeddings(y, trg_inds, verbose)
+    faiss.normalize_L2(y)
+
+    MineEmbeddings(src_doc_ind, trg_doc_ind, src_inds, src_sents, trg_inds, trg_sents, x, y, fout,
+                   output, mode, retrieval, margin, neighborhood, gpu, threshold, verbose)
+
+
+def MineEmbeddings(src_doc_ind, trg_doc_ind, src_inds, src_sents, trg_inds, trg_sents, x, y, fout, output, mode, retrieval, margin, neighborhood, gpu, threshold, verbose):
     # calculate knn in both directions
     if retrieval != 'bwd':
         if verbose:
@@ -110,21 +194,7 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
         y2x_mean = y2x_sim.mean(axis=1)
 
     # margin function
-    if margin == 'absolute':
-        def margin(a, b): return a
-    elif margin == 'distance':
-        def margin(a, b): return a - b
-    else:  # margin == 'ratio':
-        def margin(a, b): return a / b
-
-    if output:
-        if output.endswith('.xz'):
-            fout = lzma.open(output, mode='at', encoding=encoding,  errors='surrogateescape')
-        else:
-            fout = open(output, mode='a', encoding=encoding, errors='surrogateescape')
-    else:
-        output = "stdout"
-        fout = sys.stdout
+    margin = MarginFunction(margin)
 
     if mode == 'search':
         if verbose:
@@ -156,32 +226,171 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
             print(' - writing alignments to {:s}'.format(output), file=sys.stderr)
             if threshold > 0:
                 print(' - with threshold of {:f}'.format(threshold), file=sys.stderr)
-        if retrieval == 'fwd':
-            for i, j in enumerate(fwd_best):
-                print(fwd_scores[i].max(), src_sents[i], trg_sents[j], sep='\t', file=fout)
-        if retrieval == 'bwd':
-            for j, i in enumerate(bwd_best):
-                print(bwd_scores[j].max(), src_sents[i], trg_sents[j], sep='\t', file=fout)
-        if retrieval == 'intersect':
-            for i, j in enumerate(fwd_best):
-                if bwd_best[j] == i:
-                    print(fwd_scores[i].max(), src_sents[i], trg_sents[j], sep='\t', file=fout)
-        if retrieval == 'max':
-            indices = np.stack((np.concatenate((np.arange(x.shape[0]), bwd_best)),
-                                np.concatenate((fwd_best, np.arange(y.shape[0])))), axis=1)
-            scores = np.concatenate((fwd_scores.max(axis=1), bwd_scores.max(axis=1)))
-            seen_src, seen_trg = set(), set()
-            for i in np.argsort(-scores):
-                src_ind, trg_ind = indices[i]
-                if src_ind not in seen_src and trg_ind not in seen_trg:
-                    seen_src.add(src_ind)
-                    seen_trg.add(trg_ind)
-                    if scores[i] > threshold:
-                        print(src_doc_ind, trg_doc_ind, src_sents[src_ind], trg_sents[trg_ind], scores[i],
-                              sep='\t', file=fout)
+        WriteMined(src_doc_ind, trg_doc_ind, src_sents, trg_sents,
+                   fwd_best, fwd_scores.max(axis=1), bwd_best, bwd_scores.max(axis=1), fout, retrieval, threshold)
+
+
+def WriteMined(src_doc_ind, trg_doc_ind, src_sents, trg_sents, fwd_best, fwd_max, bwd_best, bwd_max, fout, retrieval, threshold):
+    if retrieval == 'fwd':
+        for i, j in enumerate(fwd_best):
+            print(fwd_max[i], src_sents[i], trg_sents[j], sep='\t', file=fout)
+    if retrieval == 'bwd':
+        for j, i in enumerate(bwd_best):
+            print(bwd_max[j], src_sents[i], trg_sents[j], sep='\t', file=fout)
+    if retrieval == 'intersect':
+        for i, j in enumerate(fwd_best):
+            if bwd_best[j] == i:
+                print(fwd_max[i], src_sents[i], trg_sents[j], sep='\t', file=fout)
+    if retrieval == 'max':
+        indices = np.stack((np.concatenate((np.arange(len(fwd_best)), bwd_best)),
+                            np.concatenate((fwd_best, np.arange(len(bwd_best))))), axis=1)
+        scores = np.concatenate((fwd_max, bwd_max))
+        seen_src, seen_trg = set(), set()
+        for i in np.argsort(-scores):
+            src_ind, trg_ind = indices[i]
+            if src_ind not in seen_src and trg_ind not in seen_trg:
+                seen_src.add(src_ind)
+                seen_trg.add(trg_ind)
+                if scores[i] > threshold:
+                    print(src_doc_ind, trg_doc_ind, src_sents[src_ind], trg_sents[trg_ind], scores[i],
+                          sep='\t', file=fout)
 
-    if fout != sys.stdout:
-        fout.close()
+
+###############################################################################
+#
+# Batched mining of many small documents
+#
+###############################################################################
+
+def MarginFunction(margin):
+    if margin == 'absolute':
+        return lambda a, b: a
+    elif margin == 'distance':
+        return lambda a, b: a - b
+    else:  # margin == 'ratio':
+        return lambda a, b: a / b
+
+
+def BatchNormalize(x):
+    # faiss.normalize_L2 over the last axis, zero (padding) rows are left untouched
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    np.divide(x, norms, out=x, where=norms > 0)
+    return x
+
+
+def BatchKnn(sim, lens, k):
+    # sim is (B, n, m) with the columns past lens[b] set to -inf. Returns the top-k similarities and
+    # indices sorted by decreasing similarity, the mask of the neighbours that exist and their means,
+    # which are taken over min(k, lens[b]) neighbours like knn() does for a single document.
+    kk = min(k, sim.shape[2])
+    if kk < sim.shape[2]:
+        ind = np.argpartition(-sim, kk - 1, axis=2)[:, :, :kk]
+        top = np.take_along_axis(sim, ind, axis=2)
+    else:
+        ind = np.broadcast_to(np.arange(kk), sim.shape).copy()
+        top = sim.copy()
+    order = np.argsort(-top, axis=2, kind='stable')
+    ind = np.take_along_axis(ind, order, axis=2)
+    top = np.take_along_axis(top, order, axis=2)
+    k_eff = np.minimum(lens, k).astype(np.float32)
+    valid = np.arange(kk)[None, None, :] < k_eff[:, None, None]
+    mean = np.where(valid, top, 0).sum(axis=2, dtype=np.float32) / k_eff[:, None]
+    return top, ind, valid, mean
+
+
+def BatchScores(top, ind, valid, fwd_mean, bwd_mean, margin):
+    # margin scores of the candidates of every row, the best candidate and its score
+    bwd = np.take_along_axis(np.broadcast_to(bwd_mean[:, None, :], ind.shape[:2] + bwd_mean.shape[1:]),
+                             ind, axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = margin(top, (fwd_mean[:, :, None] + bwd) / 2)
+    scores = np.where(valid, scores, -np.inf)
+    pos = scores.argmax(axis=2)
+    best = np.take_along_axis(ind, pos[:, :, None], axis=2)[:, :, 0]
+    best_score = np.take_along_axis(scores, pos[:, :, None], axis=2)[:, :, 0].astype(np.float64)
+    return best, best_score
+
+
+def MineBatch(docs, x, y, neighborhood, margin):
+    # docs are (src_rows, trg_rows) arrays of row numbers in x and y, all documents are mined at once with
+    # a padded batch matrix product. Returns (fwd_best, fwd_max, bwd_best, bwd_max) for every document.
+    n = max(len(s) for s, _ in docs)
+    m = max(len(t) for _, t in docs)
+    xb = np.zeros((len(docs), n, x.shape[1]), dtype=np.float32)
+    yb = np.zeros((len(docs), m, y.shape[1]), dtype=np.float32)
+    for b, (s, t) in enumerate(docs):
+        xb[b, :len(s)] = x[s]
+        yb[b, :len(t)] = y[t]
+    BatchNormalize(xb)
+    BatchNormalize(yb)
+    x_lens = np.array([len(s) for s, _ in docs])
+    y_lens = np.array([len(t) for _, t in docs])
+
+    sim = np.matmul(xb, yb.transpose(0, 2, 1))
+    x2y_sim, x2y_ind, x2y_valid, x2y_mean = BatchKnn(
+        np.where(np.arange(m)[None, None, :] < y_lens[:, None, None], sim, -np.inf), y_lens, neighborhood)
+    sim = sim.transpose(0, 2, 1)
+    y2x_sim, y2x_ind, y2x_valid, y2x_mean = BatchKnn(
+        np.where(np.arange(n)[None, None, :] < x_lens[:, None, None], sim, -np.inf), x_lens, neighborhood)
+
+    fwd_best, fwd_max = BatchScores(x2y_sim, x2y_ind, x2y_valid, x2y_mean, y2x_mean, margin)
+    bwd_best, bwd_max = BatchScores(y2x_sim, y2x_ind, y2x_valid, y2x_mean, x2y_mean, margin)
+    return [(fwd_best[b, :len(s)], fwd_max[b, :len(s)], bwd_best[b, :len(t)], bwd_max[b, :len(t)])
+            for b, (s, t) in enumerate(docs)]
+
+
+def DocumentRows(sents, offset, unify):
+    # unified sentences of a document and the rows of the host embedding matrix that hold them
+    inds, unique_sents = TextUnify(sents, unify)
+    rows = np.arange(offset, offset + len(sents))
+    if unify:
+        rows = unique_embeddings(rows, inds)
+    return unique_sents, rows
+
+
+def MineBatched(doc_offset, src_sents, tgt_sents, x, y, fout, output, unify, mode, retrieval, margin, neighborhood, gpu, threshold, knn_block, knn_batch_rows, verbose):
+    # Document pairs whose documents have at most knn_block unified sentences are mined together with the
+    # padded matmul kernel, the larger ones one by one with faiss. Pairs are grouped by size inside windows
+    # of consecutive pairs, and written in their original order.
+    margin_fn = MarginFunction(margin)
+    n_batched, n_faiss, n_batches = 0, 0, 0
+    for start in range(0, len(doc_offset), BATCH_WINDOW):
+        window = []
+        for s_ind, s_off, s_len, t_ind, t_off, t_len in doc_offset[start:start+BATCH_WINDOW]:
+            if s_len == 0 or t_len == 0:
+                continue
+            s_sents, s_rows = DocumentRows(src_sents[s_off:s_off+s_len], s_off, unify)
+            t_sents, t_rows = DocumentRows(tgt_sents[t_off:t_off+t_len], t_off, unify)
+            window.append((s_ind, t_ind, s_sents, t_sents, s_rows, t_rows))
+
+        small = [d for d, doc in enumerate(window) if max(len(doc[4]), len(doc[5])) <= knn_block]
+        small.sort(key=lambda d: (max(len(window[d][4]), len(window[d][5])), d))
+        results = {}
+        batch = []
+        for d in small + [None]:
+            if d is not None:
+                size = max(len(window[d][4]), len(window[d][5]))
+                if not batch or (len(batch) + 1) * size <= knn_batch_rows:
+                    batch.append(d)
+                    continue
+            if batch:
+                docs = [(window[b][4], window[b][5]) for b in batch]
+                results.update(zip(batch, MineBatch(docs, x, y, neighborhood, margin_fn)))
+                n_batches += 1
+            batch = [d]
+
+        for d, (s_ind, t_ind, s_sents, t_sents, s_rows, t_rows) in enumerate(window):
+            if d in results:
+                WriteMined(s_ind, t_ind, s_sents, t_sents, *results[d], fout, retrieval, threshold)
+                n_batched += 1
+            else:
+                MineDocument(s_ind, t_ind, s_sents, t_sents, x[s_rows], y[t_rows], fout, output, False,
+                             mode, retrieval, margin, neighborhood, gpu, threshold, verbose)
+                n_faiss += 1
+
+    if verbose:
+        print(' - mined {:d} document pairs in {:d} batches, {:d} with faiss'.format(n_batched, n_batches, n_faiss),
+              file=sys.stderr)
 
 
 @click.command()
@@ -199,6 +408,10 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
 @click.option("--max_tokens", type=int, default=12000, help="Maximum number of tokens to process in a batch")
 @click.option("--max_sentences", type=int, default=None, help="Maximum number of sentences to process in a batch")
 @click.option("--enc_cpu/--enc_gpu", is_flag=True, default=True, help="Use GPU to encode sentences")
+@click.option("--embed_once", is_flag=True, default=False,
+              help="Embed the source and target files once and mine each document pair on its rows, given by --offset")
+@click.option("--embed_cache", default=None, help="Directory of a sentence embedding cache shared between runs")
+@click.option("--embed_cache_size", type=int, default=8192, help="Maximum size of the embedding cache (MB)")
 # mining params
 @click.option("--encoding", default="utf8", help="Character encoding for input/output")
 @click.option("--mode", type=click.Choice(["search", "score", "mine"]), default="mine", help="Execution mode")
@@ -207,14 +420,18 @@ def Mine(src_doc_ind, trg_doc_ind, src, trg, encoding, src_embeddings, trg_embed
 @click.option("--retrieval", type=click.Choice(["fwd", "bwd", "max", "intersect"]), default="max", help="Retrieval strategy")
 @click.option("--unify", is_flag=True, default=True, help="Unify texts")
 @click.option("--knn_gpu/--knn_cpu", is_flag=True, default=True, help="Run kbb on all available GPUs")
+@click.option("--knn_block", type=int, default=256,
+              help="With --embed_once, documents of up to this many sentences are mined in batches with an exact "
+                   "matrix product and larger ones with faiss (0 disables batching)")
+@click.option("--knn_batch_rows", type=int, default=16384, help="Maximum number of padded sentences per batch")
 @click.option("--stable", is_flag=True, default=False, help="Use stable merge sort instead of quick sort")
 @click.option("--dim", type=int, default=1024, help="Embedding dimensionality")
 @click.option("--threshold", type=float, default=0, help="Threshold on extracted bitexts")
 @click.option("--verbose", is_flag=True, default=False, help="Detailed output")
 @click.option("--output", help="Mining output")
 def mine(src, tgt, offset, slang, tlang, token_slang, token_tlang,
-         encoder, bpe_codes, buffer_size, max_tokens, max_sentences, enc_cpu,
-         encoding, mode, neighborhood, margin, retrieval, unify, knn_gpu, stable, dim, threshold, verbose, output):
+         encoder, bpe_codes, buffer_size, max_tokens, max_sentences, enc_cpu, embed_once, embed_cache, embed_cache_size,
+         encoding, mode, neighborhood, margin, retrieval, unify, knn_gpu, knn_block, knn_batch_rows, stable, dim, threshold, verbose, output):
 
     buffer_size = max(buffer_size, 1)
     assert not max_sentences or max_sentences <= buffer_size, \
@@ -223,13 +440,98 @@ def mine(src, tgt, offset, slang, tlang, token_slang, token_tlang,
     if verbose:
         print(' - Encoder: loading {}'.format(encoder))
 
+    cache = None
+    if embed_cache:
+        cache = EmbeddingCache(embed_cache, dim, max_size=embed_cache_size << 20, encoder=encoder)
+
     encoder = SentenceEncoder(encoder,
                               max_sentences=max_sentences,
                               max_tokens=max_tokens,
                               sort_kind='mergesort' if stable else 'quicksort',
                               cpu=enc_cpu)
 
-    if offset:
+    if offset and embed_once:
+        src_sents = [s.strip() for s in open(src)]
+        tgt_sents = [t.strip() for t in open(tgt)]
+        doc_offset = [(int(d[0]), int(d[1]), int(d[2]), int(d[3]), int(d[4]), int(d[5]))
+                      for d in [line.strip().split() for line in open(offset)]]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+
+            src_tmpdir_path = tmpdir_path / slang
+            tgt_tmpdir_path = tmpdir_path / tlang
+
+            src_tmpdir_path.mkdir()
+            tgt_tmpdir_path.mkdir()
+
+            # every sentence of the host is encoded exactly once, documents are mined on slices of the matrices
+            src_embeddings = Embed(src_tmpdir_path.__str__(),
+                                   src,
+                                   encoder,
+                                   slang if token_slang else "--",
+                                   bpe_codes,
+                                   buffer_size,
+                                   verbose,
+                                   cache=cache,
+                                   cache_lang=slang)
+            tgt_embeddings = Embed(tgt_tmpdir_path.__str__(),
+                                   tgt,
+                                   encoder,
+                                   tlang if token_tlang else "--",
+                                   bpe_codes,
+                                   buffer_size,
+                                   verbose,
+                                   cache=cache,
+                                   cache_lang=tlang)
+            x = EmbedMmap(src_embeddings, dim, verbose=verbose)
+            y = EmbedMmap(tgt_embeddings, dim, verbose=verbose)
+            assert x.shape[0] == len(src_sents) and y.shape[0] == len(tgt_sents), \
+                'number of embeddings and sentences differ'
+
+            fout = OpenOutput(output, encoding)
+            if mode == 'mine' and knn_block > 0:
+                MineBatched(doc_offset,
+                            src_sents,
+                            tgt_sents,
+                            x,
+                            y,
+                            fout,
+                            output if output else "stdout",
+                            unify,
+                            mode,
+                            retrieval,
+                            margin,
+                            neighborhood,
+                            knn_gpu,
+                            threshold,
+                            knn_block,
+                            knn_batch_rows,
+                            verbose)
+            else:
+                for s_ind, s_off, s_len, t_ind, t_off, t_len in doc_offset:
+                    if s_len == 0 or t_len == 0:
+                        continue
+                    MineDocument(s_ind,
+                                 t_ind,
+                                 src_sents[s_off:s_off+s_len],
+                                 tgt_sents[t_off:t_off+t_len],
+                                 x[s_off:s_off+s_len],
+                                 y[t_off:t_off+t_len],
+                                 fout,
+                                 output if output else "stdout",
+                                 unify,
+                                 mode,
+                                 retrieval,
+                                 margin,
+                                 neighborhood,
+                                 knn_gpu,
+                                 threshold,
+                                 verbose)
+            if fout != sys.stdout:
+                fout.close()
+
+    elif offset:
         src_sents = [s.strip() for s in open(src)]
         tgt_sents = [t.strip() for t in open(tgt)]
         # The doc-index starts at 1 for use with the -n option of sed
@@ -259,14 +561,18 @@ def mine(src, tgt, offset, slang, tlang, token_slang, token_tlang,
                                        slang if token_slang else "--",
                                        bpe_codes,
                                        buffer_size,
-                                       verbose)
+                                       verbose,
+                                       cache=cache,
+                                       cache_lang=slang)
                 tgt_embeddings = Embed(tgt_tmpdir_path.__str__(),
                                        tgt_txt.__str__(),
                                        encoder,
                                        tlang if token_tlang else "--",
                                        bpe_codes,
                                        buffer_size,
-                                       verbose)
+                                       verbose,
+                                       cache=cache,
+                                       cache_lang=tlang)
 
                 # mine_output = tmpdir_path / "mine"
 
@@ -293,6 +599,11 @@ def mine(src, tgt, offset, slang, tlang, token_slang, token_tlang,
         src_embeddings = Embed(src, slang if token_slang else "--")
         src_embeddings = Embed(tgt, tlang if token_tlang else "--")
 
+    if cache is not None:
+        cache.close()
+        if verbose:
+            print(' - Embedding cache: {:d} hits, {:d} misses'.format(cache.hits, cache.misses), file=sys.stderr)
+
 
 if __name__ == "__main__":
     mine()
@@ -1,8 +1,8 @@
 import click
-import lzma
 import MeCab
 import numpy as np
 import fasttext
+import os
 import re
 import sys
 
@@ -11,6 +11,9 @@ from tqdm import tqdm
 from mosestokenizer import MosesTokenizer
 from external_processor import ExternalTextProcessor
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_compressed
+
 re_ascii_text = re.compile(r"['!\"#$%&()*+,-./:;<=>?@\[\\\]^_`{|}~\t\s0-9]+")
 re_ascii_char = re.compile(r"['!\"#$%&()*+,-./:;<=>?@\[\\\]^_`{|}~0-9]")
 
@@ -55,15 +58,12 @@ def is_ascii_artistic(sent, tokenize, std_threshould=6.0):
 def main(inp, lid, lid_model, lang1, lang2, tokenizer1, tokenizer2, err_out):
     try:
         if inp:
-            if inp[-2:] == "xz":
-                reader = lzma.open(inp)
-            else:
-                reader = open(inp)
+            reader = open_compressed(inp, "rt")
         else:
             reader = sys.stdin
 
         if err_out:
-            err = lzma.open(err_out, "wt")
+            err = open_compressed(err_out, "wt")
         else:
             err = sys.stderr
 
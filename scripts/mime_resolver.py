@@ -0,0 +1,98 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# MIME type of the documents of warc2preprocess.py, without running libmagic on every document. The first
+# characters of the document (4096 by default) are sniffed for the markers libmagic looks for (an XML declaration,
+# or html, head, title, script, style, table and a href tags), and the document gets the type libmagic gives to
+# that kind of document: text/html, text/xml or text/plain. An HTML or XML type declared by the WARC/HTTP header
+# is trusted without sniffing (source "header") and written as text/html or text/xml, like libmagic would; the
+# other documents are sniffed (source "sniffed"), and libmagic runs only when the sniffed part has markup but none
+# of the markers. libmagic is imported and loaded the first time it is needed.
+
+import re
+import sys
+from collections import Counter
+
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+XML_TYPES = {"text/xml", "application/xml", "application/xhtml+xml", "application/rss+xml", "application/atom+xml"}
+SOURCES = ("header", "sniffed", "libmagic")
+# the types libmagic gives to the kinds of documents
+KIND_TYPES = {"html": "text/html", "xml": "text/xml", "text": "text/plain"}
+# the kind of the documents whose declared type is trusted (XHTML is HTML)
+TRUSTED_KINDS = dict([(t, "xml") for t in XML_TYPES - HTML_TYPES] + [(t, "html") for t in HTML_TYPES])
+
+re_html = re.compile(r"<(?:!doctype\s+html|html|head|title|script|style|table|a\s+href)\b", re.IGNORECASE)
+
+
+def media_type(content_type):
+    """The type/subtype of a Content-Type header, lowercased, without its parameters."""
+    if not content_type:
+        return None
+    return content_type.split(";", 1)[0].strip().lower() or None
+
+
+def sniff(head):
+    """The kind of a document from its first characters: 'xml', 'html', 'text' when it has no markup at all, or
+    None when it has markup that libmagic has to look at."""
+    if head.lstrip("\ufeff \t\r\n").startswith("<?xml"):
+        return "xml"
+    if re_html.search(head):
+        return "html"
+    if "<" not in head:
+        return "text"
+    return None
+
+
+_magic = None
+
+
+def libmagic_type(text):
+    global _magic
+    if _magic is None:
+        import magic
+        # loads the magic database
+        magic.from_buffer("", mime=True)
+        _magic = magic
+    return _magic.from_buffer(text, mime=True)
+
+
+class MimeResolver(object):
+    def __init__(self, sniff_size=4096):
+        self.sniff_size = sniff_size
+        self.counts = Counter()
+        if not sniff_size:
+            # every document goes to libmagic: load it once, before warc2preprocess.py forks its workers
+            libmagic_type("")
+
+    def resolve(self, text, content_type=None):
+        """MIME type of a document (str) and how it was decided: header, sniffed or libmagic."""
+        if not self.sniff_size:
+            return libmagic_type(text), "libmagic"
+        declared = media_type(content_type)
+        if declared in TRUSTED_KINDS:
+            return KIND_TYPES[TRUSTED_KINDS[declared]], "header"
+        kind = sniff(text[:self.sniff_size])
+        if kind in ("html", "xml"):
+            return KIND_TYPES[kind], "sniffed"
+        return libmagic_type(text), "libmagic"
+
+    def record(self, source):
+        # the documents are resolved by the workers, and counted by the process that writes them
+        self.counts[source] += 1
+
+    def report(self, stream=sys.stderr):
+        stream.write("MIME types: {0} documents\n".format(sum(self.counts.values())))
+        for source in SOURCES:
+            stream.write("  {0:<16} {1:>10}\n".format(source, self.counts[source]))
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Near-duplicate detection of plain texts with MinHash and locality sensitive hashing. The signatures of the
+# documents and their LSH buckets are kept in an SQLite database, which is shared by all the hosts of a run:
+# warc2preprocess.py --near-dedup DB drops a document when a document already in DB (of any host) has an estimated
+# Jaccard similarity of at least the threshold with it. Put the database on a local disk, SQLite locking is not
+# reliable on NFS. Running this script on plain_text files prints the near duplicates that would be dropped.
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+
+import mmh3
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+re_space = re.compile(r"\s+")
+
+
+def candidate_probability(similarity, bands, rows):
+    """Probability that two documents of a Jaccard similarity share a bucket in at least one of the bands."""
+    return 1.0 - (1.0 - similarity ** rows) ** bands
+
+
+def integrate(function, start, end, steps=200):
+    # midpoint rule, precise enough to compare the band settings
+    step = (end - start) / steps
+    return sum(function(start + (i + 0.5) * step) for i in range(steps)) * step
+
+
+def choose_bands(num_perm, threshold, false_positive_weight=0.1, false_negative_weight=0.9):
+    """Number of bands b and rows r (b * r <= num_perm) that minimize the weighted sum of the probability of
+    comparing documents less similar than threshold (false positives) and of not comparing documents at least as
+    similar (false negatives), integrated over the similarities like datasketch does. A false positive only costs
+    the comparison of two signatures, a false negative keeps a near duplicate, hence the weights: with 128
+    permutations and a threshold of 0.8, 14 bands of 9 rows compare 87% of the pairs at 0.8 and 97% at 0.85."""
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positives = integrate(lambda s: candidate_probability(s, bands, rows), 0.0, threshold)
+            false_negatives = integrate(lambda s: 1.0 - candidate_probability(s, bands, rows), threshold, 1.0)
+            error = false_positive_weight * false_positives + false_negative_weight * false_negatives
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher(object):
+    """MinHash signatures of the character shingles of a text, with whitespace collapsed so that texts that only
+    differ in line breaks and spacing have the same shingles. Characters rather than words, as Japanese and
+    Chinese texts have no spaces."""
+
+    def __init__(self, num_perm=128, shingle=5, seed=1, chunk_size=1024):
+        import numpy as np
+        self.np = np
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.chunk_size = chunk_size
+        rnd = np.random.RandomState(seed)
+        self.a = rnd.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rnd.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        """uint32 array of num_perm values, or None for texts shorter than a shingle."""
+        np = self.np
+        text = re_space.sub(" ", text).strip()
+        k = self.shingle
+        if len(text) < k:
+            return None
+        hashes = np.fromiter({mmh3.hash(text[i:i + k], signed=False) for i in range(len(text) - k + 1)},
+                             dtype=np.uint64)
+        signature = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # (a * h + b) mod p for every permutation; a * h fits in 64 bits as h < 2^32 and a < 2^61 wraps around,
+        # which is still a fixed random mapping of h. The shingles are permuted a chunk at a time, so that the
+        # temporary matrices of a long document stay small
+        for start in range(0, len(hashes), self.chunk_size):
+            permuted = (np.outer(hashes[start:start + self.chunk_size], self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+class NearDuplicateIndex(object):
+    def __init__(self, path, threshold=0.8, num_perm=128, bands=None, timeout=600):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        if bands:
+            if bands > num_perm:
+                raise ValueError("More bands ({0}) than permutations ({1})".format(bands, num_perm))
+            self.bands, self.rows = bands, num_perm // bands
+        else:
+            self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, url TEXT, signature BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, key INTEGER, document INTEGER, "
+                        "PRIMARY KEY (band, key, document)) WITHOUT ROWID")
+        # every process of the run must hash and band the signatures the same way
+        self.db.execute("BEGIN IMMEDIATE")
+        for name, value in (("num_perm", num_perm), ("bands", self.bands), ("rows", self.rows)):
+            self.db.execute("INSERT OR IGNORE INTO settings VALUES (?, ?)", (name, str(value)))
+            stored = self.db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()[0]
+            if stored != str(value):
+                self.db.execute("ROLLBACK")
+                raise ValueError("{0} was built with {1}={2}, not {3}".format(path, name, stored, value))
+        self.db.execute("COMMIT")
+        self.hasher = MinHasher(num_perm)
+        self.duplicates = 0
+
+    def band_keys(self, signature):
+        return [(band, mmh3.hash64(signature[band * self.rows:(band + 1) * self.rows].tobytes())[0])
+                for band in range(self.bands)]
+
+    def add(self, url, signature):
+        """Returns the URL of an indexed near duplicate of the document, or None after adding it to the index."""
+        if signature is None:
+            return None
+        np = self.hasher.np
+        keys = self.band_keys(signature)
+        # the lookup and the insertion are one transaction, so that two hosts can't both keep the same document
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            candidates = set()
+            for band, key in keys:
+                candidates.update(row[0] for row in self.db.execute(
+                    "SELECT document FROM buckets WHERE band = ? AND key = ?", (band, key)))
+            duplicate = None
+            for candidate in candidates:
+                other_url, other = self.db.execute("SELECT url, signature FROM documents WHERE id = ?",
+                                                   (candidate,)).fetchone()
+                similarity = np.count_nonzero(np.frombuffer(other, dtype=np.uint32) == signature) / self.num_perm
+                if similarity < self.threshold:
+                    continue
+                if other_url == url:
+                    # the same document, indexed by an earlier run of the host that has to be run again
+                    self.db.execute("COMMIT")
+                    return None
+                duplicate = other_url
+            if duplicate:
+                self.db.execute("COMMIT")
+                self.duplicates += 1
+                return duplicate
+            document = self.db.execute("INSERT INTO documents (url, signature) VALUES (?, ?)",
+                                       (url, signature.tobytes())).lastrowid
+            self.db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                                [(band, key, document) for band, key in keys])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return None
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+    from common import open_documents, open_xz_or_gzip_or_plain, decode_document
+
+    oparser = argparse.ArgumentParser(description="Adds the plain texts of warc2preprocess.py outputs to a near "
+                                                  "duplicate index and prints the ones that are near duplicates of "
+                                                  "a document already indexed: URL, then the URL of the other "
+                                                  "document")
+    oparser.add_argument("dirs", nargs="+", help="Directories with url.xz and plain_text.xz (a language of a host)")
+    oparser.add_argument("--index", required=True, help="SQLite database, created if it does not exist")
+    oparser.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated Jaccard similarity")
+    oparser.add_argument("--num-perm", dest="num_perm", type=int, default=128, help="MinHash permutations")
+    oparser.add_argument("--bands", type=int, default=None,
+                         help="LSH bands of num_perm / bands rows (by default, the bands and rows with the fewest "
+                              "false positives and false negatives around the threshold)")
+    options = oparser.parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO)
+
+    index = NearDuplicateIndex(options.index, options.threshold, options.num_perm, options.bands)
+    total = 0
+    for directory in options.dirs:
+        with open_xz_or_gzip_or_plain(os.path.join(directory, "url.xz")) as urls, \
+                open_documents(os.path.join(directory, "plain_text.xz")) as texts:
+            for url, text in zip(urls, texts):
+                url = url.rstrip("\n")
+                duplicate = index.add(url, index.hasher.signature(decode_document(text)))
+                if duplicate:
+                    print("{0}\t{1}".format(url, duplicate))
+                total += 1
+    logging.info("{0} documents, {1} near duplicates ({2} bands of {3} rows)".format(
+        total, index.duplicates, index.bands, index.rows))
+    index.close()
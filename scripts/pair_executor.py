@@ -0,0 +1,73 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Segment alignment of document pairs in worker processes, for hunalign_strand.py and hunalign_old.py. Their align
+# functions print the segments of a pair as they find them: in a worker the output of a pair is captured, and the
+# main process prints the outputs in the order of the input pairs, as soon as the pairs before them are done, so
+# that the output is the same as the output of the pairs aligned one at a time.
+
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import bounded_imap
+
+# function of the worker processes, inherited from the main process
+_align = None
+
+
+def _start_worker(align):
+    global _align
+    _align = align
+
+
+def _align_captured(args):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        _align(*args)
+    return output.getvalue()
+
+
+class PairExecutor(object):
+    """Runs align(*args) for every args of the input, in jobs worker processes (or in this process when jobs is
+    1), and writes what it prints to the standard output in the order of the input. At most max_pending pairs (4
+    per worker by default) are read ahead of the pair being written."""
+
+    def __init__(self, align, jobs=1, max_pending=None):
+        self.align = align
+        self.jobs = max(jobs, 1)
+        self.max_pending = max_pending or 4 * self.jobs
+
+    def run(self, pairs):
+        if self.jobs == 1:
+            for args in pairs:
+                self.align(*args)
+            return
+        # the workers are forked: align does not need to be pickled, only the arguments of the pairs
+        pool = multiprocessing.get_context("fork").Pool(self.jobs, initializer=_start_worker, initargs=(self.align,))
+        outputs = bounded_imap(pool, _align_captured, pairs, self.max_pending)
+        try:
+            for output in outputs:
+                sys.stdout.write(output)
+            pool.close()
+        except BaseException:
+            outputs.close()
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
@@ -1,44 +1,53 @@
 #!/usr/bin/env python3
 
-import base64
 import click
 import fasttext
-import gzip
-import lzma
+import os
 import sys
-import re
 
-from external_processor import ExternalTextProcessor
+from external_processor import get_text_processor
+from join_docalign import join, read_pairs
 from strand import parsers
 
-re_tag = re.compile(r"^\[(START|END):([^\]]+)\]$")
-re_space = re.compile(r"[\s\u3000]+")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_records, read_records, decode_document
+from textnorm import text_chunks
 
 
-def write_sentences(html, lang, sent_tokenizer, outfile, lid=None):
-    html = base64.b64decode(html).decode("utf8")
-    tagchunks = parsers.parse(html, lang).split("\n")
-    chunks = [re_space.sub(" ", tc).strip() for tc in tagchunks if not re_tag.match(tc.strip())]
-    proc_sent = ExternalTextProcessor(sent_tokenizer.split(' '))
+def write_sentences(html, lang, sent_tokenizer, outfile, lid=None, persistent=False, workers=1):
+    html = decode_document(html)
+    chunks = text_chunks(parsers.parse(html, lang))
+    proc_sent = get_text_processor(sent_tokenizer.split(' '), persistent, "sentinel", workers)
+    if lid:
+        chunks = [chunk for chunk in chunks if chunk.strip() and lid.predict([chunk])[0][0][0][9:] == lang]
+    else:
+        chunks = [chunk for chunk in chunks if chunk.strip()]
+    if persistent:
+        segs = proc_sent.map(chunks)
+    else:
+        segs = [proc_sent.process(chunk) for chunk in chunks]
     dedup = set()
     n_sents = 0
-    for chunk in chunks:
-        if chunk.strip():
-            if lid:
-                pred = lid.predict([chunk])[0]
-                if pred[0][0][9:] != lang:
-                    continue
-            tokenized_segs = proc_sent.process(chunk).strip()
-            for sent in tokenized_segs.split("\n"):
-                if sent not in dedup:
-                    print(sent, file=outfile)
-                    dedup.add(sent)
-                    n_sents += 1
+    for tokenized_segs in segs:
+        for sent in tokenized_segs.strip().split("\n"):
+            if sent not in dedup:
+                print(sent, file=outfile)
+                dedup.add(sent)
+                n_sents += 1
     return n_sents
 
 
+def read_aligned_documents(path):
+    # tab-separated lines with base64 HTML or framed records
+    with open_records(path) as reader:
+        yield from reader
+
+
 @click.command()
 @click.option("--input", "-i", help="File containing the set of aliged documents")
+@click.option("--docalign", help="Document alignment file, read together with --html1 and --html2 instead of --input")
+@click.option("--html1", "html_file1", help="deboilerplate_html file of the source language")
+@click.option("--html2", "html_file2", help="deboilerplate_html file of the target language")
 @click.option("--prefix", "-p", help="Output prefix")
 @click.option("--slang", "-sl", required=True, help="Source language code")
 @click.option("--tlang", "-tl", required=True, help="Source language code")
@@ -46,16 +55,18 @@ def write_sentences(html, lang, sent_tokenizer, outfile, lid=None):
 @click.option("--sent_tokenizer2", "-s2", required=True, help="Sentence tokenizer for target language")
 @click.option("--lid", help="Language identification implementation")
 @click.option("--lid_model", help="fastText LID model path")
-def main(input, prefix, slang, tlang, sent_tokenizer1, sent_tokenizer2, lid, lid_model):
-    if input:
-        if input.endswith(".xz"):
-            reader = lzma.open(input)
-        if input.endswith(".gz"):
-            reader = gzip.open(input)
-        else:
-            reader = open(input)
+@click.option("--persistent", is_flag=True, default=False,
+              help="Keep the sentence tokenizers running instead of starting them for every paragraph")
+@click.option("--workers", type=int, default=1, help="Number of paragraphs tokenized in parallel with --persistent")
+def main(input, docalign, html_file1, html_file2, prefix, slang, tlang, sent_tokenizer1, sent_tokenizer2, lid, lid_model,
+         persistent, workers):
+    if docalign:
+        # only the aligned documents are read from the (indexed) HTML files
+        reader = ((n1, n2, h1[0], h2[0]) for n1, h1, n2, h2 in join(read_pairs(docalign), [html_file1], [html_file2]))
+    elif input:
+        reader = read_aligned_documents(input)
     else:
-        reader = sys.stdin
+        reader = read_records(sys.stdin.buffer)
 
     if lid:
         if lid == "fastText":
@@ -72,17 +83,13 @@ def main(input, prefix, slang, tlang, sent_tokenizer1, sent_tokenizer2, lid, lid
     with open(s_cc, "w") as sw, open(t_cc, "w") as tw, open(cc_offset, "w") as ow:
         s_offset = 0
         t_offset = 0
-        for line in reader:
-            if isinstance(line, bytes):
-                line = line.decode("utf8")
-            fields = line.split("\t")
-            n1 = fields[0]
-            n2 = fields[1]
-            html1 = fields[2]
-            html2 = fields[3]
-
-            s_len = write_sentences(html1, slang, sent_tokenizer1, sw, model)
-            t_len = write_sentences(html2, tlang, sent_tokenizer2, tw, model)
+        for fields in reader:
+            n1, n2, html1, html2 = fields[:4]
+            if isinstance(n1, bytes):
+                n1, n2 = n1.decode(), n2.decode()
+
+            s_len = write_sentences(html1, slang, sent_tokenizer1, sw, model, persistent, workers)
+            t_len = write_sentences(html2, tlang, sent_tokenizer2, tw, model, persistent, workers)
 
             print(f"{n1}\t{s_offset}\t{s_len}\t{n2}\t{t_offset}\t{t_len}", file=ow)
 
@@ -19,39 +19,35 @@ import sys
 import os
 import argparse
 import base64
-import string
-from external_processor import ExternalTextProcessor
+from concurrent.futures import ThreadPoolExecutor
+from external_processor import get_text_processor
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
-from common import open_xz_or_gzip_or_plain
+from common import open_documents, decode_document, FramedWriter
+from textnorm import drop_punctuation_lines
 
 
-def extract_encoded_text(encoded, sent_tokeniser, word_tokeniser, morph_analyser):
+def extract_encoded_text(document, sent_tokeniser, word_tokeniser, morph_analyser, persistent=False, workers=1):
+    # document is a base64 line or the bytes of a framed record, the tokenised text is returned as a str
     if not sent_tokeniser:
-        return encoded
+        return decode_document(document)
 
-    proc_sent = ExternalTextProcessor(sent_tokeniser.split())
-    content = base64.b64decode(encoded).decode("utf-8").replace("\t", " ")
+    proc_sent = get_text_processor(sent_tokeniser.split(), persistent, "sentinel", workers)
+    content = decode_document(document).replace("\t", " ")
     tokenized_segs = proc_sent.process(content).strip()
-    tokenized_filtered = ""
-
-    for sent in tokenized_segs.split("\n"):
-        if sum([1 for m in sent if m in string.punctuation + string.digits]) < len(sent) // 2:
-            tokenized_filtered += sent + "\n"
+    tokenized_filtered = drop_punctuation_lines(tokenized_segs)
 
     if not word_tokeniser:
-        b64text = base64.b64encode(tokenized_filtered.lower().encode("utf-8"))
-        return b64text.decode()
+        return tokenized_filtered.lower()
 
-    proc_word = ExternalTextProcessor(word_tokeniser.split())
+    proc_word = get_text_processor(word_tokeniser.split(), persistent, "lines", workers)
     tokenized_text = proc_word.process(tokenized_filtered)
 
     if morph_analyser:
-        proc_morph = ExternalTextProcessor(morph_analyser.split())
+        proc_morph = get_text_processor(morph_analyser.split())
         tokenized_text = proc_morph.process(tokenized_text)
 
-    b64text = base64.b64encode(tokenized_text.lower().encode("utf-8"))
-    return b64text.decode()
+    return tokenized_text.lower()
 
 
 oparser = argparse.ArgumentParser(
@@ -60,11 +56,43 @@ oparser.add_argument('--text', dest='text', help='Plain text file', required=Tru
 oparser.add_argument('--sentence-splitter', dest='splitter', required=True, help="Sentence splitter commands")
 oparser.add_argument('--word-tokenizer', dest='tokenizer', required=True, help="Word tokenisation command")
 oparser.add_argument('--morph-analyser', dest='lemmatizer', help="Morphological analyser command")
+oparser.add_argument('--persistent', dest='persistent', action='store_true', default=False,
+                     help="Keep the sentence splitter and word tokeniser running instead of starting them for every "
+                          "document (they must flush their output after every line, e.g. the -b option of Moses)")
+oparser.add_argument('--workers', dest='workers', type=int, default=1,
+                     help="Number of documents tokenised in parallel with --persistent")
+oparser.add_argument('--framed', dest='framed', action='store_true', default=False,
+                     help="Write the tokenised documents in the framed record format instead of one base64 line per "
+                          "document (the input can be in either format)")
 
 options = oparser.parse_args()
 
-with open_xz_or_gzip_or_plain(options.text) as reader:
-    for line in reader:
-        encoded_text = line.strip()
-        tokenized = extract_encoded_text(encoded_text, options.splitter, options.tokenizer, options.lemmatizer)
-        print(tokenized)
+
+def tokenize(document):
+    return extract_encoded_text(document, options.splitter, options.tokenizer, options.lemmatizer,
+                                options.persistent, options.workers)
+
+
+if options.framed:
+    writer = FramedWriter(sys.stdout.buffer)
+
+    def output(tokenized):
+        writer.write((tokenized.encode("utf-8"),))
+else:
+    def output(tokenized):
+        sys.stdout.write(base64.b64encode(tokenized.encode("utf-8")).decode() + "\n")
+
+
+with open_documents(options.text) as reader:
+    if options.persistent and options.workers > 1:
+        with ThreadPoolExecutor(options.workers) as executor:
+            while True:
+                chunk = [line for _, line in zip(range(options.workers * 16), reader)]
+                if not chunk:
+                    break
+                for tokenized in executor.map(tokenize, chunk):
+                    output(tokenized)
+    else:
+        for document in reader:
+            output(tokenize(document))
+sys.stdout.flush()
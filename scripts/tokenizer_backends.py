@@ -0,0 +1,178 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Sentence splitters and word tokenisers that run inside the Python process. They are selected in the
+# sentenceSplitters and wordTokenizers settings with "python:NAME[-LANG] [OPTIONS]" instead of a command, e.g.
+#   python:moses-en          Moses split-sentences.perl / tokenizer.perl through the mosestokenizer package
+#   python:mecab             MeCab -Owakati
+#   python:ja-punct-splitter splitter at Japanese and full width sentence-final punctuation
+# Their process() gives the same output as the command they replace: one sentence per line and "<P>" after
+# every paragraph for splitters, one tokenised line per input line for tokenisers.
+
+import os
+import re
+import threading
+
+PREFIX = "python:"
+
+re_markup = re.compile(r"^<.+>$")
+re_blank = re.compile(r"^\s*$")
+re_markup_or_blank = re.compile(r"^(?:<.+>|\s*)$")
+re_ja_sentence_end = re.compile(r"([。．！？!?]+[」』）)”’]*)\s*")
+
+SENTENCE_SPLITTERS = {}
+WORD_TOKENIZERS = {}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def sentence_splitter(name):
+    def register(factory):
+        SENTENCE_SPLITTERS[name] = factory
+        return factory
+    return register
+
+
+def word_tokenizer(name):
+    def register(factory):
+        WORD_TOKENIZERS[name] = factory
+        return factory
+    return register
+
+
+def is_backend(cmd):
+    if isinstance(cmd, (list, tuple)):
+        cmd = cmd[0] if cmd else ""
+    return cmd.startswith(PREFIX)
+
+
+class ParagraphSplitter(object):
+    """Runs a sentence splitting function like split-sentences.perl drives its splitter: lines are joined into
+    paragraphs that end at blank lines and markup lines, "<P>" is written after a paragraph that ends at a
+    blank line and markup lines are copied to the output."""
+
+    def __init__(self, split):
+        self.split = split
+
+    def process(self, input_text):
+        out = []
+        text = []
+        for line in input_text.split("\n")[:-1] if input_text.endswith("\n") else input_text.split("\n"):
+            if re_markup.match(line) or re_blank.match(line):
+                out.extend(self.split(text) if text else [])
+                if text and re_blank.match(line):
+                    out.append("<P>")
+                if re_markup.match(line):
+                    out.append(line)
+                text = []
+            else:
+                text.append(line)
+        if text:
+            out.extend(self.split(text))
+        return "".join(sent + "\n" for sent in out)
+
+    def map(self, input_texts):
+        return [self.process(text) for text in input_texts]
+
+
+class LineTokenizer(object):
+    """Runs a word tokenising function on every line. Lines matching copied (e.g. the blank lines for
+    tokenizer.perl, also the markup lines with its -x option) are copied instead."""
+
+    def __init__(self, tokenize, copied=None):
+        self.tokenize = tokenize
+        self.copied = copied
+
+    def process(self, input_text):
+        out = []
+        copied = False
+        for line in input_text.split("\n")[:-1] if input_text.endswith("\n") else input_text.split("\n"):
+            copied = self.copied is not None and self.copied.match(line) is not None
+            out.append(line if copied else self.tokenize(line))
+        output = "".join(line + "\n" for line in out)
+        if copied and not input_text.endswith("\n"):
+            # a copied line is written as it was read, without the newline it did not have
+            output = output[:-1]
+        return output
+
+    def map(self, input_texts):
+        return [self.process(text) for text in input_texts]
+
+
+@sentence_splitter("moses")
+def moses_sentence_splitter(lang, args):
+    from mosestokenizer import MosesSentenceSplitter
+    # the wrapper splits at colons and semicolons too (-m) unless told not to
+    splitsents = MosesSentenceSplitter(lang or "en", more="-m" in args)
+    return ParagraphSplitter(lambda lines: splitsents([" ".join(lines)]))
+
+
+@word_tokenizer("moses")
+def moses_word_tokenizer(lang, args):
+    from mosestokenizer import MosesTokenizer
+    # the options that the wrapper always sets are dropped, the rest go to tokenizer.perl
+    extra = [arg for arg in args if arg not in ("-q", "-b", "-a", "-x")]
+    if "-l" in extra:
+        i = extra.index("-l")
+        lang, extra = extra[i + 1], extra[:i] + extra[i + 2:]
+    tokenize = MosesTokenizer(lang or "en", extra=extra or None)
+    return LineTokenizer(lambda line: " ".join(tokenize(line)), re_markup_or_blank if "-x" in args else re_blank)
+
+
+@word_tokenizer("mecab")
+def mecab_word_tokenizer(lang, args):
+    import MeCab
+    tagger = MeCab.Tagger(" ".join(["-Owakati"] + [arg for arg in args if arg != "-Owakati"]))
+    # mecab -Owakati ends every line with " \n", parse() gives the same for a single line
+    return LineTokenizer(lambda line: tagger.parse(line)[:-1])
+
+
+@sentence_splitter("ja-punct-splitter")
+def ja_punct_sentence_splitter(lang, args):
+    def split(lines):
+        text = "".join(line.strip() for line in lines)
+        return [sent for sent in re_ja_sentence_end.sub("\\1\n", text).split("\n") if sent]
+    return ParagraphSplitter(split)
+
+
+def parse_spec(cmd):
+    """Splits "python:NAME[-LANG] [OPTIONS]" into NAME[-LANG] and the options."""
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    name, args = cmd[0][len(PREFIX):], [arg for arg in cmd[1:] if arg]
+    return name, args
+
+
+def get_backend(cmd, role):
+    """Returns the backend for a "python:..." command, created once per process and thread.
+
+    role is "splitter" or "tokenizer", as the same name (e.g. moses-en) exists for both. The backends are not
+    thread-safe (the mosestokenizer wrappers are a single pipe to a Perl process, MeCab.Tagger keeps its state
+    between calls), so every thread that uses one (e.g. the workers of tokenizer.py) gets its own."""
+    registry = SENTENCE_SPLITTERS if role == "splitter" else WORD_TOKENIZERS
+    name, args = parse_spec(cmd)
+    key = (os.getpid(), threading.get_ident(), role, name, tuple(args))
+    with _backends_lock:
+        if key not in _backends:
+            if name in registry:
+                base, lang = name, None
+            else:
+                base, _, lang = name.rpartition("-")
+            if base not in registry:
+                raise ValueError("Unknown {0} backend '{1}{2}', available: {3}".format(
+                    role, PREFIX, name, ", ".join(sorted(registry))))
+            _backends[key] = registry[base](lang, args)
+        return _backends[key]
@@ -19,7 +19,6 @@ import sys
 import argparse
 import cchardet
 import re
-import ftfy
 import logging
 import lzma
 import subprocess
@@ -27,12 +26,13 @@ import zipfile
 import io
 
 from io import BytesIO
-from lxml.html.clean import Cleaner
-from pdfextract.extract import Extractor as ExtrP
+from collections import namedtuple
 from warcio.archiveiterator import ArchiveIterator
 from warcio.warcwriter import WARCWriter
 from warcio.statusandheaders import StatusAndHeaders
 
+from warc_prefilter import WarcPrefilter, get_prefilter, target_uri
+
 
 def convert_encoding(data):
     encoding = cchardet.detect(data)['encoding']
@@ -108,173 +108,182 @@ def epub2html(data):
     return xmls
 
 
-oparser = argparse.ArgumentParser(
-    description="Script that takes every record in a WARC file and runs basic preprocessing, which includes: HTML"
-                "normalization, deduplication. The result is a WARC file.")
-oparser.add_argument("--verbose", action="store_true", default=False,
-                     help="Produce additional information about preprocessing through stderr.")
-oparser.add_argument('--output', dest='output', help='Output WARC file', default=sys.stdout)
-oparser.add_argument('--input', dest='input', help='Input WARC file', default=sys.stdin)
-oparser.add_argument('--pdfextract', action="store_true", help='Use pdf-extract engine or pdftohtml for PDFs',
-                     default=False)
-oparser.add_argument('--ftfy', action='store_true', help='User fix-text-for-you to fix possible encoding problems',
-                     default=False)
-oparser.add_argument('--cleanhtml', action='store_true', help='Clean HTML to remove javascript, css and head tags',
-                     default=False)
-options = oparser.parse_args()
-
-logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s',
-                    level=logging.INFO if options.verbose else logging.ERROR, datefmt='%Y-%m-%d %H:%M:%S')
-
-f = None
-fo = None
-
-if options.input[-3:] == ".xz":
-    f = ArchiveIterator(lzma.open(options.input, 'r'))
-elif options.input[-3:] == ".gz":
-    f = ArchiveIterator(open(options.input, 'rb'))
-elif options.input == sys.stdin:
-    f = ArchiveIterator(options.input.buffer)
-else:
-    f = ArchiveIterator(open(options.input, 'rb'))
-
-if options.output == sys.stdout:
-    fo = WARCWriter(options.output.buffer, gzip=True)
-else:
-    fo = WARCWriter(open(options.output, 'wb'), gzip=True)
-
-if options.pdfextract:
-    extractor = ExtrP()
-
-cleaner = Cleaner(style=True, links=True, add_nofollow=True,
-                  page_structure=False, safe_attrs_only=False)
-
-if options.output == sys.stdout:
-    filename = options.input
-else:
-    filename = options.output
-
-fo.write_record(fo.create_warcinfo_record(filename=filename, info={
-                'software': 'bitextor/bitextor-warc2htmlwarc.py', 'format': 'WARC File Format 1.0'}))
-
-for record in f:
-    # Initial checks
-    if record.rec_type != 'response' and record.rec_type != 'resource':
-        continue
-    if record.rec_headers.get_header('WARC-Target-URI')[0] == '<' and record.rec_headers.get_header('WARC-Target-URI')[-1] == '>':
-        url = record.rec_headers.get_header('WARC-Target-URI')[1:-1]
-    else:
-        url = record.rec_headers.get_header('WARC-Target-URI')
-    if url == "unknown":
-        logging.info("Skipping page with unknown URL")
-        continue
-    if "text/dns" in record.rec_headers.get_header('Content-Type'):
-        continue
-    pageSize = int(record.rec_headers.get_header('Content-Length'))
-    if pageSize > 5242880:
-        logging.info("Skipping page, over limit. " + str(pageSize) + " " + url)
-        continue
-    if record.http_headers is not None and record.http_headers.get_header('Content-Type') is not None:
-        if "image/" in record.http_headers.get_header('Content-Type') or "audio/" in record.http_headers.get_header(
-                'Content-Type') or "video/" in record.http_headers.get_header(
-                'Content-Type') or "text/x-component" in record.http_headers.get_header(
-                'Content-Type') or "text/x-js" in record.http_headers.get_header(
-                'Content-Type') or "text/javascript" in record.http_headers.get_header(
-                'Content-Type') or "application/x-javascript" in record.http_headers.get_header(
-                'Content-Type') or "text/css" in record.http_headers.get_header(
-                'Content-Type') or "application/javascript" in record.http_headers.get_header(
-                'Content-Type') or "application/x-shockwave-flash" in record.http_headers.get_header(
-                'Content-Type') or "application/octet-stream" in record.http_headers.get_header(
-                'Content-Type') or "application/x-font-ttf" in record.http_headers.get_header('Content-Type'):
-            continue
-
-    url = url.lower()
-    url = url.replace('\t', ' ')
-    if url[-4:] == ".gif" or url[-4:] == ".jpg" or url[-5:] == ".jpeg" or url[-4:] == ".png" or url[-4:] == ".css" or url[-3:] == ".js" or url[-4:] == ".mp3" or url[-4:] == ".mp4" or url[-4:] == ".ogg" or url[-5:] == ".midi" or url[-4:] == ".swf":
-        continue
+# A record kept by read_records(): the payloads are the documents to normalize (several for formats that contain
+# more than one document), the rest is what is needed to write them back to a WARC file
+Record = namedtuple("Record", ["url", "record_type", "warc_content_type", "http_headers", "payloads", "date",
+                               "recordId"])
 
-    # Ignore robots.txt when processing records
-    if url[-11:] == "/robots.txt":
-        continue
+_cleaner = None
 
-    payload = record.content_stream().read()
-    payloads = []
 
-    if not record.http_headers or record.http_headers.to_str()[:7] != "HTTP/1.":
-        if record.http_headers:
-            payload = record.http_headers.to_bytes() + payload
-        record_type = 'resource'
-        http_headers = None
-    else:
-        record_type = 'response'
-        http_headers = record.http_headers
-        # Transfer-Encoding: chunked header causes error with giawarc
-        http_headers.remove_header("Transfer-Encoding")
-        try:
-            http_headers.to_ascii_bytes()
-        except UnicodeEncodeError:
-            # if header is non ascii, create a new header, with status code only
-            # content length and content type will be filled before writing
-            http_headers = StatusAndHeaders(record.http_headers.get_statuscode(), [])
-
-    # Extract payloads (XML) from non-HTML document formats
-    if url[-4:] == ".pdf" or ((record.http_headers is not None and record.http_headers.get_header('Content-Type') is not None) and "application/pdf" in record.http_headers.get_header('Content-Type')):
-        continue
-#        if options.pdfextract:
-#            payloads = pdfextract(payload, extractor)
-#        else:
-#            payloads = pdf2html(payload)
-    elif url[-4:] == ".odt" or url[-4:] == ".ods" or url[-4:] == ".odp":
-        continue
-#        payloads = openoffice2html(payload)
-    elif url[-5:] == ".docx" or url[-5:] == ".pptx" or url[-5:] == ".xlsx":
-        continue
-#        payloads = office2html(payload)
-    elif url[-5:] == ".epub":
-        continue
-#        payloads = epub2html(payload)
-    else:
-        payloads = [payload]
+def get_cleaner():
+    global _cleaner
+    if _cleaner is None:
+        from lxml.html.clean import Cleaner
+        _cleaner = Cleaner(style=True, links=True, add_nofollow=True,
+                           page_structure=False, safe_attrs_only=False)
+    return _cleaner
 
-    date = record.rec_headers.get_header('WARC-Date')
-    recordId = record.rec_headers.get_header('WARC-Record-ID')
-    for payload in payloads:
-        # We convert into UTF8 first of all
-        orig_encoding, text = convert_encoding(payload)
-        logging.info("Processing document: " + url)
 
-        if orig_encoding is None:
-            logging.info("Encoding of document " + url + " could not be identified")
+def read_records(archive, prefilter=None):
+    """Applies the prefilter rules (see warc_prefilter.py) to the records of a WARC archive and yields the ones
+    that are kept. The payload of the rejected records is never read."""
+    if prefilter is None:
+        prefilter = WarcPrefilter()
+    for record in archive:
+        url = target_uri(record)
+        url = url.lower()
+        url = url.replace('\t', ' ')
+        if prefilter.check(record, url) is not None:
             continue
 
-        text = re.sub('encoding *= *"[^"]+"', '', text, flags=re.IGNORECASE)
-        if len(text.strip()) == 0:
+        payload = record.content_stream().read()
+        payloads = []
+
+        if not record.http_headers or record.http_headers.to_str()[:7] != "HTTP/1.":
+            if record.http_headers:
+                payload = record.http_headers.to_bytes() + payload
+            record_type = 'resource'
+            http_headers = None
+        else:
+            record_type = 'response'
+            http_headers = record.http_headers
+            # Transfer-Encoding: chunked header causes error with giawarc
+            http_headers.remove_header("Transfer-Encoding")
+            try:
+                http_headers.to_ascii_bytes()
+            except UnicodeEncodeError:
+                # if header is non ascii, create a new header, with status code only
+                # content length and content type will be filled before writing
+                http_headers = StatusAndHeaders(record.http_headers.get_statuscode(), [])
+
+        # Extract payloads (XML) from non-HTML document formats
+        if url[-4:] == ".pdf" or ((record.http_headers is not None and record.http_headers.get_header('Content-Type') is not None) and "application/pdf" in record.http_headers.get_header('Content-Type')):
             continue
-
-        clean_html = ""
-        tree = ""
-        try:
-            if options.cleanhtml:
-                # HTML is then normalized
-                logging.info(url + ": cleaning HTML")
-                clean_html = cleaner.clean_html(text)
-            else:
-                clean_html = text
-
-            if options.ftfy:
-                tree = ftfy.fix_text(clean_html, fix_entities=False, fix_character_width=True)
-            else:
-                tree = clean_html
-
-        except Exception as ex:
-            logging.info("Skipping " + url + ": " + str(ex))
+#            if options.pdfextract:
+#                payloads = pdfextract(payload, extractor)
+#            else:
+#                payloads = pdf2html(payload)
+        elif url[-4:] == ".odt" or url[-4:] == ".ods" or url[-4:] == ".odp":
+            continue
+#            payloads = openoffice2html(payload)
+        elif url[-5:] == ".docx" or url[-5:] == ".pptx" or url[-5:] == ".xlsx":
             continue
-        clean_tree = tree.replace("&#160;", " ")
-        clean_tree = clean_tree.replace("\t", " ")
-        clean_tree = clean_tree.encode('utf-8')
-        if http_headers:
-            http_headers.replace_header('Content-Length', str(len(clean_tree)))
-            http_headers.replace_header('Content-Type', 'text/html')
-        new_record = fo.create_warc_record(uri=url, record_type=record_type, warc_content_type=record.content_type, payload=BytesIO(
-            clean_tree), http_headers=http_headers)
-        fo.write_record(new_record)
+#            payloads = office2html(payload)
+        elif url[-5:] == ".epub":
+            continue
+#            payloads = epub2html(payload)
+        else:
+            payloads = [payload]
+
+        yield Record(url, record_type, record.content_type, http_headers, payloads,
+                     record.rec_headers.get_header('WARC-Date'), record.rec_headers.get_header('WARC-Record-ID'))
+
+
+def normalize_payload(url, payload, cleanhtml=False, fix_text=False):
+    """Converts a payload to UTF-8 text and normalizes its HTML. Returns the original encoding and the normalized
+    HTML, or None and '' if the document is skipped. This is also run by warc2preprocess.py --normalize, which
+    takes the result as is instead of reading it back from the WARC file written by this script."""
+    # We convert into UTF8 first of all
+    orig_encoding, text = convert_encoding(payload)
+    logging.info("Processing document: " + url)
+
+    if orig_encoding is None:
+        logging.info("Encoding of document " + url + " could not be identified")
+        return None, ''
+
+    text = re.sub('encoding *= *"[^"]+"', '', text, flags=re.IGNORECASE)
+    if len(text.strip()) == 0:
+        return None, ''
+
+    clean_html = ""
+    tree = ""
+    try:
+        if cleanhtml:
+            # HTML is then normalized
+            logging.info(url + ": cleaning HTML")
+            clean_html = get_cleaner().clean_html(text)
+        else:
+            clean_html = text
+
+        if fix_text:
+            import ftfy
+            tree = ftfy.fix_text(clean_html, fix_entities=False, fix_character_width=True)
+        else:
+            tree = clean_html
+
+    except Exception as ex:
+        logging.info("Skipping " + url + ": " + str(ex))
+        return None, ''
+    clean_tree = tree.replace("&#160;", " ")
+    clean_tree = clean_tree.replace("\t", " ")
+    return orig_encoding, clean_tree
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Script that takes every record in a WARC file and runs basic preprocessing, which includes: HTML"
+                    "normalization, deduplication. The result is a WARC file.")
+    oparser.add_argument("--verbose", action="store_true", default=False,
+                         help="Produce additional information about preprocessing through stderr.")
+    oparser.add_argument('--output', dest='output', help='Output WARC file', default=sys.stdout)
+    oparser.add_argument('--input', dest='input', help='Input WARC file (- for the standard input)', default='-')
+    oparser.add_argument('--pdfextract', action="store_true", help='Use pdf-extract engine or pdftohtml for PDFs',
+                         default=False)
+    oparser.add_argument('--ftfy', action='store_true', help='User fix-text-for-you to fix possible encoding problems',
+                         default=False)
+    oparser.add_argument('--cleanhtml', action='store_true', help='Clean HTML to remove javascript, css and head tags',
+                         default=False)
+    oparser.add_argument('--prefilter', dest='prefilter', default=None,
+                         help='Rules that reject records from their headers (see warc_prefilter.py): JSON or YAML '
+                              'file, or a JSON object')
+    options = oparser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s',
+                        level=logging.INFO if options.verbose else logging.ERROR, datefmt='%Y-%m-%d %H:%M:%S')
+
+    f = None
+    fo = None
+
+    if options.input == "-":
+        f = ArchiveIterator(sys.stdin.buffer)
+    elif options.input[-3:] == ".xz":
+        f = ArchiveIterator(lzma.open(options.input, 'r'))
+    elif options.input[-3:] == ".gz":
+        f = ArchiveIterator(open(options.input, 'rb'))
+    else:
+        f = ArchiveIterator(open(options.input, 'rb'))
+
+    if options.output == sys.stdout:
+        fo = WARCWriter(options.output.buffer, gzip=True)
+    else:
+        fo = WARCWriter(open(options.output, 'wb'), gzip=True)
+
+    if options.pdfextract:
+        from pdfextract.extract import Extractor as ExtrP
+        extractor = ExtrP()
+
+    if options.output == sys.stdout:
+        filename = options.input
+    else:
+        filename = options.output
+
+    fo.write_record(fo.create_warcinfo_record(filename=filename, info={
+                    'software': 'bitextor/bitextor-warc2htmlwarc.py', 'format': 'WARC File Format 1.0'}))
+
+    prefilter = get_prefilter(options.prefilter)
+    for record in read_records(f, prefilter):
+        for payload in record.payloads:
+            orig_encoding, clean_tree = normalize_payload(record.url, payload, options.cleanhtml, options.ftfy)
+            if orig_encoding is None:
+                continue
+            clean_tree = clean_tree.encode('utf-8')
+            http_headers = record.http_headers
+            if http_headers:
+                http_headers.replace_header('Content-Length', str(len(clean_tree)))
+                http_headers.replace_header('Content-Type', 'text/html')
+            new_record = fo.create_warc_record(uri=record.url, record_type=record.record_type,
+                                               warc_content_type=record.warc_content_type,
+                                               payload=BytesIO(clean_tree), http_headers=http_headers)
+            fo.write_record(new_record)
+    prefilter.report()
@@ -19,74 +19,42 @@ import html
 import base64
 import argparse
 import cchardet
-import magic
-import re
-import jpype
 import os
-import importlib
-import alcazar.bodytext
+import importlib.util
 import logging
 import lzma
 import mmh3
+import multiprocessing
 import sys
-import neologdn
+import time
 
-from boilerpipe.extract import Extractor as ExtrB
-from bs4 import BeautifulSoup
-from html.parser import HTMLParser as HTMLTokenizer
-from selectolax.parser import HTMLParser
 from warcio.archiveiterator import ArchiveIterator
 
-
-if not jpype.isJVMStarted():
-    jars = []
-    for top, dirs, files in os.walk(os.path.dirname(importlib.machinery.PathFinder().find_module("boilerpipe").get_filename()) + '/data'):
-        for nm in files:
-            if nm[-4:] == ".jar":
-                jars.append(os.path.join(top, nm))
-    jpype.addClassPath(os.pathsep.join(jars))
-    jpype.startJVM(jpype.getDefaultJVMPath(), convertStrings=False)
-
-
-class SimpleParser(HTMLTokenizer):
-    startNL = ["ul", "ol", "dl", "tr"]
-    endNL = ["p", "div", "li", "dd", "dt", "th", "td", "h1", "h2", "h3", "h4", "h5", "h6"]
-    selfNL = ["br"]
-    noText = ["script", "noscript", "style"]
-    lastTok = ""
-    parsed = ""
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self.startNL:
-            self.parsed = self.parsed + "\n"
-        self.lastTok = tag
-
-    def handle_endtag(self, tag):
-        if tag in self.endNL:
-            self.parsed = self.parsed + "\n"
-
-    def handle_startendtag(self, tag, attrs):
-        if tag in self.selfNL:
-            self.parsed = self.parsed + "\n"
-
-    def handle_data(self, data):
-        if self.lastTok not in self.noText:
-            newdata = data.replace("\r\n", " ").replace("\n", " ")
-            self.parsed = self.parsed + newdata
-
-    def get_text(self):
-        return self.parsed.strip() + "\n"
-
-
-def guess_lang_from_data2(data):
-    reliable, text_bytes, detected_languages = cld2.detect(
-        ''.join(x for x in data if x.isprintable()), isPlainText=False)
-    return detected_languages[0][1]
-
-
-def guess_lang_from_data3(model, data):
-    language, probability, reliable, proportion = model.get_language(data)
-    return language
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import BackgroundWriter, BlockXzWriter, FramedBlockXzWriter, IndexedDocumentReader, WriterPool, \
+    bounded_imap, is_framed_file, read_file_index
+from warc2htmlwarc import read_records as read_raw_records, normalize_payload
+from warc_prefilter import get_prefilter
+from lang_detect import LanguageDetector
+from hash_store import HashStore, is_hash_store
+from textnorm import normalize_plaintext
+from mime_resolver import MimeResolver
+
+
+def start_jvm():
+    # boilerpipe runs in the JVM, which does not survive a fork: with --jobs every worker starts its own, and
+    # neither jpype nor boilerpipe are imported before the workers are forked
+    global ExtrB
+    import jpype
+    if not jpype.isJVMStarted():
+        jars = []
+        for top, dirs, files in os.walk(os.path.dirname(importlib.util.find_spec("boilerpipe").origin) + '/data'):
+            for nm in files:
+                if nm[-4:] == ".jar":
+                    jars.append(os.path.join(top, nm))
+        jpype.addClassPath(os.pathsep.join(jars))
+        jpype.startJVM(jpype.getDefaultJVMPath(), convertStrings=False)
+    from boilerpipe.extract import Extractor as ExtrB
 
 
 def convert_encoding(data):
@@ -113,12 +81,13 @@ oparser.add_argument("--verbose", action="store_true", default=False,
 oparser.add_argument("--boilerpipe", action="store_true", default=False,
                      help="Use boilerpipe bodytext to do the de-boiling")
 oparser.add_argument("--parser", dest="parser", default="bs4",
-                     help="Use 'HTML tokenizer', 'modest', 'bs4' or 'alcazar' parsers to extract relevant text from HTML. By default 'bs4' is used")
-oparser.add_argument('--output-dir', dest='outDir', help='Output directory', required=True)
+                     help="Use 'HTML tokenizer', 'modest', 'bs4', 'lxml' or 'alcazar' parsers to extract relevant text from HTML. By default 'bs4' is used")
+oparser.add_argument('--output-dir', dest='outDir', help='Output directory')
 oparser.add_argument('--output_hash', dest='outputHash',
                      help='Output path for Murmur Hash of plain texts')
 oparser.add_argument('--input_hash', dest='inputHash',
-                     help='Input path for previous Bitextor Murmur Hash plain texts file')
+                     help='Input path for previous Bitextor Murmur Hash plain texts file, or a store compiled from '
+                          'it by hash_store.py')
 oparser.add_argument('--lang1', dest='l1', help='Language l1 in the crawl', default=None)
 oparser.add_argument('--lang2', dest='l2', help='Language l2 in the crawl', default=None)
 oparser.add_argument('--input', dest='input', help='Input WARC file', default=None)
@@ -128,34 +97,100 @@ oparser.add_argument('--langs', dest="langs", default="",
                      help='List of languages to include or ignore (%%): l1,l2,%%l3,%%l4')
 oparser.add_argument('--langid', dest="langid", default="cld2",
                      help="Model used for language detection: cld2 or cld3")
+oparser.add_argument('--lid-sample', dest='lidSample', type=int, default=0,
+                     help='Detect the language of documents longer than 3 times this number of characters on their '
+                          'head, middle and tail windows of this size, and on the whole document only when the '
+                          'detection on the windows is not confident. 0 (default) always reads the whole document')
+oparser.add_argument('--lid-min-percent', dest='lidMinPercent', type=int, default=80,
+                     help='With --lid-sample, percentage of the windows that must be in the detected language')
+oparser.add_argument('--near-dedup', dest='nearDedup', default=None,
+                     help='SQLite near duplicate index (see near_dedup.py), shared by the hosts of a run: documents '
+                          'whose plain text is a near duplicate of an indexed one are discarded')
+oparser.add_argument('--near-dedup-threshold', dest='nearDedupThreshold', type=float, default=0.8,
+                     help='Minimum estimated Jaccard similarity of the plain texts of near duplicates')
 oparser.add_argument('--neologdn', action='store_true', help='Use neologdn to normalize text',
                      default=False)
+oparser.add_argument('--doc-hashes', dest='docHashes', action='store_true', default=False,
+                     help='Also write the HTML and plain text hashes of every document to hashes.xz, which is used '
+                          'by warc_shard.py gather to deduplicate documents across shards')
+oparser.add_argument('--framed', action='store_true', default=False,
+                     help='Write normalized_html, deboilerplate_html and plain_text in the framed record format '
+                          'instead of one base64 line per document')
+oparser.add_argument('--incremental', action='store_true', default=False,
+                     help='Add the documents of the records that are not in processed_records.xz of the output '
+                          'directory (by WARC-Record-ID or payload digest) to the existing output files, and write '
+                          'the 1-based indices of the new documents of every language to new_documents. Implies '
+                          '--doc-hashes, whose hashes are used to deduplicate the new documents against the old ones')
+oparser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                     help='Number of processes that preprocess the records in parallel')
+oparser.add_argument('--normalize', action='store_true', default=False,
+                     help='Read the original WARC file and normalize its HTML like warc2htmlwarc.py does, instead of '
+                          'reading the output of warc2htmlwarc.py')
+oparser.add_argument('--ftfy', action='store_true', default=False,
+                     help='With --normalize, use fix-text-for-you to fix possible encoding problems')
+oparser.add_argument('--cleanhtml', action='store_true', default=False,
+                     help='With --normalize, clean HTML to remove javascript, css and head tags')
+oparser.add_argument('--prefilter', dest='prefilter', default=None,
+                     help='With --normalize, rules that reject records from their headers (see warc_prefilter.py): '
+                          'JSON or YAML file, or a JSON object')
+oparser.add_argument('--mime-sniff', dest='mimeSniff', type=int, default=4096,
+                     help='Decide the MIME type of a document from its WARC/HTTP header and the markup of this many '
+                          'first characters, running libmagic only when they are not conclusive (see '
+                          'mime_resolver.py). 0 runs libmagic on every document')
+oparser.add_argument('--xz-preset', dest='xzPreset', type=int, default=6,
+                     help='Compression preset (0-9) of the xz output files')
+oparser.add_argument('--max-open-languages', dest='maxOpenLanguages', type=int, default=32,
+                     help='Maximum number of languages whose output files are open at the same time; the files of '
+                          'the language used least recently are closed, and appended to if it comes again')
+oparser.add_argument('--batch', dest='batch', default=None,
+                     help='Preprocess a list of WARC files one after the other in this process, instead of --input '
+                          'and --output-dir: a file with one job per line, the input WARC file, the output '
+                          'directory and optionally the output hash file separated by tabs, or - to read the jobs '
+                          'from stdin as they come. The workers, the JVM and the models are started once for all '
+                          'the jobs')
+oparser.add_argument('--batch-report', dest='batchReport', default=None,
+                     help='With --batch, file where a line is written when every job is done: OK or FAILED, the '
+                          'input, the output directory, the seconds it took and the error (stdout by default)')
 options = oparser.parse_args()
+if options.batch is None and options.outDir is None:
+    oparser.error("--output-dir or --batch is required")
+if options.incremental:
+    if options.xzlang:
+        oparser.error("--incremental can't be used with --xzlang")
+    options.docHashes = True
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s',
                     level=logging.INFO if options.verbose else logging.ERROR, datefmt='%Y-%m-%d %H:%M:%S')
 
-if options.input[-3:] == ".xz":
-    f = ArchiveIterator(lzma.open(options.input, 'r'))
-elif options.input[-3:] == ".gz":
-    f = ArchiveIterator(open(options.input, 'rb'))
-elif options.input == "-":
-    f = ArchiveIterator(sys.stdin.buffer)
+# the parsers and normalizers are only imported when the options use them (boilerpipe by start_jvm())
+if options.parser == "alcazar":
+    import alcazar.bodytext
+elif options.parser == "bs4":
+    from bs4 import BeautifulSoup
+elif options.parser == "modest":
+    from selectolax.parser import HTMLParser
+elif options.parser == "lxml":
+    from html_text import lxml_text
 else:
-    f = ArchiveIterator(open(options.input, 'r'))
+    from html_text import SimpleParser
+if options.neologdn:
+    import neologdn
+if options.normalize:
+    # imported once here rather than by every worker
+    if options.ftfy:
+        import ftfy  # noqa: F401
+    if options.cleanhtml:
+        from warc2htmlwarc import get_cleaner
+        get_cleaner()
 
 seen_html = set()
 seen_plain_text = set()
 
-magic.Magic(mime=True)
+mime_resolver = MimeResolver(options.mimeSniff)
 
 languages = []
 banned = []
-if options.langid == "cld3":
-    import cld3
-    cld3model = cld3.LanguageIdentifier()
-else:
-    import pycld2 as cld2
+guess_lang = LanguageDetector(options.langid, options.lidSample, options.lidMinPercent)
 
 if options.langs:
     for l in options.langs.split(','):
@@ -175,90 +210,96 @@ if languages:
 
 previous_crawl_hashes = set()
 
-if not os.path.exists(options.outDir):
-    os.makedirs(options.outDir)
-
 if options.inputHash:
-    with lzma.open(options.inputHash, "r") as fh:
-        for line in fh:
-            previous_crawl_hashes.add(int(line.strip()))
+    if is_hash_store(options.inputHash):
+        # memory-mapped, shared with the other jobs through the page cache
+        previous_crawl_hashes = HashStore(options.inputHash)
+    else:
+        with lzma.open(options.inputHash, "r") as fh:
+            for line in fh:
+                previous_crawl_hashes.add(int(line.strip()))
 
-if options.outputHash:
-    plainTextHashFile = lzma.open(options.outputHash, "w")
+if options.nearDedup:
+    from near_dedup import MinHasher, NearDuplicateIndex
+    minhasher = MinHasher()
+# opened by the writer, the workers only compute the signatures
+near_dedup_index = None
 
-files_dict = dict()
 
-for record in f:
-    # Initial checks
-    if record.rec_type != 'response' and record.rec_type != 'resource':
-        continue
-    if record.rec_headers.get_header('WARC-Target-URI')[0] == '<' and record.rec_headers.get_header('WARC-Target-URI')[-1] == '>':
-        url = record.rec_headers.get_header('WARC-Target-URI')[1:-1]
+def read_records(archive):
+    # Initial checks, done by the reader: only what is left is sent to preprocess_record()
+    for record in archive:
+        if record.rec_type != 'response' and record.rec_type != 'resource':
+            continue
+        if record.rec_headers.get_header('WARC-Target-URI')[0] == '<' and record.rec_headers.get_header('WARC-Target-URI')[-1] == '>':
+            url = record.rec_headers.get_header('WARC-Target-URI')[1:-1]
+        else:
+            url = record.rec_headers.get_header('WARC-Target-URI')
+        if url == "unknown":
+            logging.info("Skipping page with unknown URL")
+            continue
+        url = url.lower()
+        url = url.replace('\t', ' ')
+        if url[-4:] == ".gif" or url[-4:] == ".jpg" or url[-5:] == ".jpeg" or url[-4:] == ".png" or url[-4:] == ".css" or url[-3:] == ".js" or url[-4:] == ".mp3" or url[-4:] == ".mp4" or url[-4:] == ".ogg" or url[-5:] == ".midi" or url[-4:] == ".swf":
+            continue
+
+        # Ignore robots.txt when processing records
+        if url[-11:] == "/robots.txt":
+            continue
+
+        payload = record.content_stream().read()
+        date = record.rec_headers.get_header('WARC-Date')
+        recordId = record.rec_headers.get_header('WARC-Record-ID')
+        content_type = record.http_headers.get_header('Content-Type') if record.http_headers else record.content_type
+        yield url, payload, date, recordId, False, content_type
+
+
+def read_normalized_records(archive, prefilter):
+    # --normalize: the records are filtered by warc2htmlwarc.py's checks and their payloads are normalized by
+    # preprocess_record(), so the documents never go through a WARC writer and reader and their encoding is
+    # detected once, on the original payload
+    for record in read_raw_records(archive, prefilter):
+        for payload in record.payloads:
+            content_type = record.http_headers.get_header('Content-Type') if record.http_headers else \
+                record.warc_content_type
+            yield record.url, payload, record.date, record.recordId, True, content_type
+
+
+def preprocess_record(item, seen=None):
+    """Everything that only depends on the record itself: encoding, language, boilerplate removal, text extraction
+    and MIME. Returns None for records that are discarded before their language is known, otherwise a dict with
+    the language and, unless the record is discarded, everything the writer needs. Deduplication depends on the
+    records that came before and is left to the writer; when it is given, the set of HTML hashes already seen
+    is used to skip the text extraction of repeated files."""
+    url, payload, date, recordId, raw, contentType = item
+
+    if raw:
+        orig_encoding, text = normalize_payload(url, payload, options.cleanhtml, options.ftfy)
     else:
-        url = record.rec_headers.get_header('WARC-Target-URI')
-    if url == "unknown":
-        logging.info("Skipping page with unknown URL")
-        continue
-    url = url.lower()
-    url = url.replace('\t', ' ')
-    if url[-4:] == ".gif" or url[-4:] == ".jpg" or url[-5:] == ".jpeg" or url[-4:] == ".png" or url[-4:] == ".css" or url[-3:] == ".js" or url[-4:] == ".mp3" or url[-4:] == ".mp4" or url[-4:] == ".ogg" or url[-5:] == ".midi" or url[-4:] == ".swf":
-        continue
-
-    # Ignore robots.txt when processing records
-    if url[-11:] == "/robots.txt":
-        continue
-
-    payload = record.content_stream().read()
-
-    # We convert into UTF8 first of all
-    orig_encoding, text = convert_encoding(payload)
-    logging.info("Processing document: " + url)
+        # We convert into UTF8 first of all
+        orig_encoding, text = convert_encoding(payload)
+        logging.info("Processing document: " + url)
     if orig_encoding is None:
         logging.info("Encoding of document " + url + " could not be identified")
-        continue
-
-    date = record.rec_headers.get_header('WARC-Date')
-    recordId = record.rec_headers.get_header('WARC-Record-ID')
+        return None
 
     if len(text.strip()) == 0:
-        continue
+        return None
 
     # lang id
     logging.info(url + ": detecting language")
-    lang = ""
-
-    if options.langid == "cld3":
-        lang = guess_lang_from_data3(cld3model, text)
-    else:
-        lang = guess_lang_from_data2(text)
+    lang = guess_lang(text)
 
     if (len(languages) > 0 and lang not in languages) or (lang in banned):
         logging.info("Language of document " + url + ": " +
                      lang + ". Not among searched languages.")
-        continue
+        return None
 
     if lang == "un":
         logging.info("Language of document " + url + " could not be identified")
-        continue
-
-    if not options.xzlang and lang not in files_dict:
-        if not os.path.exists(options.outDir + "/" + lang):
-            os.makedirs(options.outDir + "/" + lang)
-        urlFile = lzma.open(options.outDir + "/" + lang + "/url.xz", "w")
-        encodingFile = lzma.open(options.outDir + "/" + lang + "/encoding.xz", "w")
-        mimeFile = lzma.open(options.outDir + "/" + lang + "/mime.xz", "w")
-        normHtmlFile = lzma.open(options.outDir + "/" + lang + "/normalized_html.xz", "w")
-        plainTextFile = lzma.open(options.outDir + "/" + lang + "/plain_text.xz", "w")
-        if options.boilerpipe:
-            deboilFile = lzma.open(options.outDir + "/" + lang + "/" + "deboilerplate_html.xz", "w")
-            files_dict[lang] = {"urlFile": urlFile, "encodingFile": encodingFile, "mimeFile": mimeFile,
-                                "normHtmlFile": normHtmlFile, "plainTextFile": plainTextFile, "deboilFile": deboilFile}
-        else:
-            if not os.path.exists(options.outDir + "/" + lang + "/" + "deboilerplate_html.xz") and not os.path.islink(options.outDir + "/" + lang + "/" + "deboilerplate_html.xz"):
-                os.symlink("normalized_html.xz", options.outDir +
-                           "/" + lang + "/" + "deboilerplate_html.xz")
-            files_dict[lang] = {"urlFile": urlFile, "encodingFile": encodingFile,
-                                "mimeFile": mimeFile, "normHtmlFile": normHtmlFile, "plainTextFile": plainTextFile}
+        return None
+
+    result = {"url": url, "lang": lang, "plaintext": None}
 
     # If enabled, remove boilerplate HTML
     if options.boilerpipe:
@@ -275,11 +316,9 @@ for record in f:
 
     # We compute a hash on the HTML (either normalized one or after boilerpipe if enabled):
     # if we get duplicate files we discard them
-    html_hash = mmh3.hash(normed_text, signed=False)
-    # checking for duplicate content (duplicates are discarded)
-    if html_hash in seen_html:
-        logging.info("Repeated file:\t" + url)
-        continue
+    result["html_hash"] = mmh3.hash(normed_text, signed=False)
+    if seen is not None and result["html_hash"] in seen:
+        return result
 
     # get text with Alcazar library
     if options.parser == "alcazar":
@@ -297,7 +336,7 @@ for record in f:
             soup = BeautifulSoup(deboiled, "lxml")
         except Exception as ex:
             logging.info("Exception ocurred when processing " + url + " with BeautifulSoup")
-            continue
+            return result
 
         for script in soup(["script", "style", "img"]):
             script.extract()  # rip it out
@@ -310,7 +349,7 @@ for record in f:
             tree = HTMLParser(deboiled)
         except:
             logging.info("Tree structure issues in HTML/XML. Ignoring this document")
-            continue
+            return result
         for tag in tree.css('script'):
             tag.decompose()
         for tag in tree.css('style'):
@@ -319,9 +358,18 @@ for record in f:
             tag.decompose()
         if tree.body is None:
             logging.info("Body is empty. Ignoring this document")
-            continue
+            return result
         plaintext = tree.body.text(separator='\n')
 
+    # or get text from the events of the lxml parser, without building a tree
+    elif options.parser == "lxml":
+        logging.info(url + ": Getting text with lxml")
+        try:
+            plaintext = lxml_text(deboiled)
+        except Exception:
+            logging.info("Exception ocurred when processing " + url + " with lxml")
+            return result
+
     # or use an HTML tokenizer
     else:
         logging.info(url + ": Getting text with HTML tokenizer")
@@ -329,63 +377,328 @@ for record in f:
         parser.feed(text)
         plaintext = parser.get_text()
 
-    plaintext = re.sub(r"\n+", "\n", re.sub(r" *\n *", "\n", re.sub(r"^\s+$", "\n",
-                                                                    re.sub(r" +", " ", re.sub(r"\r", "", plaintext.replace(u'\xa0', u' ')))))).strip()
-    plaintext_hash = mmh3.hash(plaintext, signed=False)
+    plaintext = normalize_plaintext(plaintext)
+    result["plaintext"] = plaintext
+    result["plaintext_hash"] = mmh3.hash(plaintext, signed=False)
+    if options.nearDedup:
+        result["signature"] = minhasher.signature(plaintext)
+
+    if len(plaintext) > 0:
+        # Guessing MIME of the file (checked on original content)
+        logging.info(url + ": Getting mime")
+        result["mime"], result["mimeSource"] = mime_resolver.resolve(text, contentType)
+        result["encoding"] = orig_encoding
+        if not options.xzlang:
+            result["norm"] = document_record(text)
+            if options.boilerpipe:
+                result["deboil"] = document_record(deboiled)
+            result["text"] = document_record(html.unescape(plaintext))
+        else:
+            result["date"] = date
+            result["recordId"] = recordId
+    return result
+
+
+def document_record(text):
+    # what is written for a document to normalized_html, deboilerplate_html and plain_text
+    if options.framed:
+        return (text.encode(),)
+    return base64.b64encode(text.encode()) + b"\n"
+
+
+class LanguageFiles(dict):
+    """The output files of a language by name (urlFile, plainTextFile...), closed together."""
+
+    def close(self):
+        for writer in self.values():
+            writer.close()
+
+    def abort(self):
+        for writer in self.values():
+            writer.abort()
+
+
+def open_language_files(lang, reopen=False):
+    # every file is compressed by its own thread, so this process only has to parse and classify the records
+    if not os.path.exists(options.outDir + "/" + lang):
+        os.makedirs(options.outDir + "/" + lang)
+
+    def open_file(name, writer_class=BlockXzWriter):
+        return writer_class(options.outDir + "/" + lang + "/" + name, append=options.incremental or reopen,
+                            preset=options.xzPreset, background=True)
+
+    DocumentWriter = FramedBlockXzWriter if options.framed else BlockXzWriter
+    files = LanguageFiles(urlFile=open_file("url.xz"), encodingFile=open_file("encoding.xz"),
+                          mimeFile=open_file("mime.xz"), normHtmlFile=open_file("normalized_html.xz", DocumentWriter),
+                          plainTextFile=open_file("plain_text.xz", DocumentWriter))
+    if options.docHashes:
+        files["hashesFile"] = open_file("hashes.xz")
+    if options.boilerpipe:
+        files["deboilFile"] = open_file("deboilerplate_html.xz", DocumentWriter)
+    else:
+        if not os.path.exists(options.outDir + "/" + lang + "/" + "deboilerplate_html.xz") and not os.path.islink(options.outDir + "/" + lang + "/" + "deboilerplate_html.xz"):
+            os.symlink("normalized_html.xz", options.outDir +
+                       "/" + lang + "/" + "deboilerplate_html.xz")
+    return files
+
+
+def open_xz(path, mode="w"):
+    return BackgroundWriter(lzma.open(path, mode, format=lzma.FORMAT_XZ, preset=options.xzPreset))
+
+
+def open_language_file(lang, reopen=False):
+    # --xzlang: the documents of every language are added to a single file by every run
+    return open_xz(options.outDir + "/" + lang, "a")
+
+
+def load_processed(path):
+    """WARC-Record-IDs and payload digests of the records processed by earlier --incremental runs."""
+    record_ids, digests = set(), set()
+    if os.path.exists(path):
+        # only the indexed blocks: what an interrupted run wrote after them is dropped when this run writes
+        index = read_file_index(path, complete=False)
+        with open(path, "rb") as reader:
+            data = reader.read(index[-2]) if index is not None else reader.read()
+        for line in lzma.decompress(data).decode().splitlines():
+            record_id, digest = line.split("\t")
+            record_ids.add(record_id)
+            digests.add(digest)
+    return record_ids, digests
+
+
+def skip_processed(records, record_ids, digests, processed):
+    # the record IDs of the WARC files written by warc2htmlwarc.py change on every run, so the records are also
+    # recognised by the digest of their payload; processed gets the records that are read now
+    skipped = 0
+    for item in records:
+        url, payload, date, recordId, raw, contentType = item
+        digest = "{0:032x}".format(mmh3.hash128(payload, signed=False))
+        if recordId in record_ids or digest in digests:
+            skipped += 1
+            continue
+        digests.add(digest)
+        processed.append((recordId, digest))
+        yield item
+    logging.info("{0} records already processed".format(skipped))
+
+
+def reopen_language_files():
+    """Opens the output files of the languages of earlier --incremental runs to add documents to them, and loads
+    the hashes of their documents. Returns the number of documents of every language."""
+    old_documents = {}
+    for lang in sorted(os.listdir(options.outDir)):
+        if not os.path.exists(os.path.join(options.outDir, lang, "url.xz")):
+            continue
+        hashes_path = os.path.join(options.outDir, lang, "hashes.xz")
+        if not os.path.exists(hashes_path):
+            raise ValueError("{0} has no hashes.xz, it was not written with --incremental".format(
+                os.path.join(options.outDir, lang)))
+        if is_framed_file(os.path.join(options.outDir, lang, "plain_text.xz")) != options.framed:
+            raise ValueError("{0} was written {1} --framed".format(os.path.join(options.outDir, lang),
+                                                                  "without" if options.framed else "with"))
+        old_documents[lang] = files_dict.get(lang)["urlFile"].lines
+        # the writers have dropped what an interrupted run wrote after the indexed documents
+        with IndexedDocumentReader(hashes_path) as hashes:
+            for i in range(len(hashes)):
+                html_hash, plaintext_hash = hashes[i].split("\t")
+                seen_html.add(int(html_hash))
+                seen_plain_text.add(int(plaintext_hash))
+    return old_documents
+
+
+def write_record(result):
+    # Deduplication and output, in the order of the records in the WARC file
+    global near_dedup_index
+    if result is None:
+        return
+    url = result["url"]
+    if "mimeSource" in result:
+        mime_resolver.record(result["mimeSource"])
+    lang = result["lang"]
+
+    if not options.xzlang:
+        # the output files of a language are created when its first document is found, even if every document of
+        # the language turns out to be a duplicate
+        files_dict.get(lang)
+
+    # checking for duplicate content (duplicates are discarded)
+    if result["html_hash"] in seen_html:
+        logging.info("Repeated file:\t" + url)
+        return
+
+    plaintext = result["plaintext"]
+    if plaintext is None:
+        return
+    plaintext_hash = result["plaintext_hash"]
 
     if plaintext_hash in seen_plain_text or plaintext_hash in previous_crawl_hashes:
         logging.info("Repeated plain text file:\t" + url)
-        continue
+        return
+
+    if options.nearDedup and len(plaintext) > 0:
+        if near_dedup_index is None:
+            near_dedup_index = NearDuplicateIndex(options.nearDedup, options.nearDedupThreshold)
+        duplicate = near_dedup_index.add(url, result["signature"])
+        if duplicate:
+            logging.info("Near duplicate plain text file:\t" + url + "\t" + duplicate)
+            return
 
     if len(plaintext) > 0:
 
-        seen_html.add(html_hash)
+        seen_html.add(result["html_hash"])
         seen_plain_text.add(plaintext_hash)
-        # Guessing MIME of the file (checked on original content)
-        logging.info(url + ": Getting mime")
-        mime = magic.from_buffer(text, mime=True)
+        mime = result["mime"]
 
         if not options.xzlang:
-            files_dict[lang]["mimeFile"].write(mime.encode() + b"\n")
-            files_dict[lang]["urlFile"].write(url.encode() + b"\n")
-            files_dict[lang]["encodingFile"].write(orig_encoding.encode() + b"\n")
-
-            b64norm = base64.b64encode(text.encode())
-            files_dict[lang]["normHtmlFile"].write(b64norm + b"\n")
-
+            files = files_dict.get(lang)
+            files["mimeFile"].write(mime.encode() + b"\n")
+            files["urlFile"].write(url.encode() + b"\n")
+            files["encodingFile"].write(result["encoding"].encode() + b"\n")
+            files["normHtmlFile"].write(result["norm"])
             if options.boilerpipe:
-                b64deboil = base64.b64encode(deboiled.encode())
-                files_dict[lang]["deboilFile"].write(b64deboil + b"\n")
-
-            b64text = base64.b64encode(html.unescape(plaintext).encode())
-            files_dict[lang]["plainTextFile"].write(b64text + b"\n")
+                files["deboilFile"].write(result["deboil"])
+            files["plainTextFile"].write(result["text"])
+            if options.docHashes:
+                files["hashesFile"].write("{0}\t{1}\n".format(result["html_hash"], plaintext_hash).encode())
         # append to language specific file
         else:
-            langfile = lzma.open(options.outDir + "/" + lang, mode="a", format=lzma.FORMAT_XZ)
             header = "Content-Location: " + url + "\n"
             header += "Content-Type: " + mime + "\n"
             header += "Content-Language: " + lang + "\n"
             header += "Content-Length: " + str(len(plaintext)) + "\n"
-            header += "Date: " + date + "\n"
-            header += "X-WARC-Record-ID: " + recordId + "\n"
+            header += "Date: " + result["date"] + "\n"
+            header += "X-WARC-Record-ID: " + result["recordId"] + "\n"
             header += "X-WARC-Filename: " + options.input + "\n"
-            langfile.write(header.encode())
-            langfile.write(b"\n")
-            langfile.write(plaintext.encode())
-            langfile.write(b"\n")
-            langfile.close()
+            files_dict.get(lang).write(header.encode() + b"\n" + plaintext.encode() + b"\n")
 
         if options.outputHash:
             plainTextHashFile.write(str(plaintext_hash).encode() + b"\n")
 
-if not options.xzlang:
-    for lang in files_dict:
-        files_dict[lang]["urlFile"].close()
-        files_dict[lang]["encodingFile"].close()
-        files_dict[lang]["mimeFile"].close()
-        files_dict[lang]["normHtmlFile"].close()
-        files_dict[lang]["plainTextFile"].close()
-        if options.boilerpipe:
-            files_dict[lang]["deboilFile"].close()
-if options.outputHash:
-    plainTextHashFile.close()
+
+def open_archive(path):
+    if path[-3:] == ".xz":
+        return lzma.open(path, 'r')
+    elif path == "-":
+        return sys.stdin.buffer
+    return open(path, 'rb')
+
+
+def preprocess_warc(input_path, out_dir, output_hash, pool=None):
+    """Preprocesses a WARC file into out_dir. The deduplication and the output files are per WARC file; the
+    languages, the hashes of the previous crawl, the near duplicate index and the workers are shared by all the
+    jobs of a --batch run."""
+    global files_dict, seen_html, seen_plain_text, plainTextHashFile
+    options.input, options.outDir, options.outputHash = input_path, out_dir, output_hash
+    files_dict = WriterPool(open_language_file if options.xzlang else open_language_files,
+                            options.maxOpenLanguages)
+    plainTextHashFile = None
+    seen_html = set()
+    seen_plain_text = set()
+    mime_resolver.counts.clear()
+
+    reader = open_archive(input_path)
+    try:
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        if output_hash:
+            # like the language files, an --incremental run adds blocks after the ones in the index, which drops
+            # what an interrupted run wrote
+            plainTextHashFile = BlockXzWriter(output_hash, append=options.incremental, preset=options.xzPreset,
+                                              background=True)
+        f = ArchiveIterator(reader)
+        prefilter = get_prefilter(options.prefilter) if options.normalize else None
+        records = read_normalized_records(f, prefilter) if options.normalize else read_records(f)
+        if options.incremental:
+            processed_path = os.path.join(out_dir, "processed_records.xz")
+            processed = []
+            old_documents = reopen_language_files()
+            records = skip_processed(records, *load_processed(processed_path), processed)
+        if pool:
+            # records are preprocessed by a pool of workers and written by this process in their original order, so
+            # the output is the same as with a single process
+            for result in bounded_imap(pool, preprocess_record, records, max_pending=options.jobs * 64,
+                                       chunksize=8):
+                write_record(result)
+        else:
+            for item in records:
+                write_record(preprocess_record(item, seen_html))
+    except BaseException:
+        # the files are left as an interrupted run leaves them, without the blocks that were not written yet
+        files_dict.abort()
+        if plainTextHashFile:
+            plainTextHashFile.abort()
+        raise
+    finally:
+        if reader is not sys.stdin.buffer:
+            reader.close()
+
+    files_dict.close()
+    if output_hash:
+        plainTextHashFile.close()
+    if options.incremental:
+        for lang in files_dict.keys():
+            with IndexedDocumentReader(os.path.join(out_dir, lang, "url.xz")) as urls:
+                documents = len(urls)
+            with open(os.path.join(out_dir, lang, "new_documents"), "w") as new_documents:
+                for i in range(old_documents.get(lang, 0), documents):
+                    new_documents.write("{0}\n".format(i + 1))
+        # written last, so that the records of an interrupted run are processed again by the next one, and with an
+        # index, so that what an interrupted write left is dropped by the next one
+        writer = BlockXzWriter(processed_path, append=True, preset=options.xzPreset)
+        for recordId, digest in processed:
+            writer.write("{0}\t{1}\n".format(recordId, digest).encode())
+        writer.close()
+    if prefilter:
+        prefilter.report()
+    mime_resolver.report()
+
+
+def start_pool():
+    return multiprocessing.get_context("fork").Pool(options.jobs, initializer=start_jvm if options.boilerpipe else None)
+
+
+def read_jobs(path):
+    reader = sys.stdin if path == "-" else open(path)
+    with reader:
+        # read a line at a time, so that the jobs can be queued through a pipe while the first ones are running
+        for line in iter(reader.readline, ""):
+            line = line.rstrip("\n")
+            if line.strip() and not line.startswith("#"):
+                yield line.split("\t")
+
+
+pool = start_pool() if options.jobs > 1 else None
+if not pool and options.boilerpipe:
+    start_jvm()
+failed = 0
+if options.batch:
+    report = open(options.batchReport, "w") if options.batchReport else sys.stdout
+    for job in read_jobs(options.batch):
+        start = time.time()
+        status, message = "OK", ""
+        try:
+            if len(job) not in (2, 3) or not job[0] or not job[1]:
+                raise ValueError("a job is an input WARC file, an output directory and optionally an output hash "
+                                 "file separated by tabs")
+            preprocess_warc(job[0], job[1], job[2] if len(job) == 3 and job[2] else None, pool)
+        except Exception as ex:
+            logging.exception("Job failed: " + "\t".join(job))
+            status, message = "FAILED", " ".join("{0}: {1}".format(type(ex).__name__, ex).split())
+            failed += 1
+            if pool:
+                # the workers may still be busy with the records of the failed job
+                pool.terminate()
+                pool = start_pool()
+        report.write("\t".join([status, job[0], job[1] if len(job) > 1 else "",
+                                 "{0:.1f}".format(time.time() - start), message]) + "\n")
+        report.flush()
+    if report is not sys.stdout:
+        report.close()
+else:
+    preprocess_warc(options.input, options.outDir, options.outputHash, pool)
+if pool:
+    pool.terminate()
+if near_dedup_index:
+    near_dedup_index.close()
+if failed:
+    sys.exit(1)
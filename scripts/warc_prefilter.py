@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Rules that reject WARC records from their headers, before their payload is read. warc2htmlwarc.py (and
+# warc2preprocess.py --normalize) apply them to every record; the rules are DEFAULT_RULES (the checks that
+# warc2htmlwarc.py always did) updated with the ones given in --prefilter, a JSON or YAML file or a JSON object,
+# e.g. the warcPrefilter setting of the Snakefile:
+#   record_types     WARC-Type of the records that are kept
+#   warc_mime_deny   substrings of the WARC Content-Type of the records that are rejected
+#   mime_allow       if not empty, the HTTP Content-Type must contain one of these substrings
+#   mime_deny        substrings of the HTTP Content-Type of the records that are rejected
+#   extension_deny   URL extensions (without the dot) of the records that are rejected
+#   url_allow        if not empty, the URL must match one of these regular expressions
+#   url_deny         regular expressions of the URLs that are rejected
+#   status           HTTP status codes that are kept, e.g. [200, "2xx", "300-399"]; all of them if empty
+#   min_length       minimum Content-Length of the record
+#   max_length       maximum Content-Length of the record
+# The URLs are lowercased before the extension and URL rules are applied. Run this script on a WARC file to see
+# what a set of rules rejects.
+
+import argparse
+import json
+import logging
+import re
+import sys
+from collections import Counter
+
+DEFAULT_RULES = {
+    "record_types": ["response", "resource"],
+    "warc_mime_deny": ["text/dns"],
+    "mime_allow": [],
+    "mime_deny": ["image/", "audio/", "video/", "text/x-component", "text/x-js", "text/javascript",
+                  "application/x-javascript", "text/css", "application/javascript", "application/x-shockwave-flash",
+                  "application/octet-stream", "application/x-font-ttf", "application/pdf"],
+    "extension_deny": ["gif", "jpg", "jpeg", "png", "css", "js", "mp3", "mp4", "ogg", "midi", "swf",
+                       "pdf", "odt", "ods", "odp", "docx", "pptx", "xlsx", "epub"],
+    "url_allow": [],
+    "url_deny": [r"/robots\.txt$"],
+    "status": [],
+    "min_length": 0,
+    "max_length": 5242880,
+}
+
+
+def load_rules(spec):
+    """Rules from a JSON object, a .json file or a .yaml/.yml file."""
+    if spec.lstrip().startswith("{"):
+        return json.loads(spec)
+    with open(spec) as reader:
+        if spec.endswith(".yaml") or spec.endswith(".yml"):
+            import yaml
+            return yaml.safe_load(reader) or {}
+        return json.load(reader)
+
+
+def compile_substrings(substrings):
+    if not substrings:
+        return None
+    return re.compile("|".join(re.escape(s.lower()) for s in substrings))
+
+
+def compile_patterns(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{0})".format(p) for p in patterns))
+
+
+def compile_status(codes):
+    """Set of the status codes given as numbers, "NNN", "Nxx" or "NNN-MMM"."""
+    allowed = set()
+    for code in codes:
+        code = str(code).strip().lower()
+        if code.endswith("xx"):
+            first = int(code[0]) * 100
+            allowed.update(range(first, first + 100))
+        elif "-" in code:
+            first, last = code.split("-")
+            allowed.update(range(int(first), int(last) + 1))
+        else:
+            allowed.add(int(code))
+    return allowed
+
+
+class WarcPrefilter(object):
+    """Compiled rules. check() returns the name of the first rule that rejects a record, or None, and counts the
+    rejections of every rule."""
+
+    def __init__(self, rules=None):
+        unknown = set(rules or {}) - set(DEFAULT_RULES)
+        if unknown:
+            raise ValueError("Unknown prefilter rules: {0}".format(", ".join(sorted(unknown))))
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.record_types = set(self.rules["record_types"])
+        self.warc_mime_deny = compile_substrings(self.rules["warc_mime_deny"])
+        self.mime_allow = compile_substrings(self.rules["mime_allow"])
+        self.mime_deny = compile_substrings(self.rules["mime_deny"])
+        self.extension_deny = {ext.lower().lstrip(".") for ext in self.rules["extension_deny"]}
+        self.url_allow = compile_patterns(self.rules["url_allow"])
+        self.url_deny = compile_patterns(self.rules["url_deny"])
+        self.status = compile_status(self.rules["status"])
+        self.min_length = int(self.rules["min_length"] or 0)
+        self.max_length = int(self.rules["max_length"]) if self.rules["max_length"] else None
+        self.counters = Counter()
+        self.kept = 0
+
+    def reject(self, rule):
+        self.counters[rule] += 1
+        return rule
+
+    def check(self, record, url):
+        """record is a warcio record whose payload hasn't been read, url its lowercased WARC-Target-URI."""
+        if record.rec_type not in self.record_types:
+            return self.reject("record_types")
+        if url == "unknown":
+            logging.info("Skipping page with unknown URL")
+            return self.reject("unknown_url")
+        if self.warc_mime_deny and self.warc_mime_deny.search((record.content_type or "").lower()):
+            return self.reject("warc_mime_deny")
+        length = record.rec_headers.get_header('Content-Length')
+        length = int(length) if length else 0
+        if length < self.min_length:
+            return self.reject("min_length")
+        if self.max_length is not None and length > self.max_length:
+            logging.info("Skipping page, over limit. " + str(length) + " " + url)
+            return self.reject("max_length")
+
+        http_headers = record.http_headers
+        if http_headers is not None:
+            # the status rule only applies to HTTP responses, resource records have no status
+            if self.status and (http_headers.protocol or "").startswith("HTTP/"):
+                try:
+                    status = int(http_headers.get_statuscode())
+                except (TypeError, ValueError):
+                    status = None
+                if status not in self.status:
+                    return self.reject("status")
+            content_type = http_headers.get_header('Content-Type')
+            if content_type is not None:
+                content_type = content_type.lower()
+                if self.mime_deny and self.mime_deny.search(content_type):
+                    return self.reject("mime_deny")
+                if self.mime_allow and not self.mime_allow.search(content_type):
+                    return self.reject("mime_allow")
+
+        if self.extension_deny and url.rpartition(".")[2] in self.extension_deny:
+            return self.reject("extension_deny")
+        if self.url_deny and self.url_deny.search(url):
+            return self.reject("url_deny")
+        if self.url_allow and not self.url_allow.search(url):
+            return self.reject("url_allow")
+        self.kept += 1
+        return None
+
+    def report(self, stream=sys.stderr):
+        total = self.kept + sum(self.counters.values())
+        stream.write("WARC prefilter: {0} records, {1} kept\n".format(total, self.kept))
+        for rule, count in self.counters.most_common():
+            stream.write("  {0:<16} {1:>10} rejected\n".format(rule, count))
+
+
+def get_prefilter(spec=None):
+    return WarcPrefilter(load_rules(spec) if spec else None)
+
+
+def target_uri(record):
+    url = record.rec_headers.get_header('WARC-Target-URI') or "unknown"
+    if url[0] == '<' and url[-1] == '>':
+        url = url[1:-1]
+    return url
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(description="Applies the prefilter rules to the records of WARC files and "
+                                                  "prints how many records every rule rejects.")
+    oparser.add_argument("warcs", nargs="+", help="WARC files")
+    oparser.add_argument("--prefilter", dest="prefilter", help="Rules: JSON or YAML file, or a JSON object")
+    oparser.add_argument("--print-kept", dest="printKept", action="store_true", default=False,
+                         help="Print the URLs of the records that are kept")
+    options = oparser.parse_args()
+
+    from warcio.archiveiterator import ArchiveIterator
+
+    prefilter = get_prefilter(options.prefilter)
+    for warc in options.warcs:
+        with open(warc, "rb") as reader:
+            for record in ArchiveIterator(reader):
+                url = target_uri(record).lower().replace('\t', ' ')
+                if prefilter.check(record, url) is None and options.printKept:
+                    print(url)
+    prefilter.report()
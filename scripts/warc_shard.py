@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Scatter/gather preprocessing of a large WARC.gz file. A WARC.gz file is a sequence of independent gzip members,
+# so it can be cut at the members that start a WARC record and every byte range is a valid WARC.gz file:
+#   index   finds the offsets of those members and writes them to an index file (one offset per line, the last
+#           line is the size of the file)
+#   plan    prints the byte ranges of N shards of similar compressed size
+#   cat     writes the bytes of one shard to the standard output, to be piped to warc2htmlwarc.py
+#   gather  merges the per-language outputs of warc2preprocess.py --doc-hashes for every shard, dropping the
+#           documents whose HTML or plain text hash was already seen in an earlier shard
+
+import argparse
+import bisect
+import logging
+import lzma
+import os
+import sys
+import zlib
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
+from common import open_xz_or_gzip_or_plain, open_documents, is_framed_file, BlockXzWriter, FramedBlockXzWriter
+
+GZIP_MAGIC = b"\x1f\x8b"
+DOCUMENT_FILES = ["url.xz", "encoding.xz", "mime.xz", "normalized_html.xz", "plain_text.xz"]
+
+
+def scan_members(path, chunk_size=1 << 20):
+    """Returns the offsets of the gzip members of path that start a WARC record, and the size of the file."""
+    offsets = []
+    with open(path, "rb") as reader:
+        offset = 0
+        start = 0
+        head = b""
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = b""
+        while True:
+            if not data:
+                data = reader.read(chunk_size)
+                if not data:
+                    break
+            out = decompressor.decompress(data, 1 << 22)
+            if len(head) < 5:
+                head += out[:5 - len(head)]
+            if decompressor.eof:
+                used = len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+            else:
+                used = len(data) - len(decompressor.unconsumed_tail)
+                data = decompressor.unconsumed_tail
+            offset += used
+            if decompressor.eof:
+                if head.startswith(b"WARC/"):
+                    offsets.append(start)
+                start = offset
+                head = b""
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if len(data) < 2:
+                    data += reader.read(chunk_size)
+                if data and data[:2] != GZIP_MAGIC:
+                    logging.warning("Data that is not gzip after offset {0} of {1} is ignored".format(start, path))
+                    break
+        # a truncated last member is kept, warcio reads what it can of it
+        if head.startswith(b"WARC/") and start < offset:
+            offsets.append(start)
+        size = reader.seek(0, os.SEEK_END)
+    return offsets, size
+
+
+def write_index(index_path, offsets, size):
+    with open(index_path, "w") as writer:
+        for offset in offsets:
+            writer.write("{0}\n".format(offset))
+        writer.write("{0}\n".format(size))
+
+
+def read_index(index_path):
+    with open(index_path) as reader:
+        values = [int(line) for line in reader if line.strip()]
+    return values[:-1], values[-1]
+
+
+def plan(offsets, size, n_shards):
+    """Byte ranges of n_shards shards of similar compressed size, cut only at members that start a record."""
+    if not offsets:
+        return [(0, 0)] * n_shards
+    cuts = [0]
+    for i in range(1, n_shards):
+        k = bisect.bisect_left(offsets, size * i // n_shards)
+        cuts.append(offsets[k] if k < len(offsets) else size)
+    cuts.append(size)
+    # bytes before the first record (if any) go with the first shard
+    return [(cuts[i], max(cuts[i], cuts[i + 1])) for i in range(n_shards)]
+
+
+def copy_range(path, start, end, writer, chunk_size=1 << 20):
+    with open(path, "rb") as reader:
+        reader.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = reader.read(min(chunk_size, remaining))
+            if not data:
+                break
+            writer.write(data)
+            remaining -= len(data)
+
+
+def read_lines(path):
+    with open_xz_or_gzip_or_plain(path) as reader:
+        for line in reader:
+            yield line.rstrip("\n")
+
+
+def read_documents(path):
+    with open_documents(path) as reader:
+        yield from reader
+
+
+def gather(shard_dirs, output_dir, output_hash=None):
+    langs = sorted({lang for shard_dir in shard_dirs if os.path.isdir(shard_dir)
+                    for lang in os.listdir(shard_dir) if os.path.isdir(os.path.join(shard_dir, lang))})
+    seen_html = set()
+    seen_plain_text = set()
+    hash_writer = lzma.open(output_hash, "w") if output_hash else None
+    for lang in langs:
+        lang_dirs = [os.path.join(shard_dir, lang) for shard_dir in shard_dirs
+                     if os.path.isdir(os.path.join(shard_dir, lang))]
+        deboiled = any(not os.path.islink(os.path.join(d, "deboilerplate_html.xz")) and
+                       os.path.exists(os.path.join(d, "deboilerplate_html.xz")) for d in lang_dirs)
+        names = DOCUMENT_FILES + (["deboilerplate_html.xz"] if deboiled else [])
+        out_dir = os.path.join(output_dir, lang)
+        os.makedirs(out_dir, exist_ok=True)
+        # the document files of warc2preprocess.py --framed are framed, the others have one line per document
+        framed = [is_framed_file(os.path.join(lang_dirs[0], name)) for name in names]
+        writers = [(FramedBlockXzWriter if is_framed else BlockXzWriter)(os.path.join(out_dir, name))
+                   for name, is_framed in zip(names, framed)]
+        if not deboiled:
+            link = os.path.join(out_dir, "deboilerplate_html.xz")
+            if not os.path.lexists(link):
+                os.symlink("normalized_html.xz", link)
+        kept, dropped = 0, 0
+        for lang_dir in lang_dirs:
+            if not os.path.exists(os.path.join(lang_dir, "hashes.xz")):
+                raise ValueError("{0} has no hashes.xz, run warc2preprocess.py with --doc-hashes".format(lang_dir))
+            readers = [read_documents(os.path.join(lang_dir, name)) for name in names]
+            for hashes in read_lines(os.path.join(lang_dir, "hashes.xz")):
+                html_hash, plaintext_hash = hashes.split("\t")
+                lines = [next(reader, None) for reader in readers]
+                if None in lines:
+                    raise ValueError("{0}: {1} has fewer documents than hashes.xz".format(
+                        lang_dir, names[lines.index(None)]))
+                if html_hash in seen_html or plaintext_hash in seen_plain_text:
+                    dropped += 1
+                    continue
+                seen_html.add(html_hash)
+                seen_plain_text.add(plaintext_hash)
+                for writer, line in zip(writers, lines):
+                    writer.write((line,) if isinstance(line, bytes) else line.encode("utf-8") + b"\n")
+                if hash_writer:
+                    hash_writer.write(plaintext_hash.encode() + b"\n")
+                kept += 1
+        for writer in writers:
+            writer.close()
+        logging.info("{0}: {1} documents, {2} duplicates across shards".format(lang, kept, dropped))
+    if hash_writer:
+        hash_writer.close()
+
+
+if __name__ == "__main__":
+    oparser = argparse.ArgumentParser(
+        description="Splits a WARC.gz file into shards at gzip member boundaries and merges the outputs of "
+                    "warc2preprocess.py for the shards.")
+    subparsers = oparser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    index_parser = subparsers.add_parser("index", help="Build the index of the members that start a record")
+    index_parser.add_argument("warc", help="WARC.gz file")
+    index_parser.add_argument("-o", "--output", dest="output", help="Index file (WARC.gz file + '.members' by "
+                                                                     "default)")
+
+    for name, help_text in [("plan", "Print the byte ranges of the shards"),
+                            ("cat", "Write a shard to the standard output")]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("warc", help="WARC.gz file")
+        subparser.add_argument("--index", dest="index", help="Index file built by 'index' (scanned if not given)")
+        subparser.add_argument("-n", "--shards", dest="shards", type=int, required=True, help="Number of shards")
+        if name == "cat":
+            subparser.add_argument("-s", "--shard", dest="shard", type=int, required=True,
+                                   help="Shard to write, from 0 to shards-1")
+
+    gather_parser = subparsers.add_parser("gather", help="Merge the preprocessed shards")
+    gather_parser.add_argument("shard_dirs", nargs="+", help="Output directories of warc2preprocess.py, in shard "
+                                                             "order")
+    gather_parser.add_argument("--output-dir", dest="outDir", required=True, help="Output directory")
+    gather_parser.add_argument("--output_hash", dest="outputHash", help="Output path for Murmur Hash of plain texts")
+    gather_parser.add_argument("--verbose", action="store_true", default=False)
+
+    options = oparser.parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s',
+                        level=logging.INFO if getattr(options, "verbose", False) else logging.WARNING,
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    if options.command == "index":
+        offsets, size = scan_members(options.warc)
+        write_index(options.output or options.warc + ".members", offsets, size)
+    elif options.command in ("plan", "cat"):
+        if options.index:
+            offsets, size = read_index(options.index)
+        else:
+            offsets, size = scan_members(options.warc)
+        shards = plan(offsets, size, options.shards)
+        if options.command == "plan":
+            for i, (start, end) in enumerate(shards):
+                print("{0}\t{1}\t{2}".format(i, start, end))
+        else:
+            start, end = shards[options.shard]
+            copy_range(options.warc, start, end, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+    else:
+        gather(options.shard_dirs, options.outDir, options.outputHash)
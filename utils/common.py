@@ -17,23 +17,107 @@ except ImportError:
 #  You should have received a copy of the GNU General Public License
 #  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
 
+import base64
+import bisect
 import gzip
+import io
+import os
+import queue
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
 from contextlib import contextmanager
 
+# Compression codecs: file suffix, magic bytes and the shell commands that compress the standard input to the
+# standard output, decompress a file to the standard output and decompress several files, one after the other, to
+# the standard output. The transient files of the pipeline use the codec set by transientCodec in the Snakefile,
+# the rest of the files are xz.
+Codec = namedtuple("Codec", ["name", "suffix", "magic", "compress", "decompress", "decompress_many"])
+CODECS = OrderedDict([
+    ("xz", Codec("xz", ".xz", b"\xfd7zXZ\x00", "xz -T 0 -c", "xz -T 0 -dcf", "xz -T 0 -dcf")),
+    ("gzip", Codec("gzip", ".gz", b"\x1f\x8b", "gzip -c", "gzip -dcf", "gzip -dcf")),
+    ("zstd", Codec("zstd", ".zst", b"\x28\xb5\x2f\xfd", "zstd -T0 -q -c", "zstd -dcq", "zstd -dcq")),
+    # lz4 takes a second file name as the output file unless -m is given
+    ("lz4", Codec("lz4", ".lz4", b"\x04\x22\x4d\x18", "lz4 -q -c", "lz4 -dcq", "lz4 -dcqm")),
+    ("none", Codec("none", "", b"", "cat", "cat", "cat")),
+])
+
+
+def get_codec(name):
+    if name not in CODECS:
+        raise ValueError("Unknown codec '{0}', available: {1}".format(name, ", ".join(CODECS)))
+    return CODECS[name]
+
+
+def codec_of_path(file_path):
+    """Codec of a file to be written, from its suffix."""
+    for codec in CODECS.values():
+        if codec.suffix and file_path.endswith(codec.suffix):
+            return codec
+    return CODECS["none"]
+
+
+def codec_of_data(head):
+    """Codec of a file from its first bytes."""
+    for codec in CODECS.values():
+        if codec.magic and head.startswith(codec.magic):
+            return codec
+    return CODECS["none"]
+
+
+def _open_codec(codec, file_path, mode):
+    if codec.name == "xz":
+        return lzma.open(file_path, mode)
+    if codec.name == "gzip":
+        return gzip.open(file_path, mode)
+    if codec.name == "zstd":
+        # optional dependencies, only needed when the files are written with these codecs
+        import zstandard
+        f = zstandard.open(file_path, mode)
+        # the zstandard reader can't be iterated by lines nor peeked (is_framed_stream())
+        return io.BufferedReader(f) if mode.startswith("r") else f
+    if codec.name == "lz4":
+        import lz4.frame
+        return lz4.frame.open(file_path, mode)
+    return open(file_path, mode)
+
+
+def open_compressed(file_path, mode="rb", codec=None, encoding="utf-8", errors=None):
+    """Opens a file compressed with any of CODECS. Files are read with the codec of their magic bytes, whatever
+    their name, and written with the codec of their suffix or the given codec (a name or a Codec). Text modes
+    ("rt", "wt", "at") return str."""
+    binary_mode = mode.replace("t", "")
+    if "b" not in binary_mode:
+        binary_mode += "b"
+    if binary_mode.startswith("r"):
+        with open(file_path, "rb") as f:
+            codec = codec_of_data(f.read(8))
+    elif codec is None:
+        codec = codec_of_path(file_path)
+    elif isinstance(codec, str):
+        codec = get_codec(codec)
+    f = _open_codec(codec, file_path, binary_mode)
+    if "t" in mode:
+        return io.TextIOWrapper(f, encoding=encoding, errors=errors)
+    return f
+
 
 @contextmanager
 def open_xz_or_gzip_or_plain(file_path):
+    # the name is kept from when only xz and gzip were read: files compressed with any of CODECS are read,
+    # whatever their suffix
     def decode_text(file_handler):
         for line in file_handler:
             yield line.decode('utf-8')
 
     f = None
     try:
-        if file_path[-3:] == ".gz":
-            f = gzip.open(file_path, 'rb')
-            yield decode_text(f)
-        elif file_path[-3:] == ".xz":
-            f = lzma.open(file_path, 'rb')
+        with open(file_path, "rb") as head:
+            codec = codec_of_data(head.read(8))
+        if codec.name != "none":
+            f = _open_codec(codec, file_path, "rb")
             yield decode_text(f)
         else:
             f = open(file_path, 'r')
@@ -47,6 +131,34 @@ def open_xz_or_gzip_or_plain(file_path):
             f.close()
 
 
+def bounded_imap(pool, func, iterable, max_pending=1024, chunksize=1):
+    """pool.imap() that reads at most max_pending items of iterable ahead of the results consumed.
+
+    Pool.imap() feeds the whole input to the workers as fast as it can read it, which keeps a large input (e.g.
+    the records of a WARC file) in memory when the results are consumed more slowly.
+    """
+    # a whole chunk has to be read before it is sent to a worker
+    pending = threading.Semaphore(max(max_pending, chunksize))
+    stopped = threading.Event()
+
+    def feed():
+        for item in iterable:
+            pending.acquire()
+            if stopped.is_set():
+                return
+            yield item
+
+    try:
+        for result in pool.imap(func, feed(), chunksize):
+            pending.release()
+            yield result
+    finally:
+        # when the results are not consumed any more (e.g. a worker failed), the thread of the pool that reads the
+        # input must not stay blocked, or pool.terminate() waits for it forever
+        stopped.set()
+        pending.release()
+
+
 def build_mappings(file_path_from, file_path_to, column=None, dem='\t'):
     mapping = {}
 
@@ -90,3 +202,474 @@ def check_lengths(file_path_from, file_path_to, throw=True):
                             {0}: {1}, {2}: {3}".format(file_path_from, f1_lines, file_path_to, f2_lines))
 
     return f1_lines == f2_lines
+
+
+DOCUMENT_INDEX_SUFFIX = ".idx"
+DOCUMENT_INDEX_MAGIC = b"BTXIDX1\n"
+
+
+FRAMED_MAGIC = b"\x00BTXF"
+FRAMED_FIELD_COUNT = struct.Struct("<B")
+FRAMED_FIELD_LENGTH = struct.Struct("<I")
+
+
+# Framed record format, used instead of one base64 line per document: a stream starts with FRAMED_MAGIC and
+# every record is the number of fields (1 byte) followed by the length (4 bytes, little endian) and the bytes of
+# every field. A record cannot have 0 fields, so the magic, which starts with a 0 byte, may appear again at any
+# record boundary and is skipped: framed streams can be concatenated and every block written by
+# FramedBlockXzWriter can be decoded on its own.
+
+def pack_record(fields):
+    """Bytes of a framed record. Fields can be bytes or str, which is written as UTF-8."""
+    if not 0 < len(fields) < 256:
+        raise ValueError("A framed record must have between 1 and 255 fields, not {0}".format(len(fields)))
+    parts = [FRAMED_FIELD_COUNT.pack(len(fields))]
+    for field in fields:
+        if isinstance(field, str):
+            field = field.encode("utf-8")
+        parts.append(FRAMED_FIELD_LENGTH.pack(len(field)))
+        parts.append(field)
+    return b"".join(parts)
+
+
+def unpack_records(data):
+    """Records of a framed buffer, as tuples of bytes."""
+    records = []
+    pos = 0
+    while pos < len(data):
+        n_fields = data[pos]
+        if n_fields == 0:
+            if data[pos:pos + len(FRAMED_MAGIC)] != FRAMED_MAGIC:
+                raise ValueError("Corrupted framed data at byte {0}".format(pos))
+            pos += len(FRAMED_MAGIC)
+            continue
+        pos += 1
+        fields = []
+        for _ in range(n_fields):
+            length, = FRAMED_FIELD_LENGTH.unpack_from(data, pos)
+            pos += FRAMED_FIELD_LENGTH.size
+            fields.append(data[pos:pos + length])
+            pos += length
+        records.append(tuple(fields))
+    return records
+
+
+def read_framed(stream):
+    """Yields the records of a binary stream in the framed format as tuples of bytes."""
+    read = stream.read
+    while True:
+        head = read(1)
+        if not head:
+            return
+        if head[0] == 0:
+            if read(len(FRAMED_MAGIC) - 1) != FRAMED_MAGIC[1:]:
+                raise ValueError("Corrupted framed stream")
+            continue
+        fields = []
+        for _ in range(head[0]):
+            length, = FRAMED_FIELD_LENGTH.unpack(read(FRAMED_FIELD_LENGTH.size))
+            fields.append(read(length))
+        yield tuple(fields)
+
+
+def is_framed_stream(stream):
+    """Whether a buffered binary stream (with peek()) is in the framed format, without consuming it."""
+    return stream.peek(len(FRAMED_MAGIC))[:len(FRAMED_MAGIC)] == FRAMED_MAGIC
+
+
+def read_records(stream):
+    """Records of a binary stream, which is either framed (tuples of bytes) or tab-separated lines (lists of
+    str without the newline)."""
+    if is_framed_stream(stream):
+        return read_framed(stream)
+    return (line.decode("utf-8").rstrip("\n").split("\t") for line in stream)
+
+
+@contextmanager
+def open_binary(file_path):
+    if file_path == "-":
+        yield sys.stdin.buffer
+        return
+    f = open_compressed(file_path, "rb")
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+def is_framed_file(file_path):
+    with open_binary(file_path) as f:
+        return is_framed_stream(f)
+
+
+@contextmanager
+def open_records(file_path):
+    """Iterator over the records of a framed or a tab-separated file (see read_records())."""
+    with open_binary(file_path) as f:
+        yield read_records(f)
+
+
+@contextmanager
+def open_documents(file_path):
+    """Iterator over the documents of a file with one document per record: the bytes of the document for framed
+    files, the line without its newline (e.g. base64) for the others."""
+    with open_binary(file_path) as f:
+        if is_framed_stream(f):
+            yield (record[0] for record in read_framed(f))
+        else:
+            yield (line.decode("utf-8").rstrip("\n") for line in f)
+
+
+def decode_document(document):
+    """Text of a document read from a framed file (bytes) or from a base64 line file (str)."""
+    if isinstance(document, bytes):
+        return document.decode("utf-8")
+    return base64.b64decode(document).decode("utf-8")
+
+
+def document_bytes(document):
+    """UTF-8 bytes of a document read from a framed file (bytes) or from a base64 line file (str)."""
+    if isinstance(document, bytes):
+        return document
+    return base64.b64decode(document)
+
+
+def encode_document(document):
+    """base64 line of a document, as written by the line format and read by external tools (strand-align -ib64)."""
+    if isinstance(document, bytes):
+        return base64.b64encode(document).decode()
+    return document
+
+
+class FramedWriter(object):
+    """Writes framed records to a binary stream (e.g. sys.stdout.buffer piped to xz)."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write(FRAMED_MAGIC)
+
+    def write(self, fields):
+        self.stream.write(pack_record(fields))
+
+    def flush(self):
+        self.stream.flush()
+
+
+class BackgroundCalls(object):
+    """Runs func(*args) in a thread for every put(*args), in order, with at most max_pending calls waiting; put()
+    blocks when the thread falls behind. An exception raised by func is raised again by the next put() or by
+    close(), and the calls that come after it are dropped."""
+
+    def __init__(self, func, max_pending=8):
+        self.func = func
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.aborted = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            args = self.queue.get()
+            if args is None:
+                return
+            if self.error is None and not self.aborted:
+                try:
+                    self.func(*args)
+                except BaseException as ex:
+                    self.error = ex
+
+    def put(self, *args):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(args)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """Stops the thread without running the calls that are still waiting."""
+        self.aborted = True
+        self.queue.put(None)
+        self.thread.join()
+
+
+class BackgroundWriter(object):
+    """Binary writer that hands what is written to a thread, in chunks of at least chunk_size bytes, which writes
+    it to file (e.g. an lzma file: the compression releases the GIL, so it runs while the caller goes on)."""
+
+    def __init__(self, file, chunk_size=1 << 16, max_pending=8):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffer_size = 0
+        self.calls = BackgroundCalls(file.write, max_pending)
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.calls.put(b"".join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+
+    def close(self):
+        self.flush()
+        self.calls.close()
+        self.file.close()
+
+    def abort(self):
+        self.calls.abort()
+        self.file.close()
+
+
+class WriterPool(object):
+    """Keeps at most max_open writers open, e.g. the output files of every language found in a crawl. get(key)
+    returns the writer of key, opened by opener(key, reopen), where reopen tells that the writer of key was
+    opened and closed before (so it has to append to what it wrote); the writer used least recently is closed
+    when there are too many. The writers must have close() and abort() methods."""
+
+    def __init__(self, opener, max_open=32):
+        self.opener = opener
+        self.max_open = max_open
+        self.writers = OrderedDict()
+        self.opened = []
+
+    def get(self, key):
+        writer = self.writers.get(key)
+        if writer is not None:
+            self.writers.move_to_end(key)
+            return writer
+        if len(self.writers) >= self.max_open:
+            self.writers.popitem(last=False)[1].close()
+        writer = self.opener(key, key in self.opened)
+        if key not in self.opened:
+            self.opened.append(key)
+        self.writers[key] = writer
+        return writer
+
+    def keys(self):
+        """Every key opened, in the order they were first opened."""
+        return list(self.opened)
+
+    def close(self):
+        while self.writers:
+            self.writers.popitem(last=False)[1].close()
+
+    def abort(self):
+        while self.writers:
+            self.writers.popitem(last=False)[1].abort()
+
+
+class BlockXzWriter(object):
+    """Line writer that compresses its output as a sequence of independent xz streams.
+
+    The result is a regular .xz file (xzcat and lzma.open read it as usual), and an index with the byte offset
+    and first line number of every block is written next to it (file_path + ".idx") when the writer is
+    closed. IndexedDocumentReader uses that index to fetch any line by decompressing a single block.
+    Every call to write() must receive exactly one line, including its trailing newline. With background, the
+    blocks are compressed and written by a thread (see BackgroundCalls), which gives the same file.
+    """
+
+    block_header = b""
+
+    def __init__(self, file_path, block_lines=64, block_bytes=1 << 20, preset=6, append=False, background=False):
+        self.file_path = file_path
+        self.block_lines = block_lines
+        self.block_bytes = block_bytes
+        self.preset = preset
+        self.index = array("Q")
+        self.block = []
+        self.block_size = 0
+        self.lines = 0
+        if append and os.path.exists(file_path):
+            self.open_for_append()
+        else:
+            self.file = open(file_path, "wb")
+        self.compressor = BackgroundCalls(self.write_block) if background else None
+
+    def open_for_append(self):
+        # new blocks go after the ones in the index; whatever a writer that was interrupted wrote after them is
+        # dropped, as it is not in the index
+        index = read_file_index(self.file_path, complete=False)
+        if index is not None:
+            end, self.lines = index[-2], index[-1]
+            self.index = index[:-2]
+        else:
+            # a file without index (e.g. written by other tools) becomes the first block
+            end = os.path.getsize(self.file_path)
+            with open_documents(self.file_path) as reader:
+                self.lines = sum(1 for _ in reader)
+            if self.lines:
+                self.index.extend((0, 0))
+        self.file = open(self.file_path, "r+b")
+        self.file.seek(end)
+        self.file.truncate()
+
+    def write(self, line):
+        self.block.append(line)
+        self.block_size += len(line)
+        if len(self.block) >= self.block_lines or self.block_size >= self.block_bytes:
+            self.flush_block()
+
+    def flush_block(self):
+        if not self.block:
+            return
+        data = self.block_header + b"".join(self.block)
+        if self.compressor:
+            self.compressor.put(data, self.lines)
+        else:
+            self.write_block(data, self.lines)
+        self.lines += len(self.block)
+        self.block = []
+        self.block_size = 0
+
+    def write_block(self, data, first_line):
+        self.index.extend((self.file.tell(), first_line))
+        self.file.write(lzma.compress(data, format=lzma.FORMAT_XZ, preset=self.preset))
+
+    def close(self):
+        self.flush_block()
+        if self.compressor:
+            self.compressor.close()
+        if self.file.tell() == 0:
+            # an empty file is not a valid .xz file, so write an empty stream instead
+            self.file.write(lzma.compress(self.block_header, format=lzma.FORMAT_XZ, preset=self.preset))
+        self.index.extend((self.file.tell(), self.lines))
+        self.file.close()
+        write_document_index(self.file_path + DOCUMENT_INDEX_SUFFIX, self.index)
+
+    def abort(self):
+        """Closes the file without writing the blocks that are left nor the index, as a writer that was
+        interrupted would have left it."""
+        if self.compressor:
+            self.compressor.abort()
+        self.file.close()
+
+
+class FramedBlockXzWriter(BlockXzWriter):
+    """BlockXzWriter for framed records: write() receives the fields of one record (see pack_record()), and every
+    block starts with FRAMED_MAGIC so that IndexedDocumentReader can decode it on its own."""
+
+    block_header = FRAMED_MAGIC
+
+    def write(self, fields):
+        BlockXzWriter.write(self, pack_record(fields))
+
+
+def write_document_index(index_path, index):
+    if sys.byteorder != "little":
+        index = array("Q", index)
+        index.byteswap()
+    with open(index_path, "wb") as f:
+        f.write(DOCUMENT_INDEX_MAGIC)
+        index.tofile(f)
+
+
+def read_document_index(index_path):
+    index = array("Q")
+    with open(index_path, "rb") as f:
+        if f.read(len(DOCUMENT_INDEX_MAGIC)) != DOCUMENT_INDEX_MAGIC:
+            raise Exception("{0} is not a document index".format(index_path))
+        index.frombytes(f.read())
+    if sys.byteorder != "little":
+        index.byteswap()
+    return index
+
+
+def read_file_index(file_path, index_path=None, complete=True):
+    """The index of a file written by BlockXzWriter, or None when there is no index or it is not the index of the
+    file as it is now (e.g. the file was recreated by another tool and the index was left behind): the end of its
+    last block must be the size of the file or, with complete=False, must not be beyond it (a writer that was
+    interrupted after appending blocks that are not in the index yet)."""
+    if index_path is None:
+        index_path = file_path + DOCUMENT_INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        return None
+    index = read_document_index(index_path)
+    size = os.path.getsize(file_path)
+    if len(index) < 2 or index[-2] > size or (complete and index[-2] != size):
+        return None
+    return index
+
+
+class IndexedDocumentReader(object):
+    """Random access to the lines (documents) of a file written by BlockXzWriter.
+
+    reader[n] returns the n-th line (0-based) without its newline, or the bytes of the n-th document of a framed
+    file. Only the block holding that line is decompressed, and the last few blocks are kept in memory since
+    consumers usually read nearby documents. Files without an index (e.g. written by other tools), or whose index
+    does not match the file any more, are read completely into memory instead.
+    """
+
+    def __init__(self, file_path, cached_blocks=4):
+        self.file_path = file_path
+        self.cached_blocks = cached_blocks
+        self.cache = OrderedDict()
+        index = read_file_index(file_path, os.path.realpath(file_path) + DOCUMENT_INDEX_SUFFIX)
+        if index is not None:
+            self.offsets = index[0::2]
+            self.first_lines = index[1::2]
+            self.file = open(file_path, "rb")
+            self.lines = None
+        else:
+            self.file = None
+            with open_documents(file_path) as reader:
+                self.lines = list(reader)
+
+    @staticmethod
+    def has_index(file_path):
+        return read_file_index(file_path, os.path.realpath(file_path) + DOCUMENT_INDEX_SUFFIX) is not None
+
+    def __len__(self):
+        if self.lines is not None:
+            return len(self.lines)
+        return self.first_lines[-1]
+
+    def __getitem__(self, n):
+        if self.lines is not None:
+            return self.lines[n]
+        if n < 0:
+            n += len(self)
+        if n < 0 or n >= len(self):
+            raise IndexError("document {0} out of range in {1}".format(n, self.file_path))
+        block = bisect.bisect_right(self.first_lines, n) - 1
+        return self.read_block(block)[n - self.first_lines[block]]
+
+    def read_block(self, block):
+        if block in self.cache:
+            self.cache.move_to_end(block)
+            return self.cache[block]
+        self.file.seek(self.offsets[block])
+        data = lzma.decompress(self.file.read(self.offsets[block + 1] - self.offsets[block]))
+        if data.startswith(FRAMED_MAGIC):
+            lines = [record[0] for record in unpack_records(data)]
+        else:
+            lines = data.decode("utf-8").split("\n")[:-1]
+        self.cache[block] = lines
+        if len(self.cache) > self.cached_blocks:
+            self.cache.popitem(last=False)
+        return lines
+
+    def get(self, n, default=""):
+        """1-based access, as used by the document indices of the aligners, with a default for missing lines."""
+        if n < 1 or n > len(self):
+            return default
+        return self[n - 1]
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
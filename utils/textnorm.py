@@ -0,0 +1,61 @@
+#  This file is part of Bitextor.
+#
+#  Bitextor is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Bitextor is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Bitextor.  If not, see <https://www.gnu.org/licenses/>.
+
+# Text normalization shared by the preprocessing and alignment scripts. The functions give the same results as the
+# regular expression chains and character loops they replace, with translate tables and fewer passes over the text.
+
+import re
+import string
+
+# NO-BREAK SPACE to space and CR removed, in one pass
+NBSP_CR = str.maketrans({"\xa0": " ", "\r": None})
+# deletes the characters counted by punct_digit_count()
+PUNCT_DIGITS = str.maketrans("", "", string.punctuation + string.digits)
+
+re_newlines = re.compile(r" *\n[ \n]*")
+re_spaces = re.compile(r"  +")
+re_tag_line = re.compile(r"^\s*\[(?:START|END):[^\]]+\]\s*$")
+
+
+def normalize_plaintext(text):
+    """The plain text of a document as written by warc2preprocess.py: NBSP as space, no CR, runs of spaces as one
+    space, no spaces around line breaks, no empty lines and no whitespace at the start or the end."""
+    return re_spaces.sub(" ", re_newlines.sub("\n", text.translate(NBSP_CR))).strip()
+
+
+def collapse_whitespace(text):
+    """Runs of whitespace (any Unicode whitespace, e.g. the ideographic space) as one space, stripped."""
+    return " ".join(text.split())
+
+
+def is_tag_line(line):
+    """Whether the line is a [START:tag] or [END:tag] marker of the strand parsers."""
+    return re_tag_line.match(line) is not None
+
+
+def text_chunks(text):
+    """The lines of a text without the tag markers, with their whitespace collapsed."""
+    return [collapse_whitespace(line) for line in text.split("\n") if not is_tag_line(line)]
+
+
+def punct_digit_count(text):
+    """Number of ASCII punctuation characters and digits in the text."""
+    return len(text) - len(text.translate(PUNCT_DIGITS))
+
+
+def drop_punctuation_lines(text):
+    """The lines of a text in which less than half of the characters are ASCII punctuation or digits, each followed
+    by a newline."""
+    return "".join(line + "\n" for line in text.split("\n") if punct_digit_count(line) < len(line) // 2)